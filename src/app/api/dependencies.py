@@ -1,14 +1,20 @@
 import asyncio
+import hashlib
+import json
 
 import jwt
 from clerk_backend_api import Clerk
 from clerk_backend_api.models import ClerkErrors, SDKError
 from fastapi import HTTPException, Request, Query, WebSocket, Depends
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from ..core.config import settings
+from ..core.db.database import async_get_db
 from ..core.logger import logging
+from ..core.utils import queue
+from ..crud.crud_users import crud_users
 
 logger = logging.getLogger(__name__)
 
@@ -93,6 +99,32 @@ async def get_current_user(request: Request, session_id: str = Query(...)):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+async def get_job_owner(
+    request: Request,
+    session_id: str = Query(...),
+    db: AsyncSession = Depends(async_get_db),
+) -> tuple[str, str | None]:
+    """Clerk user id and tier of the caller, whose jobs are scheduled fairly against
+    other users' jobs.
+
+    Authenticates like `get_current_user`, but remembers the owner of a session and
+    bearer token for `JOB_OWNER_CACHE_TTL` seconds, so repeated submits skip the Clerk
+    round-trips and the database.
+    """
+    credentials = f"{session_id}:{request.headers.get('Authorization', '')}"
+    key = f"job_owner:{hashlib.sha256(credentials.encode()).hexdigest()}"
+    cached = await queue.pool.get(key)
+    if cached is not None:
+        user_id, tier = json.loads(cached)
+        return user_id, tier
+
+    session, _ = await get_current_user(request, session_id)
+    user = await crud_users.get(db=db, user_id=session.user_id)
+    owner = (session.user_id, user["tier"] if user else None)
+    await queue.pool.set(key, json.dumps(owner), ex=settings.JOB_OWNER_CACHE_TTL)
+    return owner
+
+
 async def ws_get_current_user(websocket: WebSocket, session_id: str = Query(...)):
     if not session_id:
         await websocket.close(code=1008)
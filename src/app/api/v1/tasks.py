@@ -1,54 +1,442 @@
+import asyncio
+import contextlib
+import json
+import uuid
+from collections.abc import AsyncIterator
 from typing import Any
 
-from arq.jobs import Job as ArqJob
-from fastapi import APIRouter, Request, HTTPException
+from arq.constants import (
+    in_progress_key_prefix,
+    job_key_prefix,
+    result_key_prefix,
+)
+from arq.jobs import (
+    Job as ArqJob,
+    JobDef,
+    JobResult,
+    JobStatus,
+    ResultNotFound,
+    deserialize_job,
+    deserialize_result,
+)
+from arq.utils import timestamp_ms
+from fastapi import APIRouter, Depends, Query, Request, HTTPException
+from fastapi.responses import StreamingResponse
 
+from ..dependencies import get_job_owner
 from ...core.config import settings
-from ...core.utils import queue
+from ...core.utils import drafts, fairness, idempotency, llm_cache, queue, supersede
+from ...core.utils.events import job_channel, subscription
+from ...core.utils.lanes import BULK, INTERACTIVE, LANES, lane_stats
+from ...core.utils.model_registry import catalog, memory_reports
+from ...models.job import JobBatchRead, JobRead
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
 
+def _job_read(job_id: str, status: JobStatus, info: JobDef | None) -> JobRead:
+    job = JobRead(id=job_id, status=status.value)
+    if info is not None:
+        job.function = info.function
+        job.enqueue_time = info.enqueue_time
+    if isinstance(info, JobResult):
+        job.success = info.success
+        job.start_time = info.start_time
+        job.finish_time = info.finish_time
+        if info.success:
+            job.result = info.result
+        else:
+            job.error = str(info.result)
+    return job
+
+
+async def _job_reads(job_ids: list[str]) -> list[JobRead]:
+    """Status and result of many jobs from one pipelined Redis round-trip, whatever lane
+    they were queued in.
+    """
+    async with queue.pool.pipeline(transaction=False) as pipe:
+        for job_id in job_ids:
+            pipe.get(result_key_prefix + job_id)
+            pipe.get(job_key_prefix + job_id)
+            pipe.exists(in_progress_key_prefix + job_id)
+            for queue_name in LANES.values():
+                pipe.zscore(queue_name, job_id)
+        replies = await pipe.execute()
+
+    jobs = []
+    now = timestamp_ms()
+    width = 3 + len(LANES)
+    for i, job_id in enumerate(job_ids):
+        result, definition, in_progress, *scores = replies[width * i : width * (i + 1)]
+        score = next((score for score in scores if score is not None), None)
+        if result is not None:
+            status = JobStatus.complete
+            info = deserialize_result(result, deserializer=queue.pool.job_deserializer)
+        else:
+            if in_progress:
+                status = JobStatus.in_progress
+            elif score:
+                status = JobStatus.deferred if score > now else JobStatus.queued
+            else:
+                status = JobStatus.not_found
+            info = (
+                deserialize_job(definition, deserializer=queue.pool.job_deserializer)
+                if definition is not None
+                else None
+            )
+        jobs.append(_job_read(job_id, status, info))
+
+    # findings results reference a report draft version, fetch their texts in one more
+    # round-trip
+    for job, result in zip(
+        jobs, await drafts.with_texts(queue.pool, [job.result for job in jobs])
+    ):
+        job.result = result
+    return jobs
+
+
+async def _job_queue(job_id: str) -> str | None:
+    """The lane queue a job is queued or running in, None once it finished or if there
+    is no such job.
+    """
+    async with queue.pool.pipeline(transaction=False) as pipe:
+        for queue_name in LANES.values():
+            pipe.zscore(queue_name, job_id)
+        scores = await pipe.execute()
+    return next(
+        (name for name, score in zip(LANES.values(), scores) if score is not None), None
+    )
+
+
 @router.get("/task/{task_id}")
-async def get_task(task_id: str) -> dict[str, Any] | None:
+async def get_task(task_id: str, wait: float = Query(0, ge=0)) -> JobRead:
     """Get information about a specific background task.
 
     Parameters
     ----------
     task_id: str
         The ID of the task.
+    wait: float
+        Seconds to wait for the task to finish before answering, at most
+        `TASK_MAX_WAIT`. The default 0 answers at once.
 
     Returns
     -------
-    Optional[dict[str, Any]]
-        A dictionary containing information about the task if found, or None otherwise.
+    JobRead
+        The task's status, and its result or error once it finished.
+    """
+    queue_name = await _job_queue(task_id) if wait else None
+    if queue_name is not None:
+        job = ArqJob(
+            task_id,
+            queue.pool,
+            _queue_name=queue_name,
+            _deserializer=queue.pool.job_deserializer,
+        )
+        try:
+            await job.result(
+                timeout=min(wait, settings.TASK_MAX_WAIT),
+                poll_delay=settings.TASK_WAIT_POLL_DELAY,
+            )
+        except (asyncio.TimeoutError, queue.JobError, ResultNotFound):
+            # still running, the task failed and its error is part of the response, or
+            # it kept no result
+            pass
+        except asyncio.CancelledError:
+            # the task was aborted, unless it is this request that is being cancelled
+            if asyncio.current_task().cancelling():
+                raise
+
+    return (await _job_reads([task_id]))[0]
+
+
+@router.post("/batch")
+async def get_tasks(batch: JobBatchRead) -> list[JobRead]:
+    """Get the status and results of many background tasks in a single Redis round-trip.
+
+    Parameters
+    ----------
+    batch: JobBatchRead
+        The IDs of the tasks, at most `TASK_BATCH_MAX_IDS`.
+
+    Returns
+    -------
+    list[JobRead]
+        One entry per ID, in the order they were requested.
+    """
+    if len(batch.ids) > settings.TASK_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.TASK_BATCH_MAX_IDS} task ids per request.",
+        )
+
+    return await _job_reads(batch.ids)
+
+
+async def finished_job_event(task_id: str) -> dict[str, Any] | None:
+    """The `job_done` event of a job that already finished, for a client that subscribed
+    too late to get it, or with the status `not_found` for an unknown job or expired
+    result; None while the job is queued or running.
+
+    Jobs arq fails without running them (aborted before they started, expired, out of
+    tries) publish no event, so this is also how their subscribers learn that they
+    ended.
+    """
+    job = (await _job_reads([task_id]))[0]
+    if job.status == JobStatus.not_found.value:
+        return {
+            "event_type": "job_done",
+            "job_id": task_id,
+            "status": "not_found",
+            "error": "No such task, or its result expired.",
+        }
+    if job.status != JobStatus.complete.value:
+        return None
+    event = {"event_type": "job_done", "job_id": task_id, "function": job.function}
+    if job.success:
+        event.update(status="complete", result=job.result)
+    else:
+        event.update(status="failed", error=job.error)
+    return event
+
+
+async def _job_events(task_id: str) -> AsyncIterator[str]:
+    async with subscription(queue.pool, job_channel(task_id)) as events:
+        next_event = asyncio.ensure_future(anext(events))
+        try:
+            # the job may have finished before we subscribed
+            event = await finished_job_event(task_id)
+            while event is None:
+                done, _ = await asyncio.wait(
+                    {next_event}, timeout=settings.SSE_KEEPALIVE_INTERVAL
+                )
+                if not done:
+                    # keeps proxies from closing the stream; a job arq failed without
+                    # running it published nothing
+                    yield ": keepalive\n\n"
+                    event = await finished_job_event(task_id)
+                    continue
+
+                event = next_event.result()
+                if event["event_type"] != "job_done":
+                    yield f"event: {event['event_type']}\ndata: {json.dumps(event)}\n\n"
+                    event = None
+                    next_event = asyncio.ensure_future(anext(events))
+            yield f"event: job_done\ndata: {json.dumps(event)}\n\n"
+        finally:
+            next_event.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await next_event
+
+
+@router.get("/task/{task_id}/events")
+async def stream_task_events(task_id: str) -> StreamingResponse:
+    """Server-Sent Events of a background task: its `llm_token`/`llm_done` events if it
+    streams, and a final `job_done` event with its status and result, after which the
+    stream ends. `: keepalive` comments are sent every `SSE_KEEPALIVE_INTERVAL` seconds
+    while nothing happens.
+
+    Parameters
+    ----------
+    task_id: str
+        The ID of the task.
+    """
+    return StreamingResponse(
+        _job_events(task_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/drafts/{draft_id}")
+async def get_draft_history(
+    draft_id: str, owner: tuple[str, str | None] = Depends(get_job_owner)
+) -> dict[int, str]:
+    """Every kept version of one of the user's report drafts, oldest first: the reports
+    sent for editing and the edited reports.
+
+    Parameters
+    ----------
+    draft_id: str
+        The report session, `session_id` of the findings requests or their `audio_uuid`
+        if they had none.
+    """
+    user_id, _ = owner
+    return await drafts.history(queue.pool, drafts.user_draft_id(user_id, draft_id))
+
+
+@router.get("/lanes")
+async def get_lane_stats() -> dict[str, dict[str, float]]:
+    """Per priority lane: jobs queued, how long the oldest one waits, and the mean queue
+    wait of started jobs.
     """
-    job = ArqJob(task_id, queue.pool)
-    job_info: dict = await job.info()
-    return vars(job_info)
+    return await lane_stats(queue.pool)
 
 
-# {"updated_text": updated_text} for find
-#  {"audio_text": audio_text} for impre
+@router.get("/llm-cache/stats")
+async def get_llm_cache_stats() -> dict[str, int]:
+    """Hit, miss and eviction counters of the LLM edit cache, and its current number of
+    entries.
+    """
+    return await llm_cache.stats()
+
+
+@router.get("/whisper/models")
+async def get_whisper_models() -> dict[str, Any]:
+    """The whisper models workers can load, with their sizes, and the resident memory
+    each worker reports.
+    """
+    return {
+        "catalog": [
+            {
+                "name": variant.name,
+                "quantization": variant.quantization or "f16",
+                "size_bytes": variant.size_bytes,
+                "downloaded": variant.downloaded,
+            }
+            for variant in catalog(settings.WHISPER_MODELS_DIR or None)
+        ],
+        "workers": await memory_reports(queue.pool),
+    }
+
+
+async def _enqueue_once(
+    request: Request,
+    owner: tuple[str, str | None],
+    function: str,
+    supersede_key: str,
+    req_body: dict[str, Any],
+    audio_file: str,
+    *args: Any,
+    draft: tuple[str, str] | None = None,
+    **kwargs: Any,
+) -> str:
+    """Enqueue a findings/impressions job unless the request is a duplicate, and return
+    the id of its job.
+
+    A request repeating one of the last `IDEMPOTENCY_TTL` seconds, by `Idempotency-Key`
+    header or by payload and recording, gets the first request's job id, unless that job
+    failed or was aborted: the retry then runs again. A new job aborts the previous one
+    of the user's same report session (`supersede_key`, which the user id namespaces
+    since sessions are named by the client), see core/utils/supersede.py, and is
+    scheduled round-robin across users, see core/utils/fairness.py. `draft`, a draft id
+    and report text, is saved as a new draft version only for a new job, which gets the
+    draft id and version as its last arguments.
+    """
+    user_id, tier = owner
+    key = await idempotency.request_key(
+        user_id,
+        function,
+        req_body,
+        audio_file,
+        request.headers.get(idempotency.IDEMPOTENCY_HEADER),
+    )
+    job_id = uuid.uuid4().hex
+    existing = await idempotency.claim(queue.pool, key, job_id)
+    while existing is not None:
+        if (await _job_reads([existing]))[0].success is not False:
+            return existing
+        existing = await idempotency.reclaim(queue.pool, key, existing, job_id)
+
+    supersede_key = f"{user_id}:{supersede_key}"
+    try:
+        if draft is not None:
+            draft_id, text = draft
+            args = (*args, draft_id, await drafts.save(queue.pool, draft_id, text))
+        await supersede.supersede(queue.pool, supersede_key, job_id, LANES[INTERACTIVE])
+        await fairness.enqueue_job(
+            queue.pool,
+            function,
+            *args,
+            supersede_key=supersede_key,
+            user_id=user_id,
+            tier=tier,
+            lane=INTERACTIVE,
+            _job_id=job_id,
+            **kwargs,
+        )
+    except Exception:
+        await idempotency.forget(queue.pool, key)
+        raise
+    return job_id
+
+
+# job results are {"text": ..., "whisper_model": ...}, findings results also reference
+# the draft version holding the edited report ("draft_id", "draft_version"); send
+# "whisper_model" in the request body to pin a model
 
 
 @router.post("/transcribe-findings")
-async def transcribe_findings(request: Request):
+async def transcribe_findings(
+    request: Request, owner: tuple[str, str | None] = Depends(get_job_owner)
+):
     try:
         req_body = await request.json()
         audio_file = f"{settings.MEDIA_DIR_PATH}/{str(req_body['audio_uuid'])}.webm"
+        session_id = str(req_body.get("session_id", req_body["audio_uuid"]))
+        draft_id = drafts.user_draft_id(owner[0], session_id)
 
-        job = await queue.pool.enqueue_job("transcribe_findings", req_body, audio_file)
+        # the job carries a reference to the report instead of the report
+        job_body = {key: value for key, value in req_body.items() if key != "curr_text"}
 
-        return {"id": job.job_id}
+        job_id = await _enqueue_once(
+            request,
+            owner,
+            "transcribe_findings",
+            f"findings:{session_id}",
+            req_body,
+            audio_file,
+            job_body,
+            audio_file,
+            draft=(draft_id, req_body["curr_text"]),
+        )
+
+        return {"id": job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
 
 
 @router.post("/transcribe-impression")
-async def transcribe_impression(request: Request):
+async def transcribe_impression(
+    request: Request, owner: tuple[str, str | None] = Depends(get_job_owner)
+):
     req_body = await request.json()
     audio_file = f"{settings.MEDIA_DIR_PATH}/{str(req_body['audio_uuid'])}.webm"
 
-    job = await queue.pool.enqueue_job("transcribe_impressions", audio_file)
-    return {"id": job.job_id}
+    job_id = await _enqueue_once(
+        request,
+        owner,
+        "transcribe_impressions",
+        f"impressions:{req_body.get('session_id', req_body['audio_uuid'])}",
+        req_body,
+        audio_file,
+        audio_file,
+        stream=bool(req_body.get("stream", False)),
+        bypass_cache=bool(req_body.get("bypass_cache", False)),
+        whisper_model=req_body.get("whisper_model"),
+    )
+    return {"id": job_id}
+
+
+@router.post("/bulk/transcribe-impressions")
+async def bulk_transcribe_impressions(
+    request: Request, owner: tuple[str, str | None] = Depends(get_job_owner)
+) -> list[dict[str, str]]:
+    """Queue impressions transcriptions of many recordings, e.g. a backlog import, in
+    the bulk lane so they only use the capacity live dictation leaves free.
+    """
+    req_body = await request.json()
+    user_id, tier = owner
+    jobs = []
+    for audio_uuid in req_body["audio_uuids"]:
+        job = await fairness.enqueue_job(
+            queue.pool,
+            "transcribe_impressions",
+            f"{settings.MEDIA_DIR_PATH}/{str(audio_uuid)}.webm",
+            whisper_model=req_body.get("whisper_model"),
+            user_id=user_id,
+            tier=tier,
+            lane=BULK,
+        )
+        jobs.append({"id": job.job_id})
+    return jobs
@@ -1,41 +1,166 @@
-from types import NoneType
+import json
+import logging
 
-import aiofiles
 from fastapi import APIRouter, WebSocket, Depends
 from starlette.websockets import WebSocketDisconnect
 
 from ..dependencies import ws_get_current_user
-from ...core.ws_connection_manager import ConnectionManager
+from .tasks import finished_job_event
+from ...core.config import settings
+from ...core.exceptions.audio_exceptions import RecordingTooLargeError
+from ...core.live_transcriber import LiveTranscriber
+from ...core.utils import archive, queue, transcripts
+from ...core.utils.audio_spool import AudioSpool
+from ...core.utils.lanes import BULK, LANES
+from ...core.ws_connection_manager import manager
 
 router = APIRouter(tags=["ws"])
 
+logger = logging.getLogger(__name__)
+
+
+def _acknowledge(websocket: WebSocket):
+    async def ack(offset: int) -> None:
+        try:
+            await websocket.send_json({"event_type": "ack", "offset": offset})
+        except Exception:
+            # the connection is gone, the client resumes from the last ack it got
+            pass
+
+    return ack
+
 
 @router.websocket("/ws/{client_id}", dependencies=[Depends(ws_get_current_user)])
 async def websocket_endpoint(
     websocket: WebSocket,
     client_id: str,
+    live: bool = False,
+    resume: str | None = None,
+    framed: bool = False,
 ):
-    manager = ConnectionManager()
+    """Record a dictation streamed as binary frames into
+    `{MEDIA_DIR_PATH}/{audio_uuid}.webm`.
+
+    Received audio is buffered for up to `AUDIO_SPOOL_FLUSH_INTERVAL` seconds before it
+    is stored. When the radiologist stops dictating, the client sends the text message
+    `flush_recording` and must wait for the `{"event_type": "flushed", "offset": ...}`
+    answer before it requests a transcription, or the job may read the recording without
+    its last words.
+
+    Parameters
+    ----------
+    live: bool
+        Transcribe utterances while recording and send `partial_transcript` events.
+    resume: str | None
+        `audio_uuid` of a recording this client started on a dropped connection, to
+        continue it. The `audio_uuid` event says whether it was resumed, and the first
+        `ack` tells from which byte offset to send.
+    framed: bool
+        Binary frames start with the frame's byte offset in the recording (8 bytes,
+        big-endian). Frames the server already has are skipped; after a gap it answers
+        `{"event_type": "nack", "offset": ...}` and drops frames until the client sends
+        from that offset again. `ack` events report the bytes written to disk.
+    """
+    transcriber: LiveTranscriber | None = None
 
     try:
-        await manager.connect(websocket, client_id)
+        # workers push the job_done event of every job on this recording, no need to
+        # poll /tasks/task/{id}
+        resumed = await manager.connect(websocket, client_id, resume)
+
+        # live transcription needs the recording from its start, a resumed one is
+        # transcribed by the jobs
+        if live and settings.LIVE_TRANSCRIPTION_ENABLED and not resumed:
+            # transcribe utterances in the background while the radiologist speaks
+            transcriber = LiveTranscriber(manager.audio_uuids[client_id])
+            try:
+                await transcriber.start()
+            except Exception as e:
+                logger.warning(f"Live transcription unavailable: {e}")
+                transcriber = None
 
-        async with aiofiles.open(manager.recording_files[client_id], "wb") as out_file:
+        async with AudioSpool(
+            manager.recording_files[client_id],
+            append=resumed,
+            on_flush=_acknowledge(websocket),
+        ) as spool:
+            await websocket.send_json({"event_type": "ack", "offset": spool.written})
             while True:
                 # Receive message and detect its type
                 message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
 
-                if message.get("text") == "reset_recording":
-                    # TODO: copy file with timestamp as original to settings.MEDIA_AWS_DIR_PATH
+                text = message.get("text")
+                if text == "flush_recording":
+                    await spool.flush()
+                    await websocket.send_json(
+                        {"event_type": "flushed", "offset": spool.written}
+                    )
+                elif text == "reset_recording":
+                    # the finished take is renamed aside here and archived by a worker,
+                    # see core/utils/archive.py
+                    stage = (
+                        archive.staged_path(spool.path)
+                        if settings.ARCHIVE_ENABLED
+                        else None
+                    )
+                    if await spool.truncate(stage):
+                        await queue.pool.enqueue_job(
+                            "archive_recording", stage, _queue_name=LANES[BULK]
+                        )
+                    await transcripts.invalidate(
+                        queue.pool, manager.audio_uuids[client_id]
+                    )
+                    if transcriber is not None:
+                        await transcriber.reset()
+                elif text is not None:
+                    # {"event_type": "subscribe", "job_id": ...} streams the LLM tokens
+                    # of a job
+                    try:
+                        command = json.loads(text)
+                    except json.JSONDecodeError:
+                        continue
 
-                    # Reset the file pointer to prevent append to file
-                    await out_file.seek(0)
-                    await out_file.truncate(0)
-                else:
-                    if message.get("bytes") is not NoneType:
-                        await out_file.write(message.get("bytes"))
+                    if command.get("event_type") == "subscribe":
+                        job_id = str(command["job_id"])
+                        await manager.subscribe(client_id, job_id)
+                        # the job may have finished before the client subscribed; unless
+                        # its final event was routed here meanwhile, send the result now
+                        # instead of leaving the subscription open
+                        event = await finished_job_event(job_id)
+                        if event is not None and await manager.unsubscribe(
+                            client_id, job_id
+                        ):
+                            await websocket.send_json(event)
+                elif message.get("bytes") is not None:
+                    data = message.get("bytes")
+                    if framed:
+                        data = await spool.write_at(
+                            int.from_bytes(data[:8], "big"), data[8:]
+                        )
+                        if data is None:
+                            await websocket.send_json(
+                                {"event_type": "nack", "offset": spool.offset}
+                            )
+                            continue
+                    else:
+                        await spool.write(data)
+                    if transcriber is not None and data:
+                        try:
+                            await transcriber.feed(data)
+                        except Exception as e:
+                            logger.warning(f"Live transcription stopped: {e}")
+                            await transcriber.abort()
+                            transcriber = None
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        pass
+    except RecordingTooLargeError as e:
+        await websocket.close(code=1009, reason=e.message)
     except Exception as e:
         print(f"Error in websocket connection: {e}")
         await websocket.close(code=1000, reason="Server error")
+    finally:
+        await manager.disconnect(client_id, websocket)
+        if transcriber is not None:
+            await transcriber.close()
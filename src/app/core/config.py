@@ -73,6 +73,43 @@ class ClientSideCacheSettings(BaseSettings):
 class RedisQueueSettings(BaseSettings):
     REDIS_QUEUE_HOST: str = config("REDIS_QUEUE_HOST", default="localhost")
     REDIS_QUEUE_PORT: int = config("REDIS_QUEUE_PORT", default=6379)
+    WORKER_MAX_JOBS: int = config("WORKER_MAX_JOBS", default=10)
+    # part of WORKER_MAX_JOBS reserved for the bulk lane, the rest serves interactive
+    # edits
+    WORKER_BULK_JOBS: int = config("WORKER_BULK_JOBS", default=2)
+    LANE_BALANCE_INTERVAL: float = config("LANE_BALANCE_INTERVAL", default=0.5)
+    TASK_MAX_WAIT: float = config("TASK_MAX_WAIT", default=30)
+    TASK_WAIT_POLL_DELAY: float = config("TASK_WAIT_POLL_DELAY", default=0.1)
+    TASK_BATCH_MAX_IDS: int = config("TASK_BATCH_MAX_IDS", default=100)
+    # SSE comment sent while a task is quiet, below nginx's 60s proxy_read_timeout; each
+    # one rechecks the task
+    SSE_KEEPALIVE_INTERVAL: float = config("SSE_KEEPALIVE_INTERVAL", default=15)
+    # per-user fair scheduling: round-robin share and in-flight jobs per weight, by
+    # User.tier
+    FAIR_TIER_WEIGHTS: str = config("FAIR_TIER_WEIGHTS", default="free:1,paid:3")
+    FAIR_MAX_IN_FLIGHT: int = config("FAIR_MAX_IN_FLIGHT", default=2)
+    # jobs released to workers and not finished yet, per lane; keep it near the lane
+    # capacity so order stays fair
+    FAIR_DISPATCH_WINDOW: int = config("FAIR_DISPATCH_WINDOW", default=12)
+    # a job waiting for its turn runs anyway after this long
+    FAIR_PARK_SECONDS: int = config("FAIR_PARK_SECONDS", default=3600)
+    # in-flight slots of jobs whose worker died are freed after this long
+    FAIR_IN_FLIGHT_EXPIRY: int = config("FAIR_IN_FLIGHT_EXPIRY", default=600)
+    # how long the latest job of a report session is remembered for superseding it
+    SUPERSEDE_TTL: int = config("SUPERSEDE_TTL", default=3600)
+    # how long a repeated findings/impressions request returns the job of the first one
+    IDEMPOTENCY_TTL: int = config("IDEMPOTENCY_TTL", default=600)
+    # report drafts findings jobs read and write by reference
+    DRAFT_TTL: int = config("DRAFT_TTL", default=86400)
+    DRAFT_MAX_VERSIONS: int = config("DRAFT_MAX_VERSIONS", default=50)
+    # how long the user and tier behind a session are reused for job submits without
+    # asking Clerk again
+    JOB_OWNER_CACHE_TTL: int = config("JOB_OWNER_CACHE_TTL", default=60)
+    # websocket clients stay registered to their node this long after its last heartbeat
+    WS_PRESENCE_TTL: int = config("WS_PRESENCE_TTL", default=60)
+    # a websocket subscription to a job's events is dropped this long after it was made,
+    # if the job never ends
+    WS_SUBSCRIPTION_TTL: int = config("WS_SUBSCRIPTION_TTL", default=3600)
 
 
 class RedisRateLimiterSettings(BaseSettings):
@@ -88,6 +125,117 @@ class DefaultRateLimitSettings(BaseSettings):
     DEFAULT_RATE_LIMIT_PERIOD: int = config("DEFAULT_RATE_LIMIT_PERIOD", default=3600)
 
 
+class LLMSettings(BaseSettings):
+    LLM_ENDPOINT: str = config(
+        "LLM_ENDPOINT", default="http://127.0.0.1:11434/api/chat"
+    )
+    LLM_MODEL: str = config("LLM_MODEL", default="llama3.2:1b")
+    LLM_TIMEOUT: float = config("LLM_TIMEOUT", default=120.0)
+    LLM_CONNECT_TIMEOUT: float = config("LLM_CONNECT_TIMEOUT", default=5.0)
+    LLM_MAX_RETRIES: int = config("LLM_MAX_RETRIES", default=2)
+    LLM_RETRY_BACKOFF: float = config("LLM_RETRY_BACKOFF", default=0.5)
+    LLM_MAX_CONCURRENCY: int = config("LLM_MAX_CONCURRENCY", default=4)
+    LLM_MAX_CONNECTIONS: int = config("LLM_MAX_CONNECTIONS", default=10)
+    LLM_KEEPALIVE_EXPIRY: float = config("LLM_KEEPALIVE_EXPIRY", default=60.0)
+    LLM_KEEP_ALIVE: str = config("LLM_KEEP_ALIVE", default="30m")
+    LLM_SESSION_IDLE_TIMEOUT: float = config("LLM_SESSION_IDLE_TIMEOUT", default=900.0)
+    LLM_SESSION_MAX_SESSIONS: int = config("LLM_SESSION_MAX_SESSIONS", default=64)
+    LLM_SESSION_MAX_CHARS: int = config("LLM_SESSION_MAX_CHARS", default=24000)
+    LLM_CACHE_ENABLED: bool = config("LLM_CACHE_ENABLED", default=True)
+    LLM_CACHE_TTL: int = config("LLM_CACHE_TTL", default=3600)
+    LLM_CACHE_MAX_ENTRIES: int = config("LLM_CACHE_MAX_ENTRIES", default=10000)
+    LLM_LEXICON_FAST_PATH: bool = config("LLM_LEXICON_FAST_PATH", default=True)
+    LLM_LEXICON_MIN_CONFIDENCE: float = config(
+        "LLM_LEXICON_MIN_CONFIDENCE", default=0.9
+    )
+    LLM_SECTION_PATCHING: bool = config("LLM_SECTION_PATCHING", default=True)
+    LLM_SECTION_MAX_FRACTION: float = config("LLM_SECTION_MAX_FRACTION", default=0.5)
+
+
+class AudioSettings(BaseSettings):
+    FFMPEG_PATH: str = config("FFMPEG_PATH", default="ffmpeg")
+    LIVE_TRANSCRIPTION_ENABLED: bool = config(
+        "LIVE_TRANSCRIPTION_ENABLED", default=True
+    )
+    LIVE_SEGMENT_TTL: int = config("LIVE_SEGMENT_TTL", default=3600)
+    AUDIO_PCM_CACHE_MB: int = config("AUDIO_PCM_CACHE_MB", default=256)
+    VAD_TRIM_ENABLED: bool = config("VAD_TRIM_ENABLED", default=True)
+    VAD_MAX_PAUSE_MS: int = config("VAD_MAX_PAUSE_MS", default=1000)
+    TRANSCRIPT_TTL: int = config("TRANSCRIPT_TTL", default=3600)
+    TRANSCRIPT_LOCK_TIMEOUT: int = config("TRANSCRIPT_LOCK_TIMEOUT", default=300)
+    TRANSCRIPT_POLL_INTERVAL: float = config("TRANSCRIPT_POLL_INTERVAL", default=0.2)
+    # websocket audio is written in batches: by size, or after the interval (how far the
+    # file may lag the client)
+    AUDIO_SPOOL_FLUSH_KB: int = config("AUDIO_SPOOL_FLUSH_KB", default=64)
+    AUDIO_SPOOL_FLUSH_INTERVAL: float = config(
+        "AUDIO_SPOOL_FLUSH_INTERVAL", default=0.25
+    )
+    # per connection, 0 for no limit; compressed dictation is a few KB/s
+    AUDIO_SPOOL_MAX_RATE_KB: int = config("AUDIO_SPOOL_MAX_RATE_KB", default=256)
+    # how long a client can reconnect with ?resume={audio_uuid} to continue a recording
+    RECORDING_RESUME_TTL: int = config("RECORDING_RESUME_TTL", default=86400)
+    # "file": recordings in MEDIA_DIR_PATH, shared with the workers; "redis": in Redis
+    # streams, see utils/audio_store.py
+    AUDIO_TRANSPORT: str = config("AUDIO_TRANSPORT", default="file")
+    # a stream expires this long after its last chunk, or after
+    # AUDIO_STREAM_CONSUMED_TTL once a worker has read it
+    AUDIO_STREAM_TTL: int = config("AUDIO_STREAM_TTL", default=86400)
+    AUDIO_STREAM_CONSUMED_TTL: int = config("AUDIO_STREAM_CONSUMED_TTL", default=3600)
+    AUDIO_STREAM_READ_COUNT: int = config("AUDIO_STREAM_READ_COUNT", default=64)
+    # a stream holds the whole recording in Redis memory; compressed dictation is well
+    # under 1 MB per minute
+    AUDIO_STREAM_MAX_MB: int = config("AUDIO_STREAM_MAX_MB", default=64)
+
+
+class ArchiveSettings(BaseSettings):
+    # recordings are archived when reset and when idle in MEDIA_DIR_PATH, see
+    # utils/archive.py
+    ARCHIVE_ENABLED: bool = config("ARCHIVE_ENABLED", default=True)
+    # "local": MEDIA_AWS_DIR_PATH; "s3": any S3-compatible bucket, credentials from the
+    # usual boto3 sources
+    ARCHIVE_BACKEND: str = config("ARCHIVE_BACKEND", default="local")
+    ARCHIVE_S3_BUCKET: str = config("ARCHIVE_S3_BUCKET", default="")
+    ARCHIVE_S3_PREFIX: str = config("ARCHIVE_S3_PREFIX", default="recordings/")
+    ARCHIVE_S3_ENDPOINT_URL: str = config("ARCHIVE_S3_ENDPOINT_URL", default="")
+    # gzip archived recordings; Opus is already compressed, so this mostly saves the
+    # WebM overhead
+    ARCHIVE_COMPRESS: bool = config("ARCHIVE_COMPRESS", default=False)
+    # recordings untouched this long are archived, oldest first beyond MEDIA_MAX_MB; 0
+    # for no limit
+    MEDIA_MAX_AGE: int = config("MEDIA_MAX_AGE", default=3600)
+    MEDIA_MAX_MB: int = config("MEDIA_MAX_MB", default=0)
+    # archived recordings older than this are deleted, oldest first beyond
+    # ARCHIVE_MAX_MB; 0 for no limit
+    ARCHIVE_MAX_AGE: int = config("ARCHIVE_MAX_AGE", default=0)
+    ARCHIVE_MAX_MB: int = config("ARCHIVE_MAX_MB", default=0)
+    MEDIA_SWEEP_INTERVAL_MINUTES: int = config(
+        "MEDIA_SWEEP_INTERVAL_MINUTES", default=10
+    )
+
+
+class WhisperSettings(BaseSettings):
+    # comma separated, from the fastest to the most accurate model
+    WHISPER_MODELS: str = config(
+        "WHISPER_MODELS", default="tiny.en-q8_0,base.en-q8_0,small.en-q5_1"
+    )
+    WHISPER_MODELS_DIR: str = config("WHISPER_MODELS_DIR", default="")
+    # resident memory all whisper instances of a worker may take, 0 for no limit; every
+    # model loads a full pool while all pools share one pool's worth of transcription
+    # slots, so extra models only buy choice, at a memory cost
+    WHISPER_MEMORY_BUDGET_MB: int = config("WHISPER_MEMORY_BUDGET_MB", default=1024)
+    # load only the fastest model at startup and the others once the queue is idle or a
+    # job pins them
+    WHISPER_LAZY_LOADING: bool = config("WHISPER_LAZY_LOADING", default=True)
+    # seconds a job may spend queued plus transcribing before the selector falls back to
+    # faster models
+    WHISPER_LATENCY_BUDGET: float = config("WHISPER_LATENCY_BUDGET", default=8.0)
+    # 0 derives the pool size and threads per instance from the CPU count and
+    # WORKER_MAX_JOBS
+    WHISPER_POOL_SIZE: int = config("WHISPER_POOL_SIZE", default=0)
+    WHISPER_THREADS: int = config("WHISPER_THREADS", default=0)
+    WHISPER_CHECKOUT_TIMEOUT: float = config("WHISPER_CHECKOUT_TIMEOUT", default=120)
+
+
 class EnvironmentOption(Enum):
     LOCAL = "local"
     STAGING = "staging"
@@ -131,6 +279,10 @@ class Settings(
     RedisRateLimiterSettings,
     DefaultRateLimitSettings,
     ClerkAuthSettings,
+    LLMSettings,
+    AudioSettings,
+    ArchiveSettings,
+    WhisperSettings,
     EnvironmentSettings,
 ):
     pass
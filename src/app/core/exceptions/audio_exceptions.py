@@ -0,0 +1,6 @@
+class RecordingTooLargeError(Exception):
+    def __init__(
+        self, message: str = "The recording is larger than the audio store accepts."
+    ) -> None:
+        self.message = message
+        super().__init__(self.message)
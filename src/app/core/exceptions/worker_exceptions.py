@@ -0,0 +1,29 @@
+class ModelPoolTimeoutError(Exception):
+    def __init__(self, message: str = "No whisper model became free in time.") -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class JobSupersededError(Exception):
+    def __init__(
+        self, message: str = "A newer job on the same session replaced this one."
+    ) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class DraftNotFoundError(Exception):
+    def __init__(
+        self, message: str = "The report draft expired before the job ran."
+    ) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class ReportEditError(Exception):
+    def __init__(
+        self,
+        message: str = "The LLM returned no edited report, the report is unchanged.",
+    ) -> None:
+        self.message = message
+        super().__init__(self.message)
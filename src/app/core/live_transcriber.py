@@ -0,0 +1,76 @@
+import numpy as np
+
+from .utils import queue
+from .utils.audio import StreamDecoder
+from .utils.lanes import INTERACTIVE, LANES
+from .utils.live_segments import new_generation
+from .utils.vad import Utterance, UtteranceSegmenter
+
+
+class LiveTranscriber:
+    """Transcribe a recording utterance by utterance while it is being streamed over the
+    websocket.
+
+    Incoming audio is decoded by a long-running ffmpeg process and cut into utterances
+    at pauses. Each utterance is queued as a `transcribe_utterance` job, whose text the
+    worker stores per recording and sends to the recording's client as a
+    `partial_transcript` event, see `ws_connection_manager.send_to_recording`. When the
+    findings or impressions job runs, only the audio after the last transcribed
+    utterance is left for whisper.
+
+    Parameters
+    ----------
+    audio_uuid: str
+        The recording the audio belongs to.
+    """
+
+    def __init__(self, audio_uuid: str) -> None:
+        self.audio_uuid = audio_uuid
+        self.generation = 0
+        self._seq = 0
+        self._segmenter = UtteranceSegmenter()
+        self._decoder = StreamDecoder(self._on_pcm)
+
+    async def start(self) -> None:
+        self.generation = await new_generation(queue.pool, self.audio_uuid)
+        await self._decoder.start()
+
+    async def feed(self, data: bytes) -> None:
+        await self._decoder.feed(data)
+
+    async def reset(self) -> None:
+        """Drop the current take and start decoding a new one from scratch."""
+        await self._decoder.abort()
+        self._seq = 0
+        self._segmenter = UtteranceSegmenter()
+        self._decoder = StreamDecoder(self._on_pcm)
+        await self.start()
+
+    async def close(self) -> None:
+        """Finish decoding and queue the last utterance."""
+        await self._decoder.close()
+        for utterance in self._segmenter.flush():
+            await self._enqueue(utterance)
+
+    async def abort(self) -> None:
+        """Stop transcribing live; utterances already queued are still used by the
+        findings/impressions jobs.
+        """
+        await self._decoder.abort()
+
+    async def _on_pcm(self, pcm: np.ndarray) -> None:
+        for utterance in self._segmenter.push(pcm):
+            await self._enqueue(utterance)
+
+    async def _enqueue(self, utterance: Utterance) -> None:
+        await queue.pool.enqueue_job(
+            "transcribe_utterance",
+            self.audio_uuid,
+            self.generation,
+            self._seq,
+            utterance.start,
+            utterance.end,
+            utterance.pcm.tobytes(),
+            _queue_name=LANES[INTERACTIVE],
+        )
+        self._seq += 1
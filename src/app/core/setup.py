@@ -27,7 +27,8 @@ from .config import (
     settings,
 )
 from .db.database import async_engine as engine
-from .utils import cache, queue
+from . import ws_connection_manager
+from .utils import audio_store, cache, queue
 from ..middleware.client_cache_middleware import ClientCacheMiddleware
 
 
@@ -51,8 +52,11 @@ async def close_redis_cache_pool() -> None:
 # -------------- queue --------------
 async def create_redis_queue_pool() -> None:
     queue.pool = await create_pool(
-        RedisSettings(host=settings.REDIS_QUEUE_HOST, port=settings.REDIS_QUEUE_PORT)
+        RedisSettings(host=settings.REDIS_QUEUE_HOST, port=settings.REDIS_QUEUE_PORT),
+        job_serializer=queue.job_serializer,
+        job_deserializer=queue.job_deserializer,
     )
+    audio_store.store = audio_store.create_store(queue.pool)
 
 
 async def close_redis_queue_pool() -> None:
@@ -92,6 +96,7 @@ def lifespan_factory(
 
         if isinstance(settings, RedisQueueSettings):
             await create_redis_queue_pool()
+            await ws_connection_manager.manager.start()
 
         # create media folder if it doesnt exist
         Path(settings.MEDIA_DIR_PATH).mkdir(exist_ok=True)
@@ -103,6 +108,7 @@ def lifespan_factory(
             await close_redis_cache_pool()
 
         if isinstance(settings, RedisQueueSettings):
+            await ws_connection_manager.manager.stop()
             await close_redis_queue_pool()
 
     return lifespan
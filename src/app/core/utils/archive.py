@@ -0,0 +1,212 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import aiofiles.os
+import boto3
+from redis.asyncio import Redis
+
+from . import audio_store
+from .audio_store import move_file
+from ..config import settings
+from ..ws_connection_manager import recording_owner_key
+
+logger = logging.getLogger(__name__)
+
+# Recordings leave MEDIA_DIR_PATH in two steps. On the request path a take is only
+# staged: renamed to `{audio_uuid}.{timestamp}.webm` next to it (or its Redis stream
+# renamed), which moves no bytes. An `archive_recording` job on the bulk lane then moves
+# it into MEDIA_AWS_DIR_PATH, with a rename where possible, compresses it if asked and
+# hands it to the archive backend. `sweep` runs on a cron and archives recordings nobody
+# uses any more, then applies the archive's retention limits. All blocking file work
+# runs in threads.
+
+
+_STAGED_FORMAT = "%Y%m%dT%H%M%S%fZ"
+
+
+def staged_path(path: str) -> str:
+    """Where a take of the recording at `path` is staged for archiving."""
+    timestamp = datetime.now(timezone.utc).strftime(_STAGED_FORMAT)
+    return str(
+        Path(path).with_name(f"{Path(path).stem}.{timestamp}{Path(path).suffix}")
+    )
+
+
+def _staged_at(path: str) -> float | None:
+    # audio_uuid.webm for recordings, audio_uuid.timestamp.webm for staged takes
+    _, _, timestamp = Path(path).stem.partition(".")
+    if not timestamp:
+        return None
+    return (
+        datetime.strptime(timestamp, _STAGED_FORMAT)
+        .replace(tzinfo=timezone.utc)
+        .timestamp()
+    )
+
+
+def _gzip(path: str) -> str:
+    with open(path, "rb") as source, gzip.open(f"{path}.gz", "wb") as target:
+        shutil.copyfileobj(source, target, 1 << 20)
+    os.unlink(path)
+    return f"{path}.gz"
+
+
+def _expired(
+    entries: list[tuple[str, float, int]], max_age: int, max_bytes: int
+) -> list[str]:
+    """Names of (name, mtime, size) entries older than `max_age` seconds, then of the
+    oldest beyond `max_bytes`.
+    """
+    now = time.time()
+    entries = sorted(entries, key=lambda entry: entry[1])
+    total = sum(size for _, _, size in entries)
+    expired = []
+    for name, mtime, size in entries:
+        if (max_age and now - mtime > max_age) or (max_bytes and total > max_bytes):
+            expired.append(name)
+            total -= size
+    return expired
+
+
+def _scan(directory: str) -> list[tuple[str, float, int]]:
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_mtime, stat.st_size))
+    return entries
+
+
+class LocalArchive:
+    """Archive recordings in a local directory, e.g. a mounted volume."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    async def put(self, path: str) -> str:
+        dest = os.path.join(self.directory, os.path.basename(path))
+        if os.path.abspath(dest) != os.path.abspath(path):
+            await asyncio.to_thread(move_file, path, dest)
+        return dest
+
+    async def sweep(self, max_age: int, max_bytes: int) -> int:
+        expired = _expired(
+            await asyncio.to_thread(_scan, self.directory), max_age, max_bytes
+        )
+        for path in expired:
+            await aiofiles.os.remove(path)
+        return len(expired)
+
+
+class S3Archive:
+    """Archive recordings in an S3-compatible bucket under `prefix`."""
+
+    def __init__(
+        self, bucket: str, prefix: str = "", endpoint_url: str | None = None
+    ) -> None:
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    async def put(self, path: str) -> str:
+        key = f"{self.prefix}{os.path.basename(path)}"
+        await asyncio.to_thread(self._client.upload_file, path, self.bucket, key)
+        await aiofiles.os.remove(path)
+        return f"s3://{self.bucket}/{key}"
+
+    def _list(self) -> list[tuple[str, float, int]]:
+        entries = []
+        for page in self._client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=self.prefix
+        ):
+            for obj in page.get("Contents", []):
+                entries.append(
+                    (obj["Key"], obj["LastModified"].timestamp(), obj["Size"])
+                )
+        return entries
+
+    async def sweep(self, max_age: int, max_bytes: int) -> int:
+        expired = _expired(await asyncio.to_thread(self._list), max_age, max_bytes)
+        for start in range(0, len(expired), 1000):
+            batch = [{"Key": key} for key in expired[start : start + 1000]]
+            await asyncio.to_thread(
+                self._client.delete_objects,
+                Bucket=self.bucket,
+                Delete={"Objects": batch},
+            )
+        return len(expired)
+
+
+def create_backend() -> LocalArchive | S3Archive:
+    """The backend `ARCHIVE_BACKEND` selects."""
+    if settings.ARCHIVE_BACKEND == "s3":
+        return S3Archive(
+            settings.ARCHIVE_S3_BUCKET,
+            settings.ARCHIVE_S3_PREFIX,
+            settings.ARCHIVE_S3_ENDPOINT_URL,
+        )
+    return LocalArchive(settings.MEDIA_AWS_DIR_PATH)
+
+
+# workers replace it on startup with `create_backend`
+backend: LocalArchive | S3Archive = LocalArchive(settings.MEDIA_AWS_DIR_PATH)
+
+
+async def archive(staged: str) -> str:
+    """Move a staged take out of the audio store into the archive and return where it is
+    archived.
+    """
+    await aiofiles.os.makedirs(settings.MEDIA_AWS_DIR_PATH, exist_ok=True)
+    local = os.path.join(settings.MEDIA_AWS_DIR_PATH, os.path.basename(staged))
+    await audio_store.store.take(staged, local)
+    if settings.ARCHIVE_COMPRESS:
+        local = await asyncio.to_thread(_gzip, local)
+    return await backend.put(local)
+
+
+async def sweep(redis: Redis) -> dict[str, int]:
+    """Archive idle recordings in MEDIA_DIR_PATH and delete archived ones past the
+    retention limits.
+
+    A recording is idle once untouched for `MEDIA_MAX_AGE` seconds, or when it is among
+    the oldest past `MEDIA_MAX_MB`, and its client can no longer resume it. Staged takes
+    whose archive job never ran are archived too.
+    """
+    archived = 0
+    entries = []
+    # with the "redis" transport recordings are streams, which expire by themselves
+    if settings.AUDIO_TRANSPORT == "file" and os.path.isdir(settings.MEDIA_DIR_PATH):
+        # a staged take ages from its staging, its archive job may still be queued
+        entries = [
+            (path, _staged_at(path) or mtime, size)
+            for path, mtime, size in await asyncio.to_thread(
+                _scan, settings.MEDIA_DIR_PATH
+            )
+            if path.endswith(".webm")
+        ]
+    for path in _expired(
+        entries, settings.MEDIA_MAX_AGE, settings.MEDIA_MAX_MB * 1024 * 1024
+    ):
+        if _staged_at(path) is None:
+            if await redis.exists(recording_owner_key(Path(path).stem)):
+                continue
+            staged = staged_path(path)
+            await aiofiles.os.rename(path, staged)
+            path = staged
+        try:
+            await archive(path)
+            archived += 1
+        except Exception as e:
+            logger.warning(f"Archiving {path} failed: {e}")
+
+    deleted = await backend.sweep(
+        settings.ARCHIVE_MAX_AGE, settings.ARCHIVE_MAX_MB * 1024 * 1024
+    )
+    return {"archived": archived, "deleted": deleted}
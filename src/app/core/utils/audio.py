@@ -0,0 +1,165 @@
+import asyncio
+import os
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+import numpy as np
+
+from ..config import settings
+
+SAMPLE_RATE = 16000  # whisper works on 16 kHz mono audio
+
+
+def _ffmpeg_args(source: str = "pipe:0", sample_format: str = "s16le") -> list[str]:
+    return [
+        settings.FFMPEG_PATH,
+        "-loglevel",
+        "error",
+        "-i",
+        source,
+        "-f",
+        sample_format,
+        "-ac",
+        "1",
+        "-ar",
+        str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+
+
+def pcm16_to_float32(pcm: np.ndarray) -> np.ndarray:
+    """Scale 16-bit PCM to the [-1, 1] float32 range whisper expects."""
+    return pcm.astype(np.float32) / 32768.0
+
+
+async def decode_audio_file(file_path: str) -> np.ndarray:
+    """Decode a recording (e.g. WebM/Opus) to the 16 kHz mono float32 PCM whisper
+    expects through an ffmpeg pipe.
+
+    ffmpeg resamples and converts to float32 in [-1, 1] itself, and its output is read
+    into a single buffer that the returned array views, so the samples are never copied
+    or converted again in Python.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *_ffmpeg_args(file_path, sample_format="f32le"),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    buffer = bytearray()
+    while chunk := await process.stdout.read(1 << 20):
+        buffer += chunk
+    stderr = await process.stderr.read()
+    if await process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {file_path}: {stderr.decode()}")
+
+    return np.frombuffer(buffer, dtype=np.float32, count=len(buffer) // 4)
+
+
+class PcmCache:
+    """Recently decoded recordings, so the findings and impressions jobs of a recording
+    decode it only once.
+
+    Entries are keyed by path, size and modification time, so a recording that grew or
+    was reset since is decoded again. The least recently used recordings are dropped
+    once the cache holds more than `max_bytes` of samples.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, int, int], np.ndarray] = OrderedDict()
+        self._bytes = 0
+
+    async def load(self, file_path: str) -> np.ndarray:
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        pcm = self._entries.get(key)
+        if pcm is not None:
+            self._entries.move_to_end(key)
+            return pcm
+
+        pcm = await decode_audio_file(file_path)
+        # an older decode of the same file is stale now
+        for stale in [k for k in self._entries if k[0] == key[0]]:
+            self._bytes -= self._entries.pop(stale).nbytes
+        if pcm.nbytes <= self.max_bytes:
+            self._entries[key] = pcm
+            self._bytes += pcm.nbytes
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1].nbytes
+        return pcm
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+pcm_cache: PcmCache | None = None
+
+
+async def load_audio(file_path: str) -> np.ndarray:
+    """Float32 PCM of a recording, from the worker's `pcm_cache` when it holds it."""
+    if pcm_cache is None:
+        return await decode_audio_file(file_path)
+    return await pcm_cache.load(file_path)
+
+
+class StreamDecoder:
+    """Incrementally decode a streamed recording with a long-running ffmpeg process.
+
+    Encoded chunks are written to ffmpeg's stdin as they arrive and the 16 kHz mono
+    16-bit PCM it produces is handed to `on_pcm` in arrival order.
+
+    Parameters
+    ----------
+    on_pcm: Callable[[np.ndarray], Awaitable[None]]
+        Coroutine receiving every decoded block of int16 samples.
+    """
+
+    def __init__(self, on_pcm: Callable[[np.ndarray], Awaitable[None]]) -> None:
+        self._on_pcm = on_pcm
+        self._process: asyncio.subprocess.Process | None = None
+        self._reader: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._process = await asyncio.create_subprocess_exec(
+            *_ffmpeg_args(),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        remainder = b""
+        while chunk := await self._process.stdout.read(65536):
+            chunk = remainder + chunk
+            usable = len(chunk) - len(chunk) % 2
+            remainder = chunk[usable:]
+            if usable:
+                await self._on_pcm(np.frombuffer(chunk[:usable], dtype=np.int16))
+
+    async def feed(self, data: bytes) -> None:
+        self._process.stdin.write(data)
+        await self._process.stdin.drain()
+
+    async def close(self) -> None:
+        """Signal the end of the stream and wait until every decoded sample has been
+        delivered.
+        """
+        if self._process is None:
+            return
+
+        self._process.stdin.close()
+        await self._reader
+        await self._process.wait()
+        self._process = None
+
+    async def abort(self) -> None:
+        """Stop decoding immediately, dropping anything not delivered yet."""
+        if self._process is None:
+            return
+
+        self._reader.cancel()
+        if self._process.returncode is None:
+            self._process.kill()
+        await self._process.wait()
+        self._process = None
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import time
+import weakref
+from collections.abc import Awaitable, Callable
+
+from . import audio_store
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AudioSpool:
+    """Write a recording streamed over the websocket to its audio store in a few large
+    writes instead of one per frame.
+
+    Frames are collected in memory and written out, in one thread-pool hop, once
+    `flush_bytes` are buffered or `flush_interval` seconds after the first unwritten
+    frame, so the stored recording is never more than that behind the client. While a
+    write is in progress a full buffer waits for it, which stops reading from the
+    websocket and lets TCP slow the client down; clients sending faster than `max_rate`
+    bytes per second are held back the same way.
+
+    Parameters
+    ----------
+    path: str
+        The recording, created or truncated in `audio_store.store` when the spool opens
+        unless `append` is set.
+    flush_bytes: int
+        Buffered bytes that trigger a write.
+    flush_interval: float
+        Seconds a frame may wait in memory.
+    max_rate: int
+        Bytes per second a client may send on average, 0 for no limit. Bursts of a
+        second's worth are allowed.
+    append: bool
+        Continue the recording already stored, e.g. after the client reconnected,
+        instead of starting over.
+    on_flush: Callable[[int], Awaitable[None]] | None
+        Called with the number of bytes stored after every write and reset, to
+        acknowledge them to the client.
+    """
+
+    # one spool per recording at a time: a resumed recording waits until the dropped
+    # connection's spool is closed
+    _files: "weakref.WeakValueDictionary[str, asyncio.Lock]" = (
+        weakref.WeakValueDictionary()
+    )
+
+    def __init__(
+        self,
+        path: str,
+        flush_bytes: int | None = None,
+        flush_interval: float | None = None,
+        max_rate: int | None = None,
+        append: bool = False,
+        on_flush: Callable[[int], Awaitable[None]] | None = None,
+    ) -> None:
+        self.path = path
+        self.append = append
+        self.on_flush = on_flush
+        self.flush_bytes = (
+            flush_bytes
+            if flush_bytes is not None
+            else settings.AUDIO_SPOOL_FLUSH_KB * 1024
+        )
+        self.flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else settings.AUDIO_SPOOL_FLUSH_INTERVAL
+        )
+        self.max_rate = (
+            max_rate
+            if max_rate is not None
+            else settings.AUDIO_SPOOL_MAX_RATE_KB * 1024
+        )
+        self.frames = 0
+        self.writes = 0
+        # bytes of the recording received so far, written or still buffered, and bytes
+        # stored
+        self.offset = 0
+        self.written = 0
+        self._buffer = bytearray()
+        self._received = 0
+        self._started = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+        self._sink = None
+
+    async def __aenter__(self) -> "AudioSpool":
+        self._file_lock = self._files.setdefault(
+            os.path.abspath(self.path), asyncio.Lock()
+        )
+        await self._file_lock.acquire()
+        try:
+            self._sink = await audio_store.store.open(self.path, self.append)
+            self.written = self.offset = await self._sink.size()
+        except BaseException:
+            self._file_lock.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def write_at(self, offset: int, data: bytes) -> bytes | None:
+        """Write a chunk the client numbered with its byte offset in the recording.
+
+        Returns the bytes that were new, without any the client sent again after missing
+        an acknowledgement, or None when the chunk starts past the end of the recording
+        because bytes before it were lost; the client must then send again from
+        `offset`.
+        """
+        if offset > self.offset:
+            return None
+        data = data[self.offset - offset :]
+        if data:
+            await self.write(data)
+        return data
+
+    async def write(self, data: bytes) -> None:
+        self.frames += 1
+        self.offset += len(data)
+        self._buffer += data
+        self._received += len(data)
+
+        if len(self._buffer) >= self.flush_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.flush_interval, self._flush_later
+            )
+
+        if self.max_rate:
+            ahead = self._received - self.max_rate * (
+                time.monotonic() - self._started + 1
+            )
+            if ahead > 0:
+                await asyncio.sleep(ahead / self.max_rate)
+
+    async def flush(self) -> None:
+        """Write out everything buffered; once it returns, every byte received so far is
+        in the store.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._buffer:
+                return
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            await self._sink.write(data)
+            self.writes += 1
+            self.written += len(data)
+            if self.on_flush is not None:
+                await self.on_flush(self.written)
+
+    async def truncate(self, stage: str | None = None) -> bool:
+        """Drop the recording, buffered and written, to start a new take under the same
+        `audio_uuid`.
+
+        With `stage`, the take is first completed with the buffered audio and moved to
+        that path (a rename, its bytes are not copied) for archiving. Returns whether a
+        take was staged, False when nothing had been recorded.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if stage is not None and self._buffer:
+                await self._sink.write(bytes(self._buffer))
+            self._buffer.clear()
+            staged = await self._sink.truncate(stage)
+            self.written = self.offset = 0
+            if self.on_flush is not None:
+                await self.on_flush(0)
+        return staged
+
+    async def close(self) -> None:
+        try:
+            await self.flush()
+            if self._flushes:
+                await asyncio.gather(*self._flushes, return_exceptions=True)
+        finally:
+            await self._sink.close()
+            self._file_lock.release()
+        logger.debug(f"{self.path}: {self.frames} frames in {self.writes} writes")
+
+    def _flush_later(self) -> None:
+        self._timer = None
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
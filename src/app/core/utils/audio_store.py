@@ -0,0 +1,258 @@
+import asyncio
+import errno
+import os
+import shutil
+from pathlib import Path
+
+import aiofiles
+import aiofiles.os
+import numpy as np
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from .audio import StreamDecoder, load_audio, pcm16_to_float32
+from ..config import settings
+from ..exceptions.audio_exceptions import RecordingTooLargeError
+
+# Where recordings live between the websocket that receives them and the worker that
+# transcribes them. Recordings are always named by their path,
+# `{MEDIA_DIR_PATH}/{audio_uuid}.webm`, whatever the transport.
+#
+# - "file": the API writes the file and workers read it, so both need the media
+# directory (the default) - "redis": the API appends the audio to the Redis stream
+# `audio:{audio_uuid}` and workers read it from there, so
+#   workers can run on other nodes without a shared filesystem
+
+
+def move_file(src: str, dst: str) -> None:
+    """Rename `src` to `dst`, or copy it in the kernel when they are on different
+    filesystems. Blocking.
+    """
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            while os.copy_file_range(source.fileno(), target.fileno(), 1 << 24):
+                pass
+        except (AttributeError, OSError):
+            # no copy_file_range on this platform or between these filesystems
+            source.seek(0)
+            target.seek(0)
+            target.truncate()
+            shutil.copyfileobj(source, target, 1 << 20)
+    os.unlink(src)
+
+
+class _FileSink:
+    def __init__(self, path: str, file) -> None:
+        self._path = path
+        self._file = file
+
+    @classmethod
+    async def open(cls, path: str, append: bool) -> "_FileSink":
+        # unbuffered, so every write reaches the file the worker reads
+        return cls(
+            path, await aiofiles.open(path, "ab" if append else "wb", buffering=0)
+        )
+
+    async def size(self) -> int:
+        return await self._file.tell()
+
+    async def write(self, data: bytes) -> None:
+        await self._file.write(data)
+
+    async def truncate(self, stage: str | None = None) -> bool:
+        if stage is None or not await self.size():
+            await self._file.seek(0)
+            await self._file.truncate(0)
+            return False
+        await self._file.close()
+        await aiofiles.os.rename(self._path, stage)
+        self._file = await aiofiles.open(self._path, "wb", buffering=0)
+        return True
+
+    async def close(self) -> None:
+        await self._file.close()
+
+
+class FileAudioStore:
+    """Recordings as files in the media directory the API and the workers share."""
+
+    async def open(self, path: str, append: bool = False) -> _FileSink:
+        return await _FileSink.open(path, append)
+
+    async def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    async def version(self, path: str) -> str:
+        """Version of the recording's content, from the file's size and modification
+        time.
+        """
+        stat = os.stat(path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    async def load(self, path: str) -> np.ndarray:
+        return await load_audio(path)
+
+    async def take(self, path: str, dest: str) -> None:
+        """Move the recording out of the store into the local file `dest`."""
+        await asyncio.to_thread(move_file, path, dest)
+
+
+def _stream_key(path: str) -> str:
+    return f"audio:{Path(path).stem}"
+
+
+class _StreamSink:
+    def __init__(self, redis: Redis, key: str, offset: int) -> None:
+        self._redis = redis
+        self._key = key
+        self._offset = offset
+
+    async def size(self) -> int:
+        return self._offset
+
+    async def write(self, data: bytes) -> None:
+        # the stream can't be trimmed, a worker needs the recording from its start
+        if self._offset + len(data) > settings.AUDIO_STREAM_MAX_MB * 1024 * 1024:
+            raise RecordingTooLargeError(
+                f"{self._key} would exceed AUDIO_STREAM_MAX_MB "
+                f"({settings.AUDIO_STREAM_MAX_MB} MB)."
+            )
+        self._offset += len(data)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            # "end" is the recording's length up to this chunk, a resumed upload
+            # continues from the last one
+            pipe.xadd(self._key, {"data": data, "end": self._offset})
+            pipe.expire(self._key, settings.AUDIO_STREAM_TTL)
+            await pipe.execute()
+
+    async def truncate(self, stage: str | None = None) -> bool:
+        self._offset = 0
+        if stage is not None:
+            try:
+                # keeps the stream's expiry, an archiver that never comes does not leak
+                # it
+                await self._redis.rename(self._key, _stream_key(stage))
+                return True
+            except ResponseError:
+                # nothing recorded yet
+                return False
+        await self._redis.delete(self._key)
+        return False
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisAudioStore:
+    """Recordings as Redis streams of the chunks the websocket received, one entry per
+    `AudioSpool` write.
+
+    `load` decodes a snapshot: the chunks up to the last one when it starts, read in
+    pages of `AUDIO_STREAM_READ_COUNT` chunks that are fed to ffmpeg one page at a time,
+    so decoding overlaps the transfer and the whole recording is never held in memory as
+    webm. It does not wait for audio that is still being dictated: a recording has no
+    end marker, a client can resume it at any time, so chunks appended later belong to
+    the next version (`version`) and a later job. A stream is capped at
+    `AUDIO_STREAM_MAX_MB`, writes beyond it raise `RecordingTooLargeError`; it can't be
+    trimmed instead, since a job needs the recording from its start. A stream expires
+    `AUDIO_STREAM_TTL` seconds after its last chunk, or `AUDIO_STREAM_CONSUMED_TTL`
+    seconds after a worker read it, unless more audio arrives; resetting the recording
+    deletes it.
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+
+    async def _last(self, path: str) -> tuple[bytes, dict[bytes, bytes]] | None:
+        entries = await self.redis.xrevrange(_stream_key(path), count=1)
+        return entries[0] if entries else None
+
+    async def open(self, path: str, append: bool = False) -> _StreamSink:
+        key = _stream_key(path)
+        last = await self._last(path) if append else None
+        if not append:
+            await self.redis.delete(key)
+        return _StreamSink(self.redis, key, int(last[1][b"end"]) if last else 0)
+
+    async def exists(self, path: str) -> bool:
+        return bool(await self.redis.exists(_stream_key(path)))
+
+    async def version(self, path: str) -> str:
+        """Version of the recording's content: its length and its last chunk's id."""
+        last = await self._last(path)
+        if last is None:
+            raise FileNotFoundError(path)
+        return f"{last[1][b'end'].decode()}:{last[0].decode()}"
+
+    async def load(self, path: str) -> np.ndarray:
+        """Decode the recording as it is now; chunks appended while it is read belong to
+        the next version.
+        """
+        key = _stream_key(path)
+        last = await self._last(path)
+        if last is None:
+            raise FileNotFoundError(path)
+
+        blocks: list[np.ndarray] = []
+
+        async def on_pcm(pcm: np.ndarray) -> None:
+            blocks.append(pcm)
+
+        decoder = StreamDecoder(on_pcm)
+        await decoder.start()
+        try:
+            start = "-"
+            while True:
+                entries = await self.redis.xrange(
+                    key, min=start, max=last[0], count=settings.AUDIO_STREAM_READ_COUNT
+                )
+                for _, fields in entries:
+                    await decoder.feed(fields[b"data"])
+                if not entries or entries[-1][0] == last[0]:
+                    break
+                start = b"(" + entries[-1][0]
+            await decoder.close()
+        except BaseException:
+            await decoder.abort()
+            raise
+
+        # consumed: let it go soon, unless the radiologist keeps dictating on it
+        if await self.redis.ttl(key) > settings.AUDIO_STREAM_CONSUMED_TTL:
+            await self.redis.expire(key, settings.AUDIO_STREAM_CONSUMED_TTL)
+        return (
+            pcm16_to_float32(np.concatenate(blocks))
+            if blocks
+            else np.zeros(0, dtype=np.float32)
+        )
+
+    async def take(self, path: str, dest: str) -> None:
+        """Write the recording to the local file `dest` and delete its stream."""
+        key = _stream_key(path)
+        if not await self.redis.exists(key):
+            raise FileNotFoundError(path)
+        async with aiofiles.open(dest, "wb") as f:
+            start = "-"
+            while entries := await self.redis.xrange(
+                key, min=start, count=settings.AUDIO_STREAM_READ_COUNT
+            ):
+                await f.write(b"".join(fields[b"data"] for _, fields in entries))
+                start = b"(" + entries[-1][0]
+        await self.redis.delete(key)
+
+
+def create_store(redis: Redis) -> FileAudioStore | RedisAudioStore:
+    """The store `AUDIO_TRANSPORT` selects, using `redis` for the "redis" transport."""
+    if settings.AUDIO_TRANSPORT == "redis":
+        return RedisAudioStore(redis)
+    return FileAudioStore()
+
+
+# the API and the workers replace it on startup with `create_store`
+store: FileAudioStore | RedisAudioStore = FileAudioStore()
@@ -0,0 +1,86 @@
+from typing import Any
+
+from redis.asyncio import Redis
+
+from ..config import settings
+
+# Report drafts: one hash per report session holding the text of every version and the
+# number of the latest one. Findings jobs carry a draft reference instead of the report,
+# and store the edited report as a new version.
+
+# save the text as a new version, unless it is the latest version already
+_SAVE = """
+local latest = tonumber(redis.call("hget", KEYS[1], "latest") or "0")
+if latest == 0 or redis.call("hget", KEYS[1], tostring(latest)) ~= ARGV[1] then
+    latest = latest + 1
+    redis.call("hset", KEYS[1], tostring(latest), ARGV[1], "latest", latest)
+    redis.call("hdel", KEYS[1], tostring(latest - tonumber(ARGV[3])))
+end
+redis.call("expire", KEYS[1], ARGV[2])
+return latest
+"""
+
+
+def user_draft_id(user_id: str, session_id: str) -> str:
+    """Draft id of a report session; session ids come from the client, the user keeps
+    them apart.
+    """
+    return f"{user_id}:{session_id}"
+
+
+def _draft_key(draft_id: str) -> str:
+    return f"draft:{draft_id}"
+
+
+async def save(redis: Redis, draft_id: str, text: str) -> int:
+    """Store a report text as the next version of a draft and return its version number.
+
+    Only the last `DRAFT_MAX_VERSIONS` versions are kept, and the draft is forgotten
+    `DRAFT_TTL` seconds after it was last saved.
+    """
+    return await redis.eval(
+        _SAVE,
+        1,
+        _draft_key(draft_id),
+        text,
+        settings.DRAFT_TTL,
+        settings.DRAFT_MAX_VERSIONS,
+    )
+
+
+async def load(redis: Redis, draft_id: str, version: int) -> str | None:
+    text = await redis.hget(_draft_key(draft_id), str(version))
+    return text.decode() if text is not None else None
+
+
+async def history(redis: Redis, draft_id: str) -> dict[int, str]:
+    """Every version of a draft still kept, oldest first."""
+    fields = await redis.hgetall(_draft_key(draft_id))
+    fields.pop(b"latest", None)
+    return {
+        int(version): text.decode()
+        for version, text in sorted(fields.items(), key=lambda f: int(f[0]))
+    }
+
+
+async def with_texts(redis: Redis, results: list[Any]) -> list[Any]:
+    """Job results with the text of the draft version they reference added as `text`, in
+    one round-trip.
+    """
+    refs = [
+        (i, result)
+        for i, result in enumerate(results)
+        if isinstance(result, dict) and "draft_id" in result and "text" not in result
+    ]
+    if not refs:
+        return results
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for _, result in refs:
+            pipe.hget(_draft_key(result["draft_id"]), str(result["draft_version"]))
+        texts = await pipe.execute()
+
+    results = list(results)
+    for (i, result), text in zip(refs, texts):
+        results[i] = {**result, "text": text.decode() if text is not None else None}
+    return results
@@ -0,0 +1,65 @@
+import json
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+from redis.asyncio import Redis
+
+
+def job_channel(job_id: str) -> str:
+    """Name of the pub/sub channel carrying live events for a background job."""
+    return f"job:{job_id}"
+
+
+async def publish(redis: Redis, channel: str, event: dict[str, Any]) -> None:
+    """Publish a JSON encoded event on a Redis pub/sub channel.
+
+    Parameters
+    ----------
+    redis: Redis
+        The Redis client to publish with. In workers this is `ctx["redis"]`, in the API
+        `queue.pool`.
+    channel: str
+        The channel name, see `job_channel`.
+    event: dict[str, Any]
+        The event payload. It must be JSON serializable and should carry an `event_type`
+        key.
+    """
+    await redis.publish(channel, json.dumps(event))
+
+
+@asynccontextmanager
+async def subscription(
+    redis: Redis, channel: str
+) -> AsyncIterator[AsyncIterator[dict[str, Any]]]:
+    """Subscribe to a Redis pub/sub channel and provide an iterator over its decoded
+    events.
+
+    Unlike `listen`, the subscription is active as soon as the context is entered, so a
+    caller can check for state published before it subscribed without missing events
+    sent in between. It is released when the context exits.
+    """
+    pubsub = redis.pubsub()
+    await pubsub.subscribe(channel)
+
+    async def events() -> AsyncIterator[dict[str, Any]]:
+        async for message in pubsub.listen():
+            if message["type"] == "message":
+                yield json.loads(message["data"])
+
+    try:
+        yield events()
+    finally:
+        await pubsub.unsubscribe(channel)
+        await pubsub.aclose()
+
+
+async def listen(redis: Redis, channel: str) -> AsyncIterator[dict[str, Any]]:
+    """Subscribe to a Redis pub/sub channel and yield the decoded events until the
+    caller stops iterating.
+
+    The subscription is released when the generator is closed or cancelled.
+    """
+    async with subscription(redis, channel) as events:
+        async for event in events:
+            yield event
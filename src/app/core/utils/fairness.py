@@ -0,0 +1,185 @@
+import time
+from datetime import timedelta
+from typing import Any
+
+from arq.connections import ArqRedis
+from arq.constants import abort_jobs_ss
+from arq.jobs import Job
+from redis.asyncio import Redis
+
+from .lanes import LANES
+from ..config import settings
+
+# Fair queuing on top of arq. A job is enqueued parked: deferred far enough into the
+# future that no worker picks it up, and listed under its user. The dispatcher releases
+# parked jobs by moving their score to now, going round-robin over the users with
+# deficit counters (DRR) so a user gets `weight` jobs per round, and never lets a user
+# have more than `weight * FAIR_MAX_IN_FLIGHT` jobs released and unfinished. A parked
+# job that is never released still runs once its deferral runs out.
+
+# Both scripts take KEYS: user ring, arq queue, pending list prefix, weights hash,
+# deficits hash, arq abort set
+
+# ARGV: user id, job id, weight, owner expiry (ms)
+_SUBMIT = """
+redis.call("rpush", KEYS[3] .. ARGV[1], ARGV[2])
+redis.call("hset", KEYS[4], ARGV[1], ARGV[3])
+if not redis.call("lpos", KEYS[1], ARGV[1]) then
+    redis.call("rpush", KEYS[1], ARGV[1])
+end
+redis.call("set", "fair:owner:" .. ARGV[2], ARGV[1], "PX", ARGV[4])
+"""
+
+# ARGV: now (ms), dispatch window, in-flight limit per weight, in-flight expiry (ms)
+_DISPATCH = """
+local now, window = tonumber(ARGV[1]), tonumber(ARGV[2])
+local per_weight, expiry = tonumber(ARGV[3]), tonumber(ARGV[4])
+local ready = redis.call("zcount", KEYS[2], "-inf", now)
+local released, blocked = 0, 0
+
+while ready < window do
+    local users = redis.call("llen", KEYS[1])
+    if users == 0 or blocked >= users then
+        break
+    end
+
+    local user = redis.call("lmove", KEYS[1], KEYS[1], "LEFT", "RIGHT")
+    local pending = KEYS[3] .. user
+    if redis.call("llen", pending) == 0 then
+        redis.call("lrem", KEYS[1], 0, user)
+        redis.call("hdel", KEYS[4], user)
+        redis.call("hdel", KEYS[5], user)
+    else
+        local in_flight = "fair:in_flight:" .. user
+        redis.call("zremrangebyscore", in_flight, "-inf", now - expiry)
+        local weight = tonumber(redis.call("hget", KEYS[4], user) or "1")
+        local running = redis.call("zcard", in_flight)
+        local sent = 0
+
+        if running < weight * per_weight then
+            local deficit = tonumber(redis.call("hget", KEYS[5], user) or "0") + weight
+            while deficit >= 1 and running < weight * per_weight and ready < window do
+                local job_id = redis.call("lpop", pending)
+                if not job_id then
+                    break
+                end
+                -- a job aborted while parked (superseded) stays queued until a worker
+                -- drops it, it never runs and must not take a slot; XX skips a job
+                -- that expired or already finished
+                if not redis.call("zscore", KEYS[6], job_id)
+                    and redis.call("zadd", KEYS[2], "XX", "CH", now, job_id) == 1 then
+                    redis.call("zadd", in_flight, now, job_id)
+                    redis.call("pexpire", in_flight, expiry)
+                    running, ready, deficit = running + 1, ready + 1, deficit - 1
+                    released, sent = released + 1, sent + 1
+                end
+            end
+            if redis.call("llen", pending) == 0 then
+                deficit = 0
+            end
+            redis.call("hset", KEYS[5], user, deficit)
+        end
+
+        if sent == 0 then
+            blocked = blocked + 1
+        else
+            blocked = 0
+        end
+    end
+end
+return released
+"""
+
+# only a dispatched job holds a slot; a parked one keeps its owner until the dispatcher
+# skips it
+_RELEASE = """
+local user = redis.call("get", "fair:owner:" .. ARGV[1])
+if user and redis.call("zrem", "fair:in_flight:" .. user, ARGV[1]) == 1 then
+    redis.call("del", "fair:owner:" .. ARGV[1])
+    return user
+end
+return false
+"""
+
+
+def _keys(lane: str) -> list[str]:
+    prefix = f"fair:{lane}"
+    return [
+        f"{prefix}:users",
+        LANES[lane],
+        f"{prefix}:pending:",
+        f"{prefix}:weights",
+        f"{prefix}:deficits",
+        abort_jobs_ss,
+    ]
+
+
+def tier_weight(tier: str | None) -> int:
+    """Share of the workers a user's tier gets relative to others, from
+    `FAIR_TIER_WEIGHTS` ("free:1,paid:3").
+    """
+    weights = dict(
+        item.split(":") for item in settings.FAIR_TIER_WEIGHTS.split(",") if item
+    )
+    return int(weights.get(tier or "free", 1))
+
+
+async def enqueue_job(
+    pool: ArqRedis,
+    function: str,
+    *args: Any,
+    user_id: str,
+    tier: str | None,
+    lane: str,
+    **kwargs: Any,
+) -> Job | None:
+    """`pool.enqueue_job` for a user's job, which then waits for its turn in the lane's
+    round-robin.
+    """
+    job = await pool.enqueue_job(
+        function,
+        *args,
+        _queue_name=LANES[lane],
+        _defer_by=timedelta(seconds=settings.FAIR_PARK_SECONDS),
+        **kwargs,
+    )
+    if job is None:
+        # an existing job with the same _job_id
+        return job
+
+    await pool.eval(
+        _SUBMIT,
+        6,
+        *_keys(lane),
+        user_id,
+        job.job_id,
+        tier_weight(tier),
+        settings.FAIR_PARK_SECONDS * 2000,
+    )
+    await dispatch(pool, lane)
+    return job
+
+
+async def dispatch(redis: Redis, lane: str) -> int:
+    """Release parked jobs of the lane in fair order until `FAIR_DISPATCH_WINDOW` jobs
+    are ready or running.
+
+    Safe to call from any API or worker node at any time: each call is a single atomic
+    script.
+    """
+    return await redis.eval(
+        _DISPATCH,
+        6,
+        *_keys(lane),
+        int(time.time() * 1000),
+        settings.FAIR_DISPATCH_WINDOW,
+        settings.FAIR_MAX_IN_FLIGHT,
+        settings.FAIR_IN_FLIGHT_EXPIRY * 1000,
+    )
+
+
+async def release(redis: Redis, job_id: str) -> bool:
+    """Free the in-flight slot of a finished job; False for a job that holds none: not
+    dispatched yet, already released, or not enqueued through `enqueue_job`.
+    """
+    return await redis.eval(_RELEASE, 0, job_id) is not None
@@ -0,0 +1,81 @@
+import hashlib
+import json
+from typing import Any
+
+from redis.asyncio import Redis
+
+from .transcripts import recording_version
+from ..config import settings
+
+# clients may send their own key; otherwise identical payloads on an unchanged recording
+# count as the same request
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+_CLAIM = """
+local existing = redis.call("get", KEYS[1])
+if existing then
+    return existing
+end
+redis.call("set", KEYS[1], ARGV[1], "EX", ARGV[2])
+return false
+"""
+
+# take over a claim whose job ended without a result, unless a concurrent retry already
+# did
+_RECLAIM = """
+local existing = redis.call("get", KEYS[1])
+if existing and existing ~= ARGV[1] then
+    return existing
+end
+redis.call("set", KEYS[1], ARGV[2], "EX", ARGV[3])
+return false
+"""
+
+
+async def request_key(
+    user_id: str,
+    function: str,
+    req_body: dict[str, Any],
+    audio_file: str,
+    client_key: str | None = None,
+) -> str:
+    """Redis key of a job request: the client's idempotency key, or a hash of the
+    payload and the recording version.
+
+    The recording version (its size and last change) is part of the hash so that a
+    radiologist who dictated more audio on the same report text still gets a new job.
+    """
+    if client_key is None:
+        try:
+            _, version = await recording_version(audio_file)
+        except FileNotFoundError:
+            version = ""
+        client_key = json.dumps([req_body, version], sort_keys=True, default=str)
+    digest = hashlib.sha256(client_key.encode()).hexdigest()
+    return f"idempotency:{user_id}:{function}:{digest}"
+
+
+async def claim(redis: Redis, key: str, job_id: str) -> str | None:
+    """Map a request to `job_id` for `IDEMPOTENCY_TTL` seconds, or return the job a
+    duplicate request maps to.
+    """
+    existing = await redis.eval(_CLAIM, 1, key, job_id, settings.IDEMPOTENCY_TTL)
+    return existing.decode() if existing else None
+
+
+async def reclaim(redis: Redis, key: str, dead_job_id: str, job_id: str) -> str | None:
+    """Map a request claimed by `dead_job_id`, a job that failed or was aborted, to
+    `job_id` so that a retry runs again.
+
+    Returns the job a concurrent retry mapped the request to in the meantime, like
+    `claim`.
+    """
+    existing = await redis.eval(
+        _RECLAIM, 1, key, dead_job_id, job_id, settings.IDEMPOTENCY_TTL
+    )
+    return existing.decode() if existing else None
+
+
+async def forget(redis: Redis, key: str) -> None:
+    """Drop a claim whose job could not be enqueued, so that a retry enqueues it."""
+    await redis.delete(key)
@@ -1,17 +1,62 @@
 import asyncio
+import functools
+import json
+from collections.abc import Awaitable, Callable
+from typing import Any
 
 import httpx
-import requests
+import numpy as np
 from fastapi import HTTPException
 
-llm_endpoint = "http://127.0.0.1:11434/api/chat"
-# llm_model = "phi4:latest"
-llm_model = "llama3.2:1b"
+from . import llm, llm_cache, llm_sessions
+from .sections import join_sections, plan_patch, split_sections
+from .whisper_pool import ModelSelector
+from ..config import settings
+from ..exceptions.cache_exceptions import MissingClientError
 
+# bump a version whenever its prompt changes so cached answers of the old prompt are not
+# reused
+FINDINGS_PROMPT_VERSION = "1"
+FINDINGS_SYSTEM_PROMPT = (
+    "You are a radiologists typing assistant. "
+    "You need to edit a new text against the previous provided one. Edit the "
+    "prev_diagnosis to accommodate what the new_diagnosis wants to add. "
+    "Maintain the structure of prev_diagnosis, just update the information from "
+    "new_diagnosis into prev_diagnosis. Provide the result in the exact same "
+    "format as the prev_diagnosis. If markdown characters \\n \\t are present return them as is."
+    "There might be transcription errors in new_diagnosis due to misunderstanding. "
+    "If words don't align with the context of radiology, edit them for what you see fit in context with the rest of the new_diagnosis."
+    "Remember: provide the result in the exact same format as the prev_diagnosis. Avoid duplication."
+)
 
-async def transcribe_audio_file(whisper_model, file_path: str) -> str:
+IMPRESSIONS_PROMPT_VERSION = "1"
+IMPRESSIONS_SYSTEM_PROMPT = (
+    "You are a radiologists typing assistant. "
+    "You need to edit some transcribed text. There might be some typos. "
+    "You need to modify the incoming_text in the context of radiology and update "
+    "the provided prompt. Return text in the same format as the incoming_text, "
+    "just edit it to take care of typos and conform to radiology domain. Avoid duplication."
+)
+
+
+async def transcribe_audio_file(
+    whisper: ModelSelector, model_name: str, media: np.ndarray
+) -> str:
+    """Transcribe 16 kHz mono float32 samples, e.g. from `audio.load_audio`, on a free
+    instance of `model_name`.
+    """
     try:
-        segments = await asyncio.to_thread(whisper_model.transcribe, file_path)
+        async with whisper.checkout(model_name) as whisper_model:
+            task = asyncio.ensure_future(
+                asyncio.to_thread(whisper_model.transcribe, media)
+            )
+            try:
+                segments = await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # the job was aborted but whisper.cpp can't be interrupted: keep the
+                # instance checked out until its thread is done with it
+                await asyncio.wait([task])
+                raise
 
         all_text = ""
         for segment in segments:
@@ -22,51 +67,231 @@ async def transcribe_audio_file(whisper_model, file_path: str) -> str:
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
 
 
-async def ollama_llm(prev_diagnosis: str, user_prompt: str) -> str | None:
-    data = {
-        "model": llm_model,
-        "messages": [
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+async def _post_chat(data: dict[str, Any]) -> dict[str, Any]:
+    """POST a chat request to the LLM endpoint through the shared worker client.
+
+    Requests are capped at `LLM_MAX_CONCURRENCY` in flight, and transport errors, 429s
+    and 5xx responses are retried with exponential backoff. The concurrency slot is
+    released while backing off.
+    """
+    if llm.client is None or llm.semaphore is None:
+        raise MissingClientError("LLM client is None.")
+
+    attempt = 0
+    while True:
+        try:
+            async with llm.semaphore:
+                response = await llm.client.post(settings.LLM_ENDPOINT, json=data)
+                response.raise_for_status()
+                return response.json()
+        except Exception as e:
+            if attempt >= settings.LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            await asyncio.sleep(settings.LLM_RETRY_BACKOFF * 2**attempt)
+            attempt += 1
+
+
+async def _stream_chat(
+    data: dict[str, Any], on_token: Callable[[str], Awaitable[None]]
+) -> str:
+    """POST a streaming chat request and hand every content chunk to `on_token` as it
+    arrives.
+
+    Ollama answers with one JSON object per line. The concatenated content is returned
+    once the stream reports `done`. Failures are only retried until the first chunk has
+    been forwarded, so a consumer never sees duplicated tokens.
+    """
+    if llm.client is None or llm.semaphore is None:
+        raise MissingClientError("LLM client is None.")
+
+    attempt = 0
+    while True:
+        content = ""
+        try:
+            async with llm.semaphore:
+                async with llm.client.stream(
+                    "POST", settings.LLM_ENDPOINT, json=data
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        token = chunk.get("message", {}).get("content", "")
+                        if token:
+                            content += token
+                            await on_token(token)
+                        if chunk.get("done"):
+                            break
+            return content
+        except Exception as e:
+            if content or attempt >= settings.LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            await asyncio.sleep(settings.LLM_RETRY_BACKOFF * 2**attempt)
+            attempt += 1
+
+
+async def _chat(
+    data: dict[str, Any], on_token: Callable[[str], Awaitable[None]] | None = None
+) -> str:
+    if on_token is None:
+        response = await _post_chat(data)
+        return response["message"]["content"]
+
+    return await _stream_chat({**data, "stream": True}, on_token)
+
+
+async def _cached_chat(
+    data: dict[str, Any],
+    key: str,
+    on_token: Callable[[str], Awaitable[None]] | None = None,
+    bypass_cache: bool = False,
+) -> str:
+    if not bypass_cache:
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            if on_token is not None:
+                await on_token(cached)
+            return cached
+
+    content = await _chat(data, on_token)
+    await llm_cache.set(key, content)
+    return content
+
+
+async def ollama_llm(
+    prev_diagnosis: str,
+    user_prompt: str,
+    on_token: Callable[[str], Awaitable[None]] | None = None,
+    bypass_cache: bool = False,
+    session_id: str | None = None,
+) -> str | None:
+    """Edit `prev_diagnosis` with the dictated `user_prompt`.
+
+    With a `session_id` the edit continues the session's conversation when
+    `prev_diagnosis` is the report it last
+    produced: only the new dictation is appended, so Ollama can reuse the evaluated
+    prompt prefix.
+    """
+    history = (
+        llm_sessions.store.history(session_id, prev_diagnosis)
+        if session_id and llm_sessions.store is not None
+        else None
+    )
+    opening = {
+        "role": "user",
+        "content": f"prev_diagnosis: {prev_diagnosis} \n\n new_diagnosis: {user_prompt}",
+    }
+    if history is not None:
+        messages = [
+            *history,
             {
-                "role": "system",
-                "content": "You are a radiologists typing assistant. "
-                "You need to edit a new text against the previous provided one. Edit the "
-                "prev_diagnosis to accommodate what the new_diagnosis wants to add. "
-                "Maintain the structure of prev_diagnosis, just update the information from "
-                "new_diagnosis into prev_diagnosis. Provide the result in the exact same "
-                "format as the prev_diagnosis. If markdown characters \\n \\t are present return them as is."
-                "There might be transcription errors in new_diagnosis due to misunderstanding. "
-                "If words don't align with the context of radiology, edit them for what you see fit in context with the rest of the new_diagnosis."
-                "Remember: provide the result in the exact same format as the prev_diagnosis. Avoid duplication.",
+                "role": "user",
+                "content": "Your previous answer is the prev_diagnosis. "
+                f"new_diagnosis: {user_prompt}",
             },
+        ]
+    else:
+        messages = [
             {
-                "role": "user",
-                "content": f"prev_diagnosis: {prev_diagnosis} \n\n new_diagnosis: {user_prompt}",
+                "role": "system",
+                "content": FINDINGS_SYSTEM_PROMPT,
             },
-        ],
+            opening,
+        ]
+
+    data = {
+        "model": settings.LLM_MODEL,
+        "messages": messages,
         "stream": False,
+        "keep_alive": settings.LLM_KEEP_ALIVE,
     }
 
+    key = llm_cache.cache_key(
+        "findings",
+        settings.LLM_MODEL,
+        FINDINGS_PROMPT_VERSION,
+        prev_diagnosis,
+        user_prompt,
+    )
     try:
-        response = requests.post(
-            llm_endpoint, headers={"Content-Type": "application/json"}, json=data
-        )
-        return response.json()["message"]["content"]
+        content = await _cached_chat(data, key, on_token, bypass_cache)
     except Exception as e:
         print(f"HTTP error: {e}")
         return None
 
+    if session_id and llm_sessions.store is not None:
+        llm_sessions.store.update(session_id, messages, content, opening)
+
+    return content
+
+
+async def edit_report(
+    prev_diagnosis: str,
+    user_prompt: str,
+    on_token: Callable[..., Awaitable[None]] | None = None,
+    bypass_cache: bool = False,
+    session_id: str | None = None,
+) -> str | None:
+    """Apply a dictation to a report, sending only the sections it touches to the LLM.
 
-async def llm_impressions_cleanup(user_prompt: str) -> str | None:
+    The report is split into its paragraph sections and the dictation is routed to the
+    sections naming the organs it mentions. Those sections are edited concurrently and
+    spliced back into the report. When the dictation cannot be placed, or touches more
+    than `LLM_SECTION_MAX_FRACTION` of the sections, the whole report is edited instead,
+    continuing the conversation of `session_id` where possible.
+
+    With streaming, `on_token` additionally receives the index of the section a token
+    belongs to as `section`.
+    """
+    sections = split_sections(prev_diagnosis)
+    plan = plan_patch(sections, user_prompt) if settings.LLM_SECTION_PATCHING else None
+    if plan is None or len(plan) > len(sections) * settings.LLM_SECTION_MAX_FRACTION:
+        return await ollama_llm(
+            prev_diagnosis,
+            user_prompt,
+            on_token=on_token,
+            bypass_cache=bypass_cache,
+            session_id=session_id,
+        )
+
+    edits = await asyncio.gather(
+        *(
+            ollama_llm(
+                sections[i].text,
+                excerpt,
+                on_token=functools.partial(on_token, section=i) if on_token else None,
+                bypass_cache=bypass_cache,
+            )
+            for i, excerpt in plan.items()
+        )
+    )
+    if any(edit is None for edit in edits):
+        return None
+
+    for i, edit in zip(plan, edits):
+        sections[i].text = edit.strip()
+
+    return join_sections(sections)
+
+
+async def llm_impressions_cleanup(
+    user_prompt: str,
+    on_token: Callable[[str], Awaitable[None]] | None = None,
+    bypass_cache: bool = False,
+) -> str | None:
     data = {
-        "model": llm_model,
+        "model": settings.LLM_MODEL,
         "messages": [
             {
                 "role": "system",
-                "content": "You are a radiologists typing assistant. "
-                "You need to edit some transcribed text. There might be some typos. "
-                "You need to modify the incoming_text in the context of radiology and update "
-                "the provided prompt. Return text in the same format as the incoming_text, "
-                "just edit it to take care of typos and conform to radiology domain. Avoid duplication.",
+                "content": IMPRESSIONS_SYSTEM_PROMPT,
             },
             {
                 "role": "user",
@@ -74,13 +299,14 @@ async def llm_impressions_cleanup(user_prompt: str) -> str | None:
             },
         ],
         "stream": False,
+        "keep_alive": settings.LLM_KEEP_ALIVE,
     }
 
+    key = llm_cache.cache_key(
+        "impressions", settings.LLM_MODEL, IMPRESSIONS_PROMPT_VERSION, user_prompt
+    )
     try:
-        response = requests.post(
-            llm_endpoint, headers={"Content-Type": "application/json"}, json=data
-        )
-        return response.json()["message"]["content"]
+        return await _cached_chat(data, key, on_token, bypass_cache)
     except Exception as e:
         print(f"HTTP error: {e}")
         return None
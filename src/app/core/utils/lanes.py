@@ -0,0 +1,98 @@
+from arq.constants import default_queue_name, in_progress_key_prefix
+from arq.utils import timestamp_ms
+from redis.asyncio import Redis
+
+# interactive edits keep arq's default queue, so a worker started with the plain arq CLI
+# still serves them
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = {
+    INTERACTIVE: default_queue_name,
+    BULK: f"{default_queue_name}:bulk",
+}
+
+# arq keeps a job in its queue until it finishes, and fair scheduling parks jobs there
+# deferred: only jobs that are due and not in progress are waiting for a worker. Per
+# queue: the waiting jobs and the score of the oldest one
+_WAITING = """
+local lanes = {}
+for _, queue_name in ipairs(KEYS) do
+    local waiting, oldest = 0, false
+    local due = redis.call("zrangebyscore", queue_name, "-inf", ARGV[1], "withscores")
+    for i = 1, #due, 2 do
+        if redis.call("exists", ARGV[2] .. due[i]) == 0 then
+            waiting = waiting + 1
+            oldest = oldest or due[i + 1]
+        end
+    end
+    table.insert(lanes, {waiting, oldest})
+end
+return lanes
+"""
+
+
+def _stats_key(lane: str) -> str:
+    return f"lane:{lane}:stats"
+
+
+async def record_wait(redis: Redis, lane: str, wait: float) -> None:
+    """Count a job that left the lane's queue after waiting `wait` seconds."""
+    key = _stats_key(lane)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hincrby(key, "jobs", 1)
+        pipe.hincrbyfloat(key, "wait_total", wait)
+        await pipe.execute()
+
+
+async def _waiting(redis: Redis, now: int) -> dict[str, tuple[int, float | None]]:
+    lanes = await redis.eval(
+        _WAITING, len(LANES), *LANES.values(), now, in_progress_key_prefix
+    )
+    return {
+        lane: (waiting, float(oldest) if oldest else None)
+        for lane, (waiting, oldest) in zip(LANES, lanes)
+    }
+
+
+async def lane_backlog(redis: Redis) -> dict[str, int]:
+    """Jobs per lane that are due and not started yet: running jobs and jobs parked by
+    fair scheduling don't count.
+    """
+    # arq's rounded clock, so a job enqueued within the same millisecond counts as due
+    return {
+        lane: waiting
+        for lane, (waiting, _) in (await _waiting(redis, timestamp_ms())).items()
+    }
+
+
+async def waiting_jobs(redis: Redis) -> int:
+    """Jobs of all lanes that are due and not started yet; a running job, such as the
+    caller's own, is not counted.
+    """
+    return sum((await lane_backlog(redis)).values())
+
+
+async def lane_stats(redis: Redis) -> dict[str, dict[str, float]]:
+    """Queue depth and age of the oldest waiting job, as `lane_backlog` counts them, and
+    the mean queue wait of the started jobs, per lane.
+    """
+    now = timestamp_ms()
+    waiting = await _waiting(redis, now)
+    async with redis.pipeline(transaction=False) as pipe:
+        for lane in LANES:
+            pipe.hgetall(_stats_key(lane))
+        replies = await pipe.execute()
+
+    stats = {}
+    for lane, counters in zip(LANES, replies):
+        depth, oldest = waiting[lane]
+        jobs = int(counters.get(b"jobs", 0))
+        stats[lane] = {
+            "depth": depth,
+            "oldest_wait": max(0.0, (now - oldest) / 1000)
+            if oldest is not None
+            else 0.0,
+            "jobs": jobs,
+            "mean_wait": float(counters.get(b"wait_total", 0)) / jobs if jobs else 0.0,
+        }
+    return stats
@@ -0,0 +1,181 @@
+import json
+import re
+from collections import Counter
+from functools import lru_cache
+
+from ..config import settings
+
+_TOKEN = re.compile(r"[A-Za-z]+(?:'[a-z]+)?|[^A-Za-z]+")
+
+# radiology vocabulary that the findings templates do not spell out (they only describe
+# normal studies)
+RADIOLOGY_TERMS = """
+    abscess adenopathy adrenal aneurysm angiomyolipoma anterolisthesis appendicitis
+    atelectasis atheromatous atrophy benign bronchiectasis bulky calculi calculus
+    cardiomegaly cholecystitis choledocholithiasis cholelithiasis cirrhosis collapse
+    consolidation contusion cyst cystic cysts degenerative diverticulitis diverticulosis
+    echogenic echotexture edema edematous effusions emphysema enlarged enlargement fatty
+    fibroid fibroids fibrosis fracture fractures gallstone gallstones granuloma
+    granulomas haemorrhage hemangioma hemorrhage hepatomegaly hernia hydronephrosis
+    hydroureter hydroureteronephrosis hyperdense hyperechoic hyperintense hypertrophy
+    hypodense hypoechoic hypointense impression infarct infarction infiltration
+    inflammation inflammatory ischaemic ischemic kidney lipoma lobe lymph
+    lymphadenopathy malignancy mass masses metastases metastasis metastatic mild mildly
+    moderate moderately multiple necrosis neoplasm neoplastic nephrolithiasis nodular
+    nodule nodules obstruction opacities opacity osteophytes osteoporosis ovary
+    pancreatitis pleural pneumonia pneumothorax polyp polyps prominent pyelonephritis
+    retrolisthesis sclerosis segment severe simple sinusitis splenomegaly
+    spondylolisthesis spondylosis stone stones study subcentimetric suggestive thickened
+    tumor tumour ureter ureteric ureterolithiasis
+    """.split()
+
+# everyday words dictated around findings that must never be "corrected" into medical
+# terms
+COMMON_WORDS = """
+    a about above after again against also an and any approximately are as at be been
+    before below between both but by can clinical cm consistent correlation could did
+    differential does due each either evidence features few findings follow for from
+    further grade has have having here how if in into is it its likely may measuring mm
+    more most new no nor not noted now of on one only or other otherwise over possible
+    possibly probably rule same seen should side sided since small so some such suggest
+    suggested suggests than that the their there these they this those three through to
+    two up upon very was well were what when where which while with within without would
+    """.split()
+
+
+def _damerau_levenshtein(a: str, b: str) -> int:
+    previous_previous: list[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word: str, distance: int) -> set[str]:
+    deletes = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1 :] for w in frontier for i in range(len(w))}
+        deletes |= frontier
+    return deletes
+
+
+class Lexicon:
+    """A word list with a SymSpell style symmetric-delete index for fast fuzzy lookup.
+
+    Every word is indexed under all strings obtained by deleting up to `max_distance`
+    characters from it. A lookup generates the same deletes for the query, so candidates
+    are found with a handful of dictionary hits instead of a scan, and only those
+    candidates are scored with the real edit distance.
+    """
+
+    def __init__(self, frequencies: Counter, max_distance: int = 2) -> None:
+        self.frequencies = frequencies
+        self.max_distance = max_distance
+        self._index: dict[str, set[str]] = {}
+        for word in frequencies:
+            for delete in _deletes(word, max_distance):
+                self._index.setdefault(delete, set()).add(word)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.frequencies
+
+    def lookup(self, word: str) -> tuple[list[str], int]:
+        """Return the closest words and their edit distance, or `([], max_distance + 1)`
+        when none is close.
+        """
+        candidates: set[str] = set()
+        for delete in _deletes(word, self.max_distance):
+            candidates |= self._index.get(delete, set())
+
+        best: list[str] = []
+        best_distance = self.max_distance + 1
+        for candidate in candidates:
+            distance = _damerau_levenshtein(word, candidate)
+            if distance < best_distance:
+                best, best_distance = [candidate], distance
+            elif distance == best_distance:
+                best.append(candidate)
+
+        best.sort(key=lambda candidate: -self.frequencies[candidate])
+        return best, best_distance
+
+
+@lru_cache
+def radiology_lexicon() -> Lexicon:
+    """Lexicon of the words used in the common findings templates plus the curated
+    radiology and common words.
+    """
+    with open(settings.COMMON_TEMPLATE_PATH) as f:
+        templates = json.load(f)
+
+    frequencies: Counter = Counter()
+    for organs in templates.values():
+        for template in organs.values():
+            if isinstance(template, str):
+                frequencies.update(re.findall(r"[a-z]{2,}", template.lower()))
+
+    frequencies.update(RADIOLOGY_TERMS)
+    frequencies.update(COMMON_WORDS)
+    return Lexicon(frequencies)
+
+
+def _confidence(word: str, candidates: list[str], distance: int) -> float:
+    if distance == 0:
+        return 1.0
+    if not candidates or len(word) <= 3:
+        # short unknown words are too ambiguous to fix by spelling alone
+        return 0.0
+    if len(candidates) > 1:
+        return 0.5
+    return 0.9 if distance == 1 else 0.6
+
+
+def correct_text(text: str, lexicon: Lexicon | None = None) -> tuple[str, float]:
+    """Fix likely misrecognitions in a transcript using the radiology lexicon.
+
+    An unknown word is replaced when exactly one lexicon word is a single edit away,
+    keeping the original capitalisation. Anything less certain is left for the LLM;
+    spacing, punctuation and numbers are kept as they are.
+
+    Returns
+    -------
+    tuple[str, float]
+        The corrected text and the confidence of the least certain word, from 0 to 1.
+        A text made only of known words has confidence 1.
+    """
+    lexicon = lexicon or radiology_lexicon()
+
+    corrected = []
+    confidence = 1.0
+    for token in _TOKEN.findall(text):
+        if not token[0].isalpha():
+            corrected.append(token)
+            continue
+
+        word = token.lower()
+        if word in lexicon:
+            corrected.append(token)
+            continue
+
+        candidates, distance = lexicon.lookup(word)
+        confidence = min(confidence, _confidence(word, candidates, distance))
+        if len(candidates) == 1 and distance == 1 and len(word) > 3:
+            replacement = candidates[0]
+            if token.isupper():
+                replacement = replacement.upper()
+            elif token[0].isupper():
+                replacement = replacement.capitalize()
+            corrected.append(replacement)
+        else:
+            corrected.append(token)
+
+    return "".join(corrected), confidence
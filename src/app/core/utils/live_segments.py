@@ -0,0 +1,71 @@
+import json
+
+from redis.asyncio import Redis
+
+from ..config import settings
+
+
+def _generation_key(audio_uuid: str) -> str:
+    return f"live:{audio_uuid}:generation"
+
+
+def _segments_key(audio_uuid: str, generation: int) -> str:
+    return f"live:{audio_uuid}:{generation}:segments"
+
+
+async def new_generation(redis: Redis, audio_uuid: str) -> int:
+    """Start a new take of a recording, e.g. after `reset_recording`, so late segments
+    of the old one are ignored.
+    """
+    generation = await redis.incr(_generation_key(audio_uuid))
+    await redis.expire(_generation_key(audio_uuid), settings.LIVE_SEGMENT_TTL)
+    return generation
+
+
+async def is_current(redis: Redis, audio_uuid: str, generation: int) -> bool:
+    """Whether `generation` is still the recording's take, i.e. no reset happened after
+    it started.
+    """
+    current = await redis.get(_generation_key(audio_uuid))
+    return current is not None and int(current) == generation
+
+
+async def store_segment(
+    redis: Redis,
+    audio_uuid: str,
+    generation: int,
+    seq: int,
+    start: int,
+    end: int,
+    text: str,
+) -> None:
+    key = _segments_key(audio_uuid, generation)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(key, str(seq), json.dumps({"start": start, "end": end, "text": text}))
+        pipe.expire(key, settings.LIVE_SEGMENT_TTL)
+        await pipe.execute()
+
+
+async def transcribed_prefix(redis: Redis, audio_uuid: str) -> tuple[str, int]:
+    """Text of the utterances already transcribed during recording, and the sample
+    offset it covers.
+
+    Only the run of consecutive utterances from the first one counts, so everything
+    after the returned offset still has to be transcribed. Returns `("", 0)` when the
+    recording was not transcribed live.
+    """
+    generation = await redis.get(_generation_key(audio_uuid))
+    if generation is None:
+        return "", 0
+
+    segments = await redis.hgetall(_segments_key(audio_uuid, int(generation)))
+    text, covered = "", 0
+    for seq in range(len(segments)):
+        segment = segments.get(str(seq).encode())
+        if segment is None:
+            break
+        segment = json.loads(segment)
+        text += segment["text"]
+        covered = segment["end"]
+
+    return text, covered
@@ -0,0 +1,6 @@
+import asyncio
+
+from httpx import AsyncClient
+
+client: AsyncClient | None = None
+semaphore: asyncio.Semaphore | None = None
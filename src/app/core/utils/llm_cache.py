@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import time
+
+from . import cache
+from ..config import settings
+
+KEY_PREFIX = "llm_cache"
+LRU_KEY = f"{KEY_PREFIX}:lru"
+STATS_KEY = f"{KEY_PREFIX}:stats"
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(*parts: str) -> str:
+    """Content address of an LLM call: a SHA-256 over everything that determines its
+    answer.
+
+    Callers pass the model name, the system prompt version and the prompt inputs.
+    """
+    digest = hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+    return f"{KEY_PREFIX}:{digest}"
+
+
+async def get(key: str) -> str | None:
+    """Look up a cached LLM answer and count the hit or miss.
+
+    A hit refreshes the entry's TTL and its position in the LRU index. Errors talking to
+    Redis are treated as a miss so the cache can never fail an edit.
+    """
+    if cache.client is None or not settings.LLM_CACHE_ENABLED:
+        return None
+
+    try:
+        value = await cache.client.get(key)
+        async with cache.client.pipeline(transaction=False) as pipe:
+            pipe.hincrby(STATS_KEY, "hits" if value is not None else "misses", 1)
+            if value is not None:
+                pipe.expire(key, settings.LLM_CACHE_TTL)
+                pipe.zadd(LRU_KEY, {key: time.time()})
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"LLM cache error: {e}")
+        return None
+
+    return value.decode() if value is not None else None
+
+
+async def set(key: str, value: str) -> None:
+    """Store an LLM answer for `LLM_CACHE_TTL` seconds.
+
+    Entries are tracked in a sorted set by last access; once it holds more than
+    `LLM_CACHE_MAX_ENTRIES` keys the least recently used ones are evicted, and entries
+    that already expired are dropped from the index.
+    """
+    if cache.client is None or not settings.LLM_CACHE_ENABLED:
+        return
+
+    try:
+        now = time.time()
+        async with cache.client.pipeline(transaction=False) as pipe:
+            pipe.set(key, value, ex=settings.LLM_CACHE_TTL)
+            pipe.zadd(LRU_KEY, {key: now})
+            pipe.zremrangebyscore(LRU_KEY, "-inf", now - settings.LLM_CACHE_TTL)
+            pipe.zcard(LRU_KEY)
+            *_, size = await pipe.execute()
+
+        if size > settings.LLM_CACHE_MAX_ENTRIES:
+            evicted = await cache.client.zpopmin(
+                LRU_KEY, size - settings.LLM_CACHE_MAX_ENTRIES
+            )
+            if evicted:
+                await cache.client.delete(*(evicted_key for evicted_key, _ in evicted))
+                await cache.client.hincrby(STATS_KEY, "evictions", len(evicted))
+    except Exception as e:
+        logger.warning(f"LLM cache error: {e}")
+
+
+async def stats() -> dict[str, int]:
+    if cache.client is None:
+        return {}
+
+    counters = await cache.client.hgetall(STATS_KEY)
+    entries = await cache.client.zcard(LRU_KEY)
+    return {
+        "hits": int(counters.get(b"hits", 0)),
+        "misses": int(counters.get(b"misses", 0)),
+        "evictions": int(counters.get(b"evictions", 0)),
+        "entries": entries,
+    }
@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ChatSession:
+    messages: list[dict[str, str]]
+    last_reply: str
+    last_used: float = field(default_factory=time.monotonic)
+
+    @property
+    def size(self) -> int:
+        return sum(len(message["content"]) for message in self.messages)
+
+
+class SessionStore:
+    """Per-session chat histories kept by a worker so consecutive dictations extend one
+    conversation.
+
+    Ollama keeps the KV cache of the last prompt it evaluated, so resending an unchanged
+    history as the prompt prefix means a follow-up edit only pays for its new tokens. A
+    history is only reused while the report the client sends is the reply the session
+    ended with; any manual edit starts a new conversation.
+
+    Parameters
+    ----------
+    idle_timeout: float
+        Seconds after which an unused session is dropped.
+    max_sessions: int
+        Number of sessions kept; the least recently used one is dropped beyond it.
+    max_chars: int
+        Size cap of a single history. Beyond it the conversation restarts from the last
+        exchange, asked as an opening turn that carries the report it edits.
+    """
+
+    def __init__(self, idle_timeout: float, max_sessions: int, max_chars: int) -> None:
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+
+    def _evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_timeout
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used > deadline:
+                break
+            self._sessions.pop(session_id)
+
+    def history(
+        self, session_id: str, prev_diagnosis: str
+    ) -> list[dict[str, str]] | None:
+        """Return the conversation to continue for `session_id`, or None if the report
+        no longer matches it.
+        """
+        self._evict_idle()
+        session = self._sessions.get(session_id)
+        if session is None or session.last_reply.strip() != prev_diagnosis.strip():
+            return None
+
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return list(session.messages)
+
+    def update(
+        self,
+        session_id: str,
+        messages: list[dict[str, str]],
+        reply: str,
+        opening: dict[str, str],
+    ) -> None:
+        """Store the conversation that produced `reply`.
+
+        `opening` is the last user turn written as the first of a conversation, with the
+        report it edits: follow-up turns only refer to the previous answer, so it
+        replaces them once older turns are dropped.
+        """
+        session = ChatSession(
+            messages=[*messages, {"role": "assistant", "content": reply}],
+            last_reply=reply,
+        )
+        if session.size > self.max_chars and len(session.messages) > 3:
+            session.messages = [session.messages[0], opening, session.messages[-1]]
+
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+store: SessionStore | None = None
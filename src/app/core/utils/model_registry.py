@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import psutil
+from pywhispercpp.constants import AVAILABLE_MODELS, MODELS_DIR
+from redis.asyncio import Redis
+
+from .audio import SAMPLE_RATE
+from .whisper_pool import ModelPool, ModelSelector
+
+logger = logging.getLogger(__name__)
+
+# download sizes of the ggml weights published with whisper.cpp, used until a model is
+# on disk
+NOMINAL_SIZES_MB = {
+    "tiny": {"": 75, "q5_1": 31, "q8_0": 42},
+    "base": {"": 142, "q5_1": 57, "q8_0": 78},
+    "small": {"": 466, "q5_1": 181, "q8_0": 252},
+    "medium": {"": 1500, "q5_0": 514, "q8_0": 785},
+    "large": {"": 2900, "q5_0": 1080, "q8_0": 1660},
+    "large-v3-turbo": {"": 1500, "q5_0": 547, "q8_0": 834},
+}
+
+_MODEL_NAME = re.compile(
+    r"^(?P<family>[a-z]+(?:-v3-turbo)?)(?:-v\d)?(?:\.en)?(?:-(?P<quantization>q\d_\d))?$"
+)
+
+
+@dataclass
+class ModelVariant:
+    name: str
+    family: str
+    quantization: str  # "" for full precision
+    path: Path
+    size_bytes: int  # on disk when downloaded, nominal otherwise
+
+    @property
+    def downloaded(self) -> bool:
+        return self.path.exists()
+
+
+def model_variant(name: str, models_dir: str | None = None) -> ModelVariant:
+    match = _MODEL_NAME.match(name)
+    if name not in AVAILABLE_MODELS or match is None:
+        raise ValueError(
+            f"Unknown whisper model {name!r}, available: {', '.join(AVAILABLE_MODELS)}"
+        )
+
+    family, quantization = match["family"], match["quantization"] or ""
+    path = Path(models_dir or MODELS_DIR) / f"ggml-{name}.bin"
+    if path.exists():
+        size_bytes = path.stat().st_size
+    else:
+        size_bytes = (
+            NOMINAL_SIZES_MB[family].get(quantization, NOMINAL_SIZES_MB[family][""])
+            * 1024
+            * 1024
+        )
+    return ModelVariant(name, family, quantization, path, size_bytes)
+
+
+def catalog(models_dir: str | None = None) -> list[ModelVariant]:
+    """Every whisper.cpp model pywhispercpp can load, full precision and quantized
+    (q5/q8), with their sizes.
+    """
+    return [model_variant(name, models_dir) for name in AVAILABLE_MODELS]
+
+
+def warm_up_audio(duration: float = 3.0, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Realistic dummy audio for warming up whisper: a 440 Hz sine wave (A4 note) with
+    noise, in [-1, 1].
+    """
+    t = np.linspace(0, duration, int(sample_rate * duration), False)
+    dummy_audio = np.sin(2 * np.pi * 440 * t)
+    # Add some noise to make it more realistic
+    dummy_audio += 0.5 * np.random.randn(len(dummy_audio))
+    return (dummy_audio / np.abs(dummy_audio).max()).astype(np.float32)
+
+
+class ModelRegistry:
+    """Load whisper models into the selector within a resident memory budget.
+
+    Every model gets a pool of `pool_size` instances, each holding its own copy of the
+    weights, so a model is only loaded when its size on disk times the pool size still
+    fits in `budget_bytes` next to the models already loaded (0 disables the budget).
+    After loading, the pool is warmed up, which also seeds the selector's real-time
+    factor, and the growth of the process RSS is recorded as the model's resident
+    memory.
+
+    Parameters
+    ----------
+    selector: ModelSelector
+        Receives the pools of the loaded models.
+    factory: Callable[[str, int], ModelPool]
+        Creates the pool of a model from its name and the number of instances.
+    pool_size: int
+        Instances per model.
+    budget_bytes: int
+        Resident memory all loaded models may take together.
+    models_dir: str | None
+        Where the ggml files are, pywhispercpp's default directory when None.
+    """
+
+    def __init__(
+        self,
+        selector: ModelSelector,
+        factory: Callable[[str, int], ModelPool],
+        pool_size: int,
+        budget_bytes: int,
+        models_dir: str | None = None,
+    ) -> None:
+        self.selector = selector
+        self.factory = factory
+        self.pool_size = pool_size
+        self.budget_bytes = budget_bytes
+        self.models_dir = models_dir
+        self.resident_bytes: dict[str, int] = {}
+        self._lock = asyncio.Lock()
+
+    def fits(self, name: str) -> bool:
+        if not self.budget_bytes:
+            return True
+        needed = model_variant(name, self.models_dir).size_bytes * self.pool_size
+        return sum(self.resident_bytes.values()) + needed <= self.budget_bytes
+
+    def load(self, name: str) -> bool:
+        """Load and warm up a model unless it is already loaded or does not fit the
+        budget.
+        """
+        if name in self.selector.pools:
+            return True
+        if not self.fits(name):
+            logger.warning(
+                f"Not loading whisper {name}: it does not fit the "
+                f"{self.budget_bytes >> 20} MB budget"
+            )
+            return False
+
+        process = psutil.Process(os.getpid())
+        rss_before = process.memory_info().rss
+        pool = self.factory(name, self.pool_size)
+
+        samples = warm_up_audio()
+        started = time.monotonic()
+        pool.warm_up(samples)
+        rtf = (time.monotonic() - started) / pool.size / (len(samples) / SAMPLE_RATE)
+
+        self.resident_bytes[name] = max(0, process.memory_info().rss - rss_before)
+        self.selector.add(name, pool, rtf)
+        logger.info(
+            f"Loaded whisper {name} x{pool.size}: "
+            f"{self.resident_bytes[name] >> 20} MB resident, RTF {rtf:.3f}"
+        )
+        return True
+
+    def next_to_load(self) -> str | None:
+        """The fastest configured model not loaded yet that would fit the budget."""
+        for name in self.selector.order:
+            if name not in self.selector.pools and self.fits(name):
+                return name
+        return None
+
+    async def ensure(self, name: str) -> bool:
+        """Make sure a model is loaded, loading it in a thread on first use; False if it
+        cannot be.
+        """
+        if name in self.selector.pools:
+            return True
+        async with self._lock:
+            return await asyncio.to_thread(self.load, name)
+
+    def memory_report(self) -> dict[str, dict]:
+        """Resident memory and instances per loaded model, plus the process total."""
+        report = {
+            name: {
+                "resident_bytes": resident,
+                "instances": self.selector.pools[name].size,
+                "quantization": model_variant(name, self.models_dir).quantization
+                or "f16",
+            }
+            for name, resident in self.resident_bytes.items()
+        }
+        report["process"] = {
+            "resident_bytes": psutil.Process(os.getpid()).memory_info().rss
+        }
+        return report
+
+
+MEMORY_REPORT_KEY = "whisper:memory"
+
+
+async def publish_memory_report(
+    redis: Redis, worker_id: str, report: dict[str, dict]
+) -> None:
+    """Share a worker's memory report so the API can show it; reports of workers gone
+    for a day disappear.
+    """
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(MEMORY_REPORT_KEY, worker_id, json.dumps(report))
+        pipe.expire(MEMORY_REPORT_KEY, 86400)
+        await pipe.execute()
+
+
+async def memory_reports(redis: Redis) -> dict[str, dict]:
+    reports = await redis.hgetall(MEMORY_REPORT_KEY)
+    return {
+        worker_id.decode(): json.loads(report) for worker_id, report in reports.items()
+    }
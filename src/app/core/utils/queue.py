@@ -1,3 +1,50 @@
+import asyncio
+from typing import Any
+
+import msgpack
 from arq.connections import ArqRedis
 
 pool: ArqRedis | None = None
+
+# arq pickles jobs and results by default; msgpack is smaller and faster. The API and
+# the workers must agree on it.
+
+_EXCEPTION = 1
+
+
+class JobError(Exception):
+    """The exception a job failed with, as read back from its result; `type` is the
+    original exception's class.
+    """
+
+    def __init__(self, type: str, message: str) -> None:
+        self.type = type
+        super().__init__(message)
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseException):
+        return msgpack.ExtType(
+            _EXCEPTION, msgpack.packb([type(obj).__name__, str(obj)])
+        )
+    raise TypeError(f"Cannot serialize {type(obj).__name__} in a job")
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == _EXCEPTION:
+        name, message = msgpack.unpackb(data)
+        # arq reports aborted jobs by their CancelledError result
+        return (
+            asyncio.CancelledError(message)
+            if name == "CancelledError"
+            else JobError(name, message)
+        )
+    return msgpack.ExtType(code, data)
+
+
+def job_serializer(obj: Any) -> bytes:
+    return msgpack.packb(obj, default=_default)
+
+
+def job_deserializer(data: bytes) -> Any:
+    return msgpack.unpackb(data, ext_hook=_ext_hook, strict_map_key=False)
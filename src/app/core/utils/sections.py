@@ -0,0 +1,219 @@
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+
+from ..config import settings
+
+# blank lines separate the paragraphs of a report; the separator is kept so a patched
+# report keeps its layout
+_SECTION_BREAK = re.compile(r"(\n[ \t]*\n\s*)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"[a-z][a-z\-]*")
+
+# verbs that end the subject of a findings sentence ("Liver is ...", "Both kidneys
+# appear ...")
+_SUBJECT_END = {
+    "is",
+    "are",
+    "appear",
+    "appears",
+    "exhibit",
+    "exhibits",
+    "show",
+    "shows",
+    "seen",
+    "noted",
+    "detected",
+    "do",
+    "does",
+    "measures",
+    "measure",
+}
+_STOPWORDS = {
+    "a",
+    "all",
+    "an",
+    "and",
+    "any",
+    "as",
+    "at",
+    "both",
+    "bilateral",
+    "bilaterally",
+    "in",
+    "including",
+    "it",
+    "its",
+    "left",
+    "major",
+    "no",
+    "of",
+    "or",
+    "other",
+    "parts",
+    "right",
+    "the",
+    "visualised",
+    "visualized",
+    "with",
+}
+# dictation spellings that differ from the wording used by the templates
+_SYNONYMS = {
+    "gallbladder": "gall bladder",
+    "gb": "gall bladder",
+    "hepatic": "liver",
+    "renal": "kidney",
+    "nephric": "kidney",
+    "splenic": "spleen",
+    "pancreatic": "pancreas",
+    "prostatic": "prostate",
+    "ureteric": "ureter",
+    "gastric": "stomach",
+    "cardiac": "cardiac heart",
+    "heart": "cardiac heart",
+    "lungs": "lung",
+    "pulmonary": "lung",
+    "intestine": "bowel",
+    "intestinal": "bowel",
+    "appendicular": "appendix",
+    "vertebral": "vertebra",
+    "vertebrae": "vertebra",
+    "disc": "disk",
+    "discs": "disk",
+}
+
+
+@dataclass
+class Section:
+    text: str
+    separator: str = ""
+
+
+def _normalize(word: str) -> str:
+    word = word.strip("-")
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _terms(text: str) -> list[str]:
+    words = []
+    for word in _WORD.findall(text.lower()):
+        words.extend(_SYNONYMS.get(word, word).split())
+    return [_normalize(word) for word in words if word not in _STOPWORDS]
+
+
+def section_subject(text: str) -> list[str]:
+    """Terms naming what a findings paragraph is about, e.g. `['gall', 'bladder']` for
+    "Gall Bladder is ...".
+
+    The subject is the run of words before the first verb of the paragraph, without
+    articles and laterality words.
+    """
+    subject = []
+    for word in _WORD.findall(text.lower()):
+        if word in _SUBJECT_END:
+            break
+        subject.append(word)
+
+    return _terms(" ".join(subject))
+
+
+def split_sections(report: str) -> list[Section]:
+    """Split a report into its paragraph sections.
+
+    Templates hard-wrap long sentences with blank lines, so a paragraph that does not
+    end a sentence, or a following one that starts in lower case, is merged back into
+    one section. `join_sections` reverses the split exactly.
+    """
+    parts = _SECTION_BREAK.split(report)
+    sections: list[Section] = []
+    for text, separator in zip(parts[0::2], parts[1::2] + [""]):
+        if sections and sections[-1].text.strip():
+            previous = sections[-1]
+            if not previous.text.rstrip().endswith((".", "!", "?", ":")) or (
+                text[:1].islower()
+            ):
+                sections[-1] = Section(
+                    previous.text + previous.separator + text, separator
+                )
+                continue
+
+        sections.append(Section(text, separator))
+
+    return sections
+
+
+def join_sections(sections: list[Section]) -> str:
+    return "".join(section.text + section.separator for section in sections)
+
+
+@lru_cache
+def organ_index() -> Counter:
+    """Document frequency of the subject terms of every section in the common findings
+    templates.
+
+    Only these terms are treated as organ keywords when routing dictation to report
+    sections.
+    """
+    with open(settings.COMMON_TEMPLATE_PATH) as f:
+        templates = json.load(f)
+
+    index: Counter = Counter()
+    for organs in templates.values():
+        for template in organs.values():
+            if not isinstance(template, str):
+                continue
+            for section in split_sections(template):
+                index.update(set(section_subject(section.text)))
+
+    return index
+
+
+def plan_patch(sections: list[Section], dictation: str) -> dict[int, str] | None:
+    """Work out which sections a dictation touches.
+
+    Every sentence of the dictation is routed to the sections whose subject best matches
+    its organ keywords, with keywords weighted by their rarity across the templates. A
+    sentence without any organ keyword follows the sentence before it.
+
+    Returns
+    -------
+    dict[int, str] | None
+        The touched section indices mapped to the part of the dictation that concerns
+        them, or None when some part of the dictation cannot be placed and the whole
+        report has to be edited.
+    """
+    index = organ_index()
+    subjects = [
+        {term for term in section_subject(section.text) if term in index}
+        for section in sections
+    ]
+
+    plan: dict[int, list[str]] = {}
+    targets: list[int] = []
+    for sentence in _SENTENCE_END.split(dictation.strip()):
+        if not sentence.strip():
+            continue
+
+        keywords = {term for term in _terms(sentence) if term in index}
+        scores = [
+            sum(1 / index[term] for term in subject & keywords) for subject in subjects
+        ]
+        best = max(scores, default=0)
+        if best:
+            targets = [i for i, score in enumerate(scores) if score == best]
+        elif not targets:
+            return None
+
+        for i in targets:
+            plan.setdefault(i, []).append(sentence.strip())
+
+    if not plan:
+        return None
+
+    return {i: " ".join(sentences) for i, sentences in sorted(plan.items())}
@@ -0,0 +1,81 @@
+import asyncio
+
+from arq.connections import ArqRedis
+from arq.jobs import Job, JobStatus
+from redis.asyncio import Redis
+
+from . import fairness
+from .events import job_channel, publish
+from .queue import JobError
+from ..config import settings
+from ..exceptions.worker_exceptions import JobSupersededError
+from ..ws_connection_manager import send_to_subscribers
+
+# When a radiologist dictates again before the previous edit returned, the previous
+# job's result is of no use. Jobs are enqueued under a supersede key (the report
+# session); a new job on the key aborts the older one through arq, and jobs also check
+# between their whisper and LLM stages, since arq only cancels jobs when the worker has
+# a free slot.
+
+
+def _latest_key(key: str) -> str:
+    return f"supersede:{key}"
+
+
+async def supersede(pool: ArqRedis, key: str, job_id: str, queue_name: str) -> None:
+    """Make `job_id` the latest job on `key` and abort the job it replaces, whether
+    queued or running.
+
+    Call it before enqueueing the new job, so that the job can never find its
+    predecessor still registered as the latest. Its subscribers get a final `job_done`
+    event with the status `superseded`: arq aborts a job that has not started without
+    running it, so the worker would never send one.
+    """
+    previous = await pool.set(
+        _latest_key(key), job_id, ex=settings.SUPERSEDE_TTL, get=True
+    )
+    if previous is not None and previous.decode() != job_id:
+        previous_id = previous.decode()
+        job = Job(
+            previous_id,
+            pool,
+            _queue_name=queue_name,
+            _deserializer=pool.job_deserializer,
+        )
+        if await job.status() == JobStatus.complete:
+            return
+        try:
+            # don't wait for the worker to cancel it
+            await job.abort(timeout=0, poll_delay=0)
+        except (asyncio.TimeoutError, JobError):
+            # the abort is still pending, or the job already failed
+            pass
+        # arq aborts a job that has not started without calling after_job_end, free its
+        # slot if it was dispatched
+        await fairness.release(pool, previous_id)
+
+        event = {
+            "event_type": "job_done",
+            "job_id": previous_id,
+            "status": "superseded",
+            "error": "Aborted, a newer job replaced it.",
+        }
+        await publish(pool, job_channel(previous_id), event)
+        await send_to_subscribers(pool, previous_id, event, last=True)
+
+
+async def is_superseded(redis: Redis, key: str | None, job_id: str) -> bool:
+    if key is None:
+        return False
+    latest = await redis.get(_latest_key(key))
+    return latest is not None and latest.decode() != job_id
+
+
+async def raise_if_superseded(redis: Redis, key: str | None, job_id: str) -> None:
+    """Stop a job before its next stage if a newer job was enqueued on its key
+    meanwhile.
+    """
+    if await is_superseded(redis, key, job_id):
+        raise JobSupersededError(
+            f"Job {job_id} was superseded by a newer job on {key}."
+        )
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Any
+
+from redis.asyncio import Redis
+
+from . import audio_store
+from ..config import settings
+
+# delete the lock only if we still hold it, it may have expired and been taken by
+# another job
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def _transcripts_key(audio_uuid: str) -> str:
+    return f"transcript:{audio_uuid}"
+
+
+def _lock_key(audio_uuid: str, version: str) -> str:
+    return f"transcript:{audio_uuid}:{version}:lock"
+
+
+async def recording_version(audio_file: str) -> tuple[str, str]:
+    """The recording's `audio_uuid` and a version of its content, from the audio store
+    it is kept in.
+    """
+    return Path(audio_file).stem, await audio_store.store.version(audio_file)
+
+
+async def get_or_transcribe(
+    redis: Redis,
+    audio_file: str,
+    transcribe: Callable[[], Awaitable[dict[str, Any]]],
+    variant: str = "",
+) -> dict[str, Any]:
+    """Transcript of a recording, transcribing it only once for all the jobs that need
+    it.
+
+    `transcribe` returns the transcript as a JSON-serialisable dict, e.g. its text and
+    the whisper model used. Transcripts are stored per recording version, and per
+    `variant` (such as a pinned model) when one is given, for `TRANSCRIPT_TTL` seconds.
+    The first job to miss takes a lock and runs `transcribe`; jobs on the same version
+    meanwhile wait for its result instead of running whisper as well. If the transcript
+    does not show up within `TRANSCRIPT_LOCK_TIMEOUT` seconds, e.g. because the worker
+    holding the lock died, the waiting job transcribes the recording itself.
+    """
+    audio_uuid, version = await recording_version(audio_file)
+    if variant:
+        version = f"{version}:{variant}"
+    key = _transcripts_key(audio_uuid)
+    lock = _lock_key(audio_uuid, version)
+    token = uuid.uuid4().hex
+
+    deadline = time.monotonic() + settings.TRANSCRIPT_LOCK_TIMEOUT
+    while True:
+        transcript = await redis.hget(key, version)
+        if transcript is not None:
+            return json.loads(transcript)
+
+        if await redis.set(lock, token, nx=True, ex=settings.TRANSCRIPT_LOCK_TIMEOUT):
+            break
+        if time.monotonic() >= deadline:
+            return await transcribe()
+        await asyncio.sleep(settings.TRANSCRIPT_POLL_INTERVAL)
+
+    try:
+        transcript = await transcribe()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, version, json.dumps(transcript))
+            pipe.expire(key, settings.TRANSCRIPT_TTL)
+            await pipe.execute()
+        return transcript
+    finally:
+        await redis.eval(_RELEASE_LOCK, 1, lock, token)
+
+
+async def invalidate(redis: Redis, audio_uuid: str) -> None:
+    """Forget every transcript of a recording, e.g. after `reset_recording` started a
+    new take.
+    """
+    await redis.delete(_transcripts_key(audio_uuid))
@@ -0,0 +1,202 @@
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+from .audio import SAMPLE_RATE
+
+# frames quieter than this (int16 RMS, about -50 dBFS) are never speech, whatever the
+# noise floor
+MIN_SPEECH_RMS = 100.0
+
+
+def frame_rms(pcm: np.ndarray, frame_size: int) -> np.ndarray:
+    """RMS energy of consecutive `frame_size` sample frames; a trailing partial frame is
+    ignored.
+    """
+    n_frames = len(pcm) // frame_size
+    frames = (
+        pcm[: n_frames * frame_size].astype(np.float32).reshape(n_frames, frame_size)
+    )
+    return np.sqrt(np.mean(frames**2, axis=1))
+
+
+@dataclass
+class Utterance:
+    start: int  # absolute sample offset in the stream
+    end: int
+    pcm: np.ndarray
+
+
+class UtteranceSegmenter:
+    """Cut a streamed 16 kHz int16 PCM signal into utterances at pauses.
+
+    A frame is speech when its energy exceeds both `MIN_SPEECH_RMS` and `energy_ratio`
+    times the noise floor, the 10th percentile of the frame energies of the last
+    `noise_window_s` seconds (pauses between words keep it low while someone speaks). An
+    utterance ends after `min_silence_ms` of non-speech or when it reaches
+    `max_utterance_s`, and is only emitted if it holds at least `min_speech_ms` of
+    speech. `pad_ms` of audio is kept around the speech so word onsets and endings are
+    not clipped.
+    """
+
+    def __init__(
+        self,
+        frame_ms: int = 30,
+        min_silence_ms: int = 600,
+        min_speech_ms: int = 250,
+        max_utterance_s: float = 15.0,
+        pad_ms: int = 200,
+        energy_ratio: float = 3.0,
+        noise_window_s: float = 3.0,
+    ) -> None:
+        self.frame_size = SAMPLE_RATE * frame_ms // 1000
+        self.min_silence_frames = min_silence_ms // frame_ms
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_utterance_frames = int(max_utterance_s * 1000) // frame_ms
+        self.pad_frames = pad_ms // frame_ms
+        self.energy_ratio = energy_ratio
+
+        # seeded quiet so speech right at the start of a recording is not taken for the
+        # noise floor
+        self._energies: deque[float] = deque(
+            [MIN_SPEECH_RMS / energy_ratio] * 10,
+            maxlen=int(noise_window_s * 1000) // frame_ms,
+        )
+        self._pending = np.empty(0, dtype=np.int16)
+        self._offset = 0  # absolute sample offset of the next frame
+        self._preroll: deque[np.ndarray] = deque(maxlen=self.pad_frames)
+        self._frames: list[np.ndarray] = []
+        self._start = 0
+        self._speech_frames = 0
+        self._silence_run = 0
+
+    @property
+    def noise_floor(self) -> float:
+        return float(np.percentile(self._energies, 10))
+
+    def is_speech(self, rms: float) -> bool:
+        self._energies.append(rms)
+        return rms > max(MIN_SPEECH_RMS, self.noise_floor * self.energy_ratio)
+
+    def push(self, pcm: np.ndarray) -> list[Utterance]:
+        """Add decoded samples and return the utterances they complete."""
+        pcm = np.concatenate([self._pending, pcm])
+        n_frames = len(pcm) // self.frame_size
+        self._pending = pcm[n_frames * self.frame_size :]
+
+        utterances = []
+        for frame, rms in zip(
+            pcm[: n_frames * self.frame_size].reshape(n_frames, self.frame_size),
+            frame_rms(pcm, self.frame_size),
+        ):
+            speech = self.is_speech(float(rms))
+            if not self._frames:
+                if speech:
+                    self._start = self._offset - len(self._preroll) * self.frame_size
+                    self._frames = [*self._preroll, frame]
+                    self._speech_frames = 1
+                    self._silence_run = 0
+                else:
+                    self._preroll.append(frame)
+            else:
+                self._frames.append(frame)
+                if speech:
+                    self._speech_frames += 1
+                    self._silence_run = 0
+                else:
+                    self._silence_run += 1
+
+                if (
+                    self._silence_run >= self.min_silence_frames
+                    or len(self._frames) >= self.max_utterance_frames
+                ):
+                    utterance = self._finish()
+                    if utterance is not None:
+                        utterances.append(utterance)
+
+            self._offset += self.frame_size
+
+        return utterances
+
+    def flush(self) -> list[Utterance]:
+        """Close the utterance in progress at the end of the stream."""
+        utterance = self._finish() if self._frames else None
+        return [utterance] if utterance is not None else []
+
+    def _finish(self) -> Utterance | None:
+        # drop trailing silence beyond the padding
+        trailing = max(0, self._silence_run - self.pad_frames)
+        frames = self._frames[: len(self._frames) - trailing]
+        utterance = None
+        if self._speech_frames >= self.min_speech_frames:
+            utterance = Utterance(
+                start=self._start,
+                end=self._start + len(frames) * self.frame_size,
+                pcm=np.concatenate(frames),
+            )
+
+        self._preroll.clear()
+        self._frames = []
+        self._speech_frames = 0
+        self._silence_run = 0
+        return utterance
+
+
+def speech_regions(
+    samples: np.ndarray,
+    frame_ms: int = 30,
+    max_pause_ms: int = 1000,
+    min_speech_ms: int = 250,
+    pad_ms: int = 200,
+    energy_ratio: float = 3.0,
+) -> list[tuple[int, int]]:
+    """Sample ranges holding speech in a whole 16 kHz float32 recording.
+
+    Frames are classified like `UtteranceSegmenter` does, against the 10th percentile of
+    the recording's frame energies. Speech separated by pauses shorter than
+    `max_pause_ms` forms one region, regions with less than `min_speech_ms` of speech
+    are dropped and `pad_ms` is kept on both sides of the others.
+    """
+    frame_size = SAMPLE_RATE * frame_ms // 1000
+    # compare on the int16 scale of MIN_SPEECH_RMS
+    energies = frame_rms(samples, frame_size) * 32768.0
+    if not len(energies):
+        return []
+
+    threshold = max(MIN_SPEECH_RMS, float(np.percentile(energies, 10)) * energy_ratio)
+    speech_frames = np.flatnonzero(energies > threshold)
+    if not len(speech_frames):
+        return []
+
+    # split wherever the gap between two speech frames is a long pause
+    breaks = np.flatnonzero(np.diff(speech_frames) > max_pause_ms // frame_ms) + 1
+    pad = pad_ms // frame_ms
+    regions = []
+    for run in np.split(speech_frames, breaks):
+        if len(run) < max(1, min_speech_ms // frame_ms):
+            continue
+        start = max(0, int(run[0]) - pad) * frame_size
+        end = min(len(samples), (int(run[-1]) + 1 + pad) * frame_size)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+
+    return regions
+
+
+def trim_silence(samples: np.ndarray, max_pause_ms: int = 1000) -> np.ndarray:
+    """Drop leading and trailing silence and cut pauses longer than `max_pause_ms` from
+    a recording.
+
+    Returns an empty array when the recording holds no speech, and a view of `samples`
+    when there is a single speech region.
+    """
+    regions = speech_regions(samples, max_pause_ms=max_pause_ms)
+    if len(regions) == 1:
+        start, end = regions[0]
+        return samples[start:end]
+    return np.concatenate(
+        [samples[start:end] for start, end in regions] or [samples[:0]]
+    )
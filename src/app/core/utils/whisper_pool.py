@@ -0,0 +1,169 @@
+import asyncio
+import os
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from typing import Any
+
+import numpy as np
+
+from ..exceptions.worker_exceptions import ModelPoolTimeoutError
+
+
+def pool_layout(
+    max_jobs: int, pool_size: int = 0, n_threads: int = 0
+) -> tuple[int, int]:
+    """Number of whisper instances and whisper.cpp threads per instance for a worker
+    running `max_jobs` jobs.
+
+    Unset (0) values are derived from the CPU count: one instance per two cores, but
+    never more than the jobs that can run at once, and the cores are split evenly
+    between the instances so whisper never oversubscribes them.
+    """
+    cpus = os.cpu_count() or 1
+    pool_size = pool_size or max(1, min(max_jobs, cpus // 2))
+    n_threads = n_threads or max(1, cpus // pool_size)
+    return pool_size, n_threads
+
+
+class ModelPool:
+    """A fixed set of whisper model instances that jobs check out one at a time.
+
+    A whisper.cpp context is not safe to use from two threads at once, so every
+    transcription holds an instance for its duration; jobs that find all instances busy
+    wait up to `timeout` seconds for one to be checked back in.
+
+    Parameters
+    ----------
+    factory: Callable[[], Any]
+        Creates one loaded model, e.g. `lambda: Model("base.en", n_threads=4)`.
+    size: int
+        Number of instances to load.
+    timeout: float
+        Longest wait for a free instance before `ModelPoolTimeoutError` is raised.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int, timeout: float) -> None:
+        self.size = size
+        self.timeout = timeout
+        self._models = [factory() for _ in range(size)]
+        self._free: asyncio.Queue = asyncio.Queue()
+        for model in self._models:
+            self._free.put_nowait(model)
+
+    @property
+    def available(self) -> int:
+        return self._free.qsize()
+
+    def warm_up(self, samples: np.ndarray) -> None:
+        """Run every instance once so the first real jobs don't pay for the lazy
+        initialisation.
+        """
+        for model in self._models:
+            model.transcribe(samples)
+
+    @asynccontextmanager
+    async def checkout(self) -> AsyncIterator[Any]:
+        try:
+            model = await asyncio.wait_for(self._free.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ModelPoolTimeoutError(
+                f"No whisper model became free within {self.timeout}s "
+                f"({self.size} loaded)."
+            )
+
+        try:
+            yield model
+        finally:
+            self._free.put_nowait(model)
+
+
+class ModelSelector:
+    """Whisper pools of several model sizes, and the choice of which one transcribes a
+    job.
+
+    The selector tracks every model's real-time factor (seconds spent per second of
+    audio, including the wait for a free instance) as an exponential moving average,
+    seeded by the warm-up. A job gets the most accurate model expected to transcribe its
+    audio within the latency budget that is left after its queue wait; the budget
+    shrinks with the jobs waiting for a worker (`lanes.waiting_jobs`), so peaks fall
+    back to the faster models. At most `concurrency` transcriptions run at once across
+    all sizes, so mixing models never oversubscribes the cores.
+
+    Parameters
+    ----------
+    order: list[str]
+        The model names from the fastest to the most accurate model; pools are added as
+        models get loaded.
+    latency_budget: float
+        Seconds a job may spend waiting in the queue plus transcribing.
+    max_jobs: int
+        Jobs a worker runs at once, used to turn the queue depth into a backlog factor.
+    concurrency: int
+        Transcriptions allowed to run at once across all pools.
+    """
+
+    def __init__(
+        self,
+        order: list[str],
+        latency_budget: float,
+        max_jobs: int,
+        concurrency: int,
+        smoothing: float = 0.2,
+    ) -> None:
+        self.order = order
+        self.latency_budget = latency_budget
+        self.max_jobs = max_jobs
+        self.smoothing = smoothing
+        self.pools: dict[str, ModelPool] = {}
+        self.rtf: dict[str, float] = {}
+        self._slots = asyncio.Semaphore(concurrency)
+
+    @property
+    def names(self) -> list[str]:
+        """The loaded models, from the fastest to the most accurate."""
+        return [name for name in self.order if name in self.pools]
+
+    def add(self, name: str, pool: ModelPool, rtf: float) -> None:
+        self.pools[name] = pool
+        self.rtf[name] = rtf
+        if name not in self.order:
+            self.order.append(name)
+
+    def choose(
+        self,
+        audio_seconds: float,
+        queue_depth: int,
+        queue_wait: float,
+        pinned: str | None = None,
+    ) -> str:
+        if pinned in self.pools:
+            return pinned
+
+        budget = (self.latency_budget - queue_wait) / (1 + queue_depth / self.max_jobs)
+        for name in reversed(self.names):
+            if self.rtf.get(name, 0.0) * audio_seconds <= budget:
+                return name
+        return self.names[0]
+
+    def record(self, name: str, audio_seconds: float, elapsed: float) -> None:
+        if audio_seconds <= 0:
+            return
+        rtf = elapsed / audio_seconds
+        previous = self.rtf.get(name, rtf)
+        self.rtf[name] = previous + self.smoothing * (rtf - previous)
+
+    @asynccontextmanager
+    async def checkout(self, name: str) -> AsyncIterator[Any]:
+        pool = self.pools[name]
+        try:
+            await asyncio.wait_for(self._slots.acquire(), pool.timeout)
+        except asyncio.TimeoutError:
+            raise ModelPoolTimeoutError(
+                f"No transcription slot became free within {pool.timeout}s."
+            )
+
+        try:
+            async with pool.checkout() as model:
+                yield model
+        finally:
+            self._slots.release()
@@ -0,0 +1,6 @@
+import asyncio
+
+from .lanes import run
+
+# python -m src.app.core.worker: serve the interactive and bulk lanes from one process
+asyncio.run(run())
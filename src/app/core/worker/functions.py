@@ -1,19 +1,57 @@
 import asyncio
+import functools
+import inspect
 import logging
+import os
+import socket
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
 
 import httpx
 import numpy as np
-import requests
 import uvloop
 from arq.worker import Worker
 from pywhispercpp.model import Model
 
 from src.app.core.config import settings
+from src.app.core.setup import close_redis_cache_pool, create_redis_cache_pool
+from src.app.core.exceptions.worker_exceptions import (
+    DraftNotFoundError,
+    JobSupersededError,
+    ReportEditError,
+)
+from src.app.core.utils import (
+    archive,
+    audio,
+    audio_store,
+    drafts,
+    fairness,
+    llm,
+    llm_sessions,
+    supersede,
+    transcripts,
+)
+from src.app.core.utils.audio import SAMPLE_RATE, pcm16_to_float32
+from src.app.core.utils.events import job_channel, publish
+from src.app.core.utils.lanes import INTERACTIVE, record_wait, waiting_jobs
+from src.app.core.utils.lexicon import correct_text, radiology_lexicon
+from src.app.core.utils.vad import trim_silence
+from src.app.core.utils.model_registry import ModelRegistry, publish_memory_report
+from src.app.core.utils.whisper_pool import ModelPool, ModelSelector, pool_layout
+from src.app.core.utils.live_segments import (
+    is_current,
+    store_segment,
+    transcribed_prefix,
+)
 from src.app.core.utils.inference import (
     transcribe_audio_file,
-    ollama_llm,
+    edit_report,
     llm_impressions_cleanup,
 )
+from src.app.core.ws_connection_manager import send_to_recording, send_to_subscribers
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
@@ -22,51 +60,423 @@ logging.basicConfig(
 )
 
 
+# -------- llm client --------
+async def create_llm_client() -> None:
+    llm.client = httpx.AsyncClient(
+        headers={"Content-Type": "application/json"},
+        timeout=httpx.Timeout(
+            settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT
+        ),
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+    )
+    llm.semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+    radiology_lexicon()
+    llm_sessions.store = llm_sessions.SessionStore(
+        idle_timeout=settings.LLM_SESSION_IDLE_TIMEOUT,
+        max_sessions=settings.LLM_SESSION_MAX_SESSIONS,
+        max_chars=settings.LLM_SESSION_MAX_CHARS,
+    )
+
+
+async def close_llm_client() -> None:
+    if llm.client:
+        await llm.client.aclose()
+    llm.client = None
+    llm.semaphore = None
+    llm_sessions.store = None
+
+
 # -------- base functions --------
 async def startup(ctx: Worker) -> None:
     # ctx["db"] = await anext(async_get_db())  # to use db in async call
     logging.info("Worker Started")
 
+    await create_llm_client()
+    await create_redis_cache_pool()
+    audio.pcm_cache = audio.PcmCache(settings.AUDIO_PCM_CACHE_MB * 1024 * 1024)
+    audio_store.store = audio_store.create_store(ctx["redis"])
+    archive.backend = archive.create_backend()
+
     # initialize models as this is a separate worker process and doesnt share
     # the context of the core fastapi lifecycle
-    # Load the models
-    settings.MODELS["whisper"] = Model("base.en")
-
-    # --- Warm up the models
-
-    # whisper warm up
-    sample_rate = 16000  # Standard sample rate for Whisper
-    duration = 3.0  # Duration in seconds
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
-    # Create a sine wave at 440 Hz (A4 note)
-    dummy_audio = np.sin(2 * np.pi * 440 * t)
-    # Add some noise to make it more realistic
-    dummy_audio += 0.5 * np.random.randn(len(dummy_audio))
-    # Normalize to [-1, 1] range
-    dummy_audio = dummy_audio / np.abs(dummy_audio).max()
-    # Reshape to match expected format (batch_size, audio_length)
-    dummy_audio = dummy_audio.reshape(1, -1)
-    settings.MODELS["whisper"].transcribe(dummy_audio)
+    # Load the models: a pool of whisper instances per model size, splitting the cores
+    # between them
+    pool_size, n_threads = pool_layout(
+        settings.WORKER_MAX_JOBS, settings.WHISPER_POOL_SIZE, settings.WHISPER_THREADS
+    )
+    model_names = [
+        name.strip() for name in settings.WHISPER_MODELS.split(",") if name.strip()
+    ]
+    models_dir = settings.WHISPER_MODELS_DIR or None
+    whisper = ModelSelector(
+        model_names,
+        latency_budget=settings.WHISPER_LATENCY_BUDGET,
+        max_jobs=settings.WORKER_MAX_JOBS,
+        concurrency=pool_size,
+    )
+    registry = ModelRegistry(
+        whisper,
+        lambda name, size: ModelPool(
+            functools.partial(Model, name, models_dir=models_dir, n_threads=n_threads),
+            size=size,
+            timeout=settings.WHISPER_CHECKOUT_TIMEOUT,
+        ),
+        pool_size=pool_size,
+        budget_bytes=settings.WHISPER_MEMORY_BUDGET_MB * 1024 * 1024,
+        models_dir=models_dir,
+    )
+    settings.MODELS["whisper"] = whisper
+    settings.MODELS["whisper_registry"] = registry
+
+    # --- Load and warm up the models (the registry warms up every pool it loads)
+    logging.info(
+        f"{pool_size} instances per whisper model with {n_threads} threads each"
+    )
+    for name in model_names[:1] if settings.WHISPER_LAZY_LOADING else model_names:
+        registry.load(name)
+    if not whisper.pools:
+        raise RuntimeError(
+            "No whisper model fits "
+            f"WHISPER_MEMORY_BUDGET_MB={settings.WHISPER_MEMORY_BUDGET_MB}"
+        )
+    await _report_memory(ctx)
 
 
 async def shutdown(ctx: Worker) -> None:
     # await ctx["db"].close() # to use db in async call
     logging.info("Worker end")
+    await close_llm_client()
+    await close_redis_cache_pool()
+    audio.pcm_cache = None
     settings.MODELS.clear()
 
 
+async def on_job_start(ctx: Worker) -> None:
+    # queue wait per lane, for capacity planning (GET /tasks/lanes)
+    wait = (datetime.now(timezone.utc) - ctx["enqueue_time"]).total_seconds()
+    await record_wait(ctx["redis"], ctx.get("lane", INTERACTIVE), wait)
+
+
+async def after_job_end(ctx: Worker) -> None:
+    # free the user's in-flight slot and release the next job in round-robin order right
+    # away
+    if await fairness.release(ctx["redis"], ctx["job_id"]):
+        await fairness.dispatch(ctx["redis"], ctx.get("lane", INTERACTIVE))
+
+
+# --------- streaming ----------
+async def _publish_job_event(
+    ctx: Worker, event: dict[str, Any], last: bool = False
+) -> None:
+    # SSE clients listen on the job's channel, websocket clients that subscribed to the
+    # job get it routed to them
+    await publish(ctx["redis"], job_channel(ctx["job_id"]), event)
+    await send_to_subscribers(ctx["redis"], ctx["job_id"], event, last=last)
+
+
+def _token_publisher(
+    ctx: Worker, stream: bool
+) -> Callable[..., Awaitable[None]] | None:
+    if not stream:
+        return None
+
+    job_id = ctx["job_id"]
+
+    async def on_token(token: str, section: int | None = None) -> None:
+        event = {"event_type": "llm_token", "job_id": job_id, "token": token}
+        if section is not None:
+            event["section"] = section
+        await _publish_job_event(ctx, event)
+
+    return on_token
+
+
+async def _publish_done(ctx: Worker, stream: bool, text: str | None) -> None:
+    if stream:
+        await _publish_job_event(
+            ctx, {"event_type": "llm_done", "job_id": ctx["job_id"], "text": text}
+        )
+
+
+# --------- completion ----------
+def _notifies_completion(
+    func: Callable[..., Awaitable[Any]],
+) -> Callable[..., Awaitable[Any]]:
+    """Publish a `job_done` event with the job's result, or its error, when a chained
+    task finishes.
+
+    The event goes to the job's channel (SSE clients waiting for this job), to the
+    websocket clients subscribed to the job and to the client that recorded the audio,
+    so clients don't have to poll `/tasks/task/{id}`. A job a newer one replaced reports
+    the status `superseded`.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(ctx: Worker, *args, **kwargs) -> Any:
+        arguments = signature.bind(ctx, *args, **kwargs).arguments
+        audio_file = arguments["audio_file"]
+        event = {
+            "event_type": "job_done",
+            "job_id": ctx["job_id"],
+            "function": func.__name__,
+        }
+        try:
+            result = await func(ctx, *args, **kwargs)
+        except JobSupersededError as e:
+            event.update(status="superseded", error=str(e))
+            raise
+        except asyncio.CancelledError:
+            # aborted by a newer job; a worker shutting down cancels jobs too, but arq
+            # runs those again
+            if await supersede.is_superseded(
+                ctx["redis"], arguments.get("supersede_key"), ctx["job_id"]
+            ):
+                event.update(
+                    status="superseded", error="Aborted, a newer job replaced it."
+                )
+            raise
+        except Exception as e:
+            event.update(status="failed", error=str(e))
+            raise
+        else:
+            # a findings result references its draft version; clients get the text with
+            # the event
+            event.update(
+                status="complete",
+                result=(await drafts.with_texts(ctx["redis"], [result]))[0],
+            )
+            return result
+        finally:
+            if "status" in event:
+                await _publish_job_event(ctx, event, last=True)
+                await send_to_recording(ctx["redis"], Path(audio_file).stem, event)
+
+    return wrapper
+
+
+# --------- whisper ----------
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def _report_memory(ctx: Worker) -> None:
+    report = settings.MODELS["whisper_registry"].memory_report()
+    logging.info(f"whisper memory: {report}")
+    await publish_memory_report(ctx["redis"], _worker_id(), report)
+
+
+async def _load_model(ctx: Worker, name: str) -> bool:
+    if name in settings.MODELS["whisper"].pools:
+        return True
+
+    loaded = await settings.MODELS["whisper_registry"].ensure(name)
+    if loaded:
+        await _report_memory(ctx)
+    return loaded
+
+
+async def _whisper(
+    ctx: Worker, samples: np.ndarray, pinned: str | None = None
+) -> tuple[str, str]:
+    """Transcribe on the model the selector picks for this job, and feed the time it
+    took back.
+    """
+    whisper: ModelSelector = settings.MODELS["whisper"]
+    audio_seconds = len(samples) / SAMPLE_RATE
+    queue_wait = (datetime.now(timezone.utc) - ctx["enqueue_time"]).total_seconds()
+    # jobs no worker has started yet; running and fairness-parked jobs don't compete for
+    # this one's budget
+    queue_depth = await waiting_jobs(ctx["redis"])
+    if not queue_depth and (name := settings.MODELS["whisper_registry"].next_to_load()):
+        # the queue is idle: load the next lazily loaded model without holding up this
+        # job
+        task = asyncio.create_task(_load_model(ctx, name))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    model_name = whisper.choose(audio_seconds, queue_depth, queue_wait, pinned)
+    logging.info(
+        f"{ctx['job_id']}: {model_name} for {audio_seconds:.1f}s of audio "
+        f"(waited {queue_wait:.1f}s, {queue_depth} queued)"
+    )
+    started = time.monotonic()
+    text = await transcribe_audio_file(whisper, model_name, samples)
+    whisper.record(model_name, audio_seconds, time.monotonic() - started)
+    return text, model_name
+
+
+# --------- live transcription ----------
+async def transcribe_utterance(
+    ctx: Worker,
+    audio_uuid: str,
+    generation: int,
+    seq: int,
+    start: int,
+    end: int,
+    pcm: bytes,
+) -> str:
+    samples = pcm16_to_float32(np.frombuffer(pcm, dtype=np.int16))
+    text, _ = await _whisper(ctx, samples)
+
+    await store_segment(ctx["redis"], audio_uuid, generation, seq, start, end, text)
+    # after a reset the client shows a new take: the old take's text is stored, but not
+    # sent
+    if await is_current(ctx["redis"], audio_uuid, generation):
+        await send_to_recording(
+            ctx["redis"],
+            audio_uuid,
+            {
+                "event_type": "partial_transcript",
+                "audio_uuid": audio_uuid,
+                "generation": generation,
+                "seq": seq,
+                "text": text,
+            },
+        )
+    return text
+
+
+async def _run_whisper(
+    ctx: Worker, audio_file: str, pinned: str | None = None
+) -> dict[str, Any]:
+    # the recording is decoded once in memory and whisper gets the samples, not the webm
+    # file
+    samples = await audio_store.store.load(audio_file)
+
+    # utterances transcribed while recording leave only the tail of the audio for
+    # whisper
+    prefix_text, covered = await transcribed_prefix(ctx["redis"], Path(audio_file).stem)
+    speech = samples[covered:]
+    if settings.VAD_TRIM_ENABLED:
+        speech = trim_silence(speech, settings.VAD_MAX_PAUSE_MS)
+    if len(speech) < SAMPLE_RATE // 4:
+        # nothing (left) to transcribe, don't let whisper hallucinate on silence
+        return {"text": prefix_text, "whisper_model": None}
+
+    text, model_name = await _whisper(ctx, speech, pinned)
+    return {"text": prefix_text + text, "whisper_model": model_name}
+
+
+async def _transcribe_recording(
+    ctx: Worker, audio_file: str, pinned: str | None = None
+) -> dict[str, Any]:
+    # only the configured models can be pinned; a lazily loaded one is loaded for the
+    # job
+    if pinned not in settings.MODELS["whisper"].order or not await _load_model(
+        ctx, pinned
+    ):
+        pinned = None
+
+    # findings and impressions jobs on the same recording share one whisper run
+    return await transcripts.get_or_transcribe(
+        ctx["redis"],
+        audio_file,
+        functools.partial(_run_whisper, ctx, audio_file, pinned),
+        variant=pinned or "",
+    )
+
+
 # --------- chained tasks ----------
-async def transcribe_findings(ctx: Worker, req_body, audio_file) -> str:
-    audio_text = await transcribe_audio_file(settings.MODELS["whisper"], audio_file)
-    updated_text = await ollama_llm(
-        prev_diagnosis=req_body["curr_text"],
+@_notifies_completion
+async def transcribe_findings(
+    ctx: Worker,
+    req_body,
+    audio_file,
+    draft_id: str,
+    draft_version: int,
+    supersede_key: str | None = None,
+) -> dict[str, Any]:
+    curr_text = await drafts.load(ctx["redis"], draft_id, draft_version)
+    if curr_text is None:
+        raise DraftNotFoundError(
+            f"Version {draft_version} of draft {draft_id} expired."
+        )
+
+    stream = bool(req_body.get("stream", False))
+    transcript = await _transcribe_recording(
+        ctx, audio_file, req_body.get("whisper_model")
+    )
+    audio_text = transcript["text"]
+    if not audio_text.strip():
+        # nothing was dictated, the report stays as it is
+        await _publish_done(ctx, stream, curr_text)
+        return {
+            "draft_id": draft_id,
+            "draft_version": draft_version,
+            "whisper_model": None,
+        }
+
+    # no LLM call for an edit the radiologist already dictated again
+    await supersede.raise_if_superseded(ctx["redis"], supersede_key, ctx["job_id"])
+    updated_text = await edit_report(
+        prev_diagnosis=curr_text,
         user_prompt=audio_text,
+        on_token=_token_publisher(ctx, stream),
+        bypass_cache=bool(req_body.get("bypass_cache", False)),
+        session_id=req_body.get("session_id", req_body.get("audio_uuid")),
     )
-    print("updated_text", updated_text)
+    if updated_text is None:
+        # the LLM failed; the previous draft version stays the latest
+        raise ReportEditError()
+    await _publish_done(ctx, stream, updated_text)
+
+    version = await drafts.save(ctx["redis"], draft_id, updated_text)
+    return {
+        "draft_id": draft_id,
+        "draft_version": version,
+        "whisper_model": transcript["whisper_model"],
+    }
+
+
+@_notifies_completion
+async def transcribe_impressions(
+    ctx: Worker,
+    audio_file: str,
+    stream: bool = False,
+    bypass_cache: bool = False,
+    whisper_model: str | None = None,
+    supersede_key: str | None = None,
+) -> dict[str, Any]:
+    transcript = await _transcribe_recording(ctx, audio_file, whisper_model)
+    audio_text = transcript["text"]
+    if not audio_text.strip():
+        await _publish_done(ctx, stream, "")
+        return {"text": "", "whisper_model": None}
+
+    await supersede.raise_if_superseded(ctx["redis"], supersede_key, ctx["job_id"])
+    # most impressions only need spelling fixes, which the lexicon does without the LLM
+    corrected_text, confidence = correct_text(audio_text)
+    if settings.LLM_LEXICON_FAST_PATH and (
+        confidence >= settings.LLM_LEXICON_MIN_CONFIDENCE
+    ):
+        cleaned_text = corrected_text.strip()
+    else:
+        cleaned_text = await llm_impressions_cleanup(
+            corrected_text,
+            on_token=_token_publisher(ctx, stream),
+            bypass_cache=bypass_cache,
+        )
+    await _publish_done(ctx, stream, cleaned_text)
+
+    return {"text": cleaned_text, "whisper_model": transcript["whisper_model"]}
+
 
-    return updated_text
+# --------- archiving ----------
+async def archive_recording(ctx: Worker, staged: str) -> str:
+    """Archive a take staged by `reset_recording`, see core/utils/archive.py."""
+    location = await archive.archive(staged)
+    logging.info(f"{ctx['job_id']}: archived {Path(staged).name} to {location}")
+    return location
 
 
-async def transcribe_impressions(ctx: Worker, audio_file: str) -> str:
-    audio_text = await transcribe_audio_file(settings.MODELS["whisper"], audio_file)
-    return await llm_impressions_cleanup(audio_text)
+async def sweep_media(ctx: Worker) -> dict[str, int]:
+    """Cron: archive idle recordings and apply the archive's retention limits."""
+    return await archive.sweep(ctx["redis"])
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+
+from arq import create_pool
+from arq.connections import ArqRedis
+from arq.worker import Worker
+
+from .functions import shutdown, startup
+from .settings import WorkerSettings
+from ..config import settings
+from ..utils import fairness
+from ..utils.lanes import BULK, INTERACTIVE, LANES, lane_backlog
+
+
+def lane_capacity() -> dict[str, int]:
+    """Jobs reserved for each lane: `WORKER_BULK_JOBS` for bulk work, the rest of
+    `WORKER_MAX_JOBS` for edits.
+    """
+    bulk = min(settings.WORKER_BULK_JOBS, settings.WORKER_MAX_JOBS - 1)
+    return {INTERACTIVE: settings.WORKER_MAX_JOBS - bulk, BULK: bulk}
+
+
+def lane_limits(
+    reserved: dict[str, int], running: dict[str, int], queued: dict[str, int]
+) -> dict[str, int]:
+    """How many jobs each lane may run right now: its reserved capacity plus what idle
+    lanes leave unused.
+
+    A lane is idle when nothing waits in its queue; its reserved slots that no job of
+    its own occupies can then be borrowed by the other lanes. Borrowed slots are given
+    back as those jobs finish, as soon as the lane has work.
+    """
+    limits = {}
+    for lane in reserved:
+        spare = sum(
+            max(0, reserved[other] - running[other])
+            for other in reserved
+            if other != lane and not queued[other]
+        )
+        limits[lane] = reserved[lane] + spare
+    return limits
+
+
+async def balance(
+    redis: ArqRedis, workers: dict[str, Worker], reserved: dict[str, int]
+) -> None:
+    """Keep adjusting the lanes' job limits, which arq checks before it starts every
+    job, and releasing the jobs that wait for their turn in the per-user round-robin.
+
+    Redis errors only skip a tick, retried with a growing delay; the lanes keep their
+    last limits meanwhile.
+    """
+    delay = settings.LANE_BALANCE_INTERVAL
+    while True:
+        try:
+            for lane in workers:
+                await fairness.dispatch(redis, lane)
+
+            # running jobs and jobs still waiting for their user's turn don't count as
+            # queued
+            queued = await lane_backlog(redis)
+            running = {lane: worker.job_counter for lane, worker in workers.items()}
+            for lane, limit in lane_limits(reserved, running, queued).items():
+                workers[lane].max_jobs = limit
+            delay = settings.LANE_BALANCE_INTERVAL
+        except Exception as e:
+            delay = min(delay * 2, 30)
+            logging.warning(
+                f"Balancing the lanes failed, retrying in {delay:.1f}s: {e}"
+            )
+        await asyncio.sleep(delay)
+
+
+async def run() -> None:
+    """Run one arq worker per lane in this process, sharing the loaded models and the
+    capacity.
+    """
+    redis = await create_pool(
+        WorkerSettings.redis_settings,
+        job_serializer=WorkerSettings.job_serializer,
+        job_deserializer=WorkerSettings.job_deserializer,
+    )
+    ctx = {"redis": redis}
+    await startup(ctx)
+
+    reserved = lane_capacity()
+    total = sum(reserved.values())
+    workers = {
+        lane: Worker(
+            functions=WorkerSettings.functions,
+            queue_name=LANES[lane],
+            redis_settings=WorkerSettings.redis_settings,
+            # the semaphore arq sizes from max_jobs must fit a lane that borrows all the
+            # capacity
+            max_jobs=total,
+            ctx={"lane": lane},
+            on_job_start=WorkerSettings.on_job_start,
+            after_job_end=WorkerSettings.after_job_end,
+            allow_abort_jobs=WorkerSettings.allow_abort_jobs,
+            job_serializer=WorkerSettings.job_serializer,
+            job_deserializer=WorkerSettings.job_deserializer,
+            # housekeeping runs next to the backlog
+            cron_jobs=WorkerSettings.cron_jobs if lane == BULK else None,
+            handle_signals=False,
+        )
+        for lane in reserved
+    }
+    for lane, worker in workers.items():
+        worker.max_jobs = reserved[lane]
+    logging.info(f"Lanes: {reserved}")
+
+    try:
+        await asyncio.gather(
+            *(worker.main() for worker in workers.values()),
+            balance(redis, workers, reserved),
+        )
+    finally:
+        for worker in workers.values():
+            await worker.close()
+        await shutdown(ctx)
+        await redis.aclose()
@@ -1,15 +1,45 @@
+from arq import cron
 from arq.connections import RedisSettings
 
-from .functions import shutdown, startup, transcribe_findings, transcribe_impressions
+from .functions import (
+    after_job_end,
+    archive_recording,
+    on_job_start,
+    shutdown,
+    startup,
+    sweep_media,
+    transcribe_findings,
+    transcribe_impressions,
+    transcribe_utterance,
+)
 from ...core.config import settings
+from ...core.utils.queue import job_deserializer, job_serializer
 
 REDIS_QUEUE_HOST = settings.REDIS_QUEUE_HOST
 REDIS_QUEUE_PORT = settings.REDIS_QUEUE_PORT
 
 
 class WorkerSettings:
-    functions = [transcribe_findings, transcribe_impressions]
+    functions = [
+        transcribe_findings,
+        transcribe_impressions,
+        transcribe_utterance,
+        archive_recording,
+    ]
+    # archive idle recordings and apply retention limits, see utils/archive.py
+    cron_jobs = [
+        cron(
+            sweep_media, minute=set(range(0, 60, settings.MEDIA_SWEEP_INTERVAL_MINUTES))
+        )
+    ]
     redis_settings = RedisSettings(host=REDIS_QUEUE_HOST, port=REDIS_QUEUE_PORT)
     on_startup = startup
     on_shutdown = shutdown
+    on_job_start = on_job_start
+    after_job_end = after_job_end
+    # superseded jobs are aborted, see utils/supersede.py
+    allow_abort_jobs = True
+    job_serializer = job_serializer
+    job_deserializer = job_deserializer
+    max_jobs = settings.WORKER_MAX_JOBS
     handle_signals = False
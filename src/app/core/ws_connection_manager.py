@@ -1,28 +1,268 @@
+import asyncio
+import json
+import logging
+import os
+import socket
 import uuid
-from typing import Dict
+from typing import Any, Dict
+
 from fastapi import WebSocket
+from redis.asyncio import Redis
+
+from .config import settings
+from .utils import audio_store, queue
+from .utils.events import listen, publish
+
+logger = logging.getLogger(__name__)
+
+# delete a client's presence only if it still points to this node, the client may have
+# reconnected elsewhere
+_LEAVE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# route a message to the clients a key names, a recording's owner (string) or a job's
+# subscribers (set), each over the channel of the node holding its socket; clients
+# connected nowhere are skipped. ARGV[4] "1" drops the key in the same step, so a client
+# is either sent the final event or still finds itself subscribed afterwards
+_ROUTE = """
+local kind = redis.call("type", KEYS[1])["ok"]
+local clients = {}
+if kind == "string" then
+    clients = {redis.call("get", KEYS[1])}
+elseif kind == "set" then
+    clients = redis.call("smembers", KEYS[1])
+end
+local routed = 0
+for _, client_id in ipairs(clients) do
+    local node_id = redis.call("get", ARGV[1] .. client_id)
+    if node_id then
+        local routed_message = '{"client_id": ' .. cjson.encode(client_id)
+            .. ', "message": ' .. ARGV[3] .. '}'
+        redis.call("publish", ARGV[2] .. node_id, routed_message)
+        routed = routed + 1
+    end
+end
+if ARGV[4] == "1" then
+    redis.call("del", KEYS[1])
+end
+return routed
+"""
+
+
+def _presence_key(client_id: str) -> str:
+    return f"ws:presence:{client_id}"
+
+
+def _node_channel(node_id: str) -> str:
+    return f"ws:node:{node_id}"
+
+
+def recording_owner_key(audio_uuid: str) -> str:
+    return f"recording:{audio_uuid}:owner"
+
+
+def _subscribers_key(job_id: str) -> str:
+    return f"ws:job:{job_id}:subscribers"
+
+
+async def _route(
+    redis: Redis, key: str, message: dict[str, Any], last: bool = False
+) -> int:
+    return await redis.eval(
+        _ROUTE,
+        1,
+        key,
+        _presence_key(""),
+        _node_channel(""),
+        json.dumps(message),
+        int(last),
+    )
+
+
+async def send_to_recording(
+    redis: Redis, audio_uuid: str, message: dict[str, Any]
+) -> int:
+    """Send a JSON message to the client recording `audio_uuid`, on whichever node it is
+    connected.
 
-from src.app.core.config import settings
+    Workers call this, it needs no `ConnectionManager`; returns 0 if the client is not
+    connected anywhere.
+    """
+    return await _route(redis, recording_owner_key(audio_uuid), message)
+
+
+async def send_to_subscribers(
+    redis: Redis, job_id: str, message: dict[str, Any], last: bool = False
+) -> int:
+    """Send a JSON message to every client subscribed to `job_id`, see
+    `ConnectionManager.subscribe`.
+
+    `last` ends the subscriptions, for the job's final event. Returns the number of
+    clients reached.
+    """
+    return await _route(redis, _subscribers_key(job_id), message, last)
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str] = {}
+    """The websocket connections of this API process, registered in Redis so any process
+    can reach them.
+
+    Every connected `client_id` has a presence key naming the node (process) holding its
+    socket, refreshed while it stays connected. Workers push job results, LLM tokens and
+    partial transcripts to a client wherever it is connected (`send_to_recording`,
+    `send_to_subscribers`), over the owning node's pub/sub channel, which every node
+    listens on; a node needs one subscription for all its clients rather than one per
+    socket. A client that reconnects through another node takes its session over from
+    the old connection, which is closed. A client may also resume a recording it started
+    on an earlier connection, for `RECORDING_RESUME_TTL` seconds.
+    """
+
+    def __init__(self) -> None:
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.active_connections: Dict[str, WebSocket] = {}
         self.recording_files: Dict[str, str] = {}
+        self.audio_uuids: Dict[str, str] = {}
+        self._tasks: list[asyncio.Task] = []
 
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def start(self) -> None:
+        """Listen for messages routed to this node, keep its clients' presence alive."""
+        self._tasks = [
+            asyncio.create_task(self._receive()),
+            asyncio.create_task(self._heartbeat()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def connect(
+        self, websocket: WebSocket, client_id: str, resume: str | None = None
+    ) -> bool:
+        """Register the connection and give it a recording: `resume` if this client owns
+        it, a new one otherwise.
+
+        Returns whether the recording was resumed.
+        """
         await websocket.accept()
+        previous = self.active_connections.get(client_id)
         self.active_connections[client_id] = websocket
 
+        previous_node = await queue.pool.set(
+            _presence_key(client_id),
+            self.node_id,
+            ex=settings.WS_PRESENCE_TTL,
+            get=True,
+        )
+        if previous is not None:
+            await previous.close(code=1000, reason="Session moved")
+        elif previous_node is not None and previous_node.decode() != self.node_id:
+            await publish(
+                queue.pool,
+                _node_channel(previous_node.decode()),
+                {"client_id": client_id, "close": True},
+            )
+
+        resumed = resume is not None and await self._owns(client_id, resume)
         # Create UUID for this recording session
-        audio_uuid = str(uuid.uuid4())
+        audio_uuid = resume if resumed else str(uuid.uuid4())
+        self.audio_uuids[client_id] = audio_uuid
         self.recording_files[client_id] = f"{settings.MEDIA_DIR_PATH}/{audio_uuid}.webm"
+        await queue.pool.set(
+            recording_owner_key(audio_uuid), client_id, ex=settings.RECORDING_RESUME_TTL
+        )
 
         # Send UUID back to client immediately
-        await websocket.send_json({"event_type": "audio_uuid", "uuid": audio_uuid})
+        await websocket.send_json(
+            {"event_type": "audio_uuid", "uuid": audio_uuid, "resumed": resumed}
+        )
+        return resumed
+
+    async def _owns(self, client_id: str, audio_uuid: str) -> bool:
+        owner = await queue.pool.get(recording_owner_key(audio_uuid))
+        return (
+            owner is not None
+            and owner.decode() == client_id
+            and await audio_store.store.exists(
+                f"{settings.MEDIA_DIR_PATH}/{audio_uuid}.webm"
+            )
+        )
+
+    async def disconnect(self, client_id: str, websocket: WebSocket | None = None):
+        """Forget a client's connection, unless `websocket` was already replaced by a
+        newer connection.
+        """
+        if client_id not in self.active_connections:
+            return
+        if (
+            websocket is not None
+            and self.active_connections[client_id] is not websocket
+        ):
+            return
+
+        self.active_connections.pop(client_id)
+        self.recording_files.pop(client_id, None)
+        self.audio_uuids.pop(client_id, None)
+        await queue.pool.eval(_LEAVE, 1, _presence_key(client_id), self.node_id)
+
+    async def subscribe(self, client_id: str, job_id: str) -> None:
+        """Have the events workers send for `job_id` routed to a client, until the job's
+        final event.
+        """
+        key = _subscribers_key(job_id)
+        async with queue.pool.pipeline(transaction=False) as pipe:
+            pipe.sadd(key, client_id)
+            pipe.expire(key, settings.WS_SUBSCRIPTION_TTL)
+            await pipe.execute()
+
+    async def unsubscribe(self, client_id: str, job_id: str) -> bool:
+        """Stop routing a job's events to a client; False if the job's final event
+        already ended the subscription.
+        """
+        return bool(await queue.pool.srem(_subscribers_key(job_id), client_id))
+
+    async def _receive(self) -> None:
+        while True:
+            try:
+                async for routed in listen(queue.pool, _node_channel(self.node_id)):
+                    websocket = self.active_connections.get(routed["client_id"])
+                    if websocket is None:
+                        continue
+                    try:
+                        if routed.get("close"):
+                            await websocket.close(code=1000, reason="Session moved")
+                        else:
+                            await websocket.send_json(routed["message"])
+                    except Exception as e:
+                        logger.warning(
+                            f"Could not deliver to {routed['client_id']}: {e}"
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    f"Routing websocket messages to {self.node_id} failed, "
+                    f"resubscribing: {e}"
+                )
+                await asyncio.sleep(1)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(settings.WS_PRESENCE_TTL / 3)
+            if not self.active_connections:
+                continue
+            try:
+                async with queue.pool.pipeline(transaction=False) as pipe:
+                    for client_id in self.active_connections:
+                        pipe.expire(_presence_key(client_id), settings.WS_PRESENCE_TTL)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Refreshing websocket presence failed: {e}")
+
 
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            self.active_connections.pop(client_id)
-            if client_id in self.recording_files:
-                self.recording_files.pop(client_id)
+# one registry per process, shared by every websocket connection it serves
+manager = ConnectionManager()
@@ -1,6 +1,14 @@
 from fastcrud import FastCRUD
 
-from ..models.user import User, UserCreateInternal, UserUpdate, UserUpdateInternal
+from ..models.user import (
+    User,
+    UserCreateInternal,
+    UserRead,
+    UserUpdate,
+    UserUpdateInternal,
+)
 
-CRUDUser = FastCRUD[User, UserCreateInternal, UserUpdate, UserUpdateInternal, None]
+CRUDUser = FastCRUD[
+    User, UserCreateInternal, UserUpdate, UserUpdateInternal, None, UserRead
+]
 crud_users = CRUDUser(User)
@@ -1,5 +1,28 @@
-from sqlmodel import SQLModel
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlmodel import SQLModel, Field
 
 
 class Job(SQLModel):
     id: str
+
+
+class JobRead(SQLModel):
+    id: str
+    status: str = Field(
+        ..., schema_extra={"example": "complete"}
+    )  # deferred, queued, in_progress, complete or not_found
+    function: Optional[str] = Field(
+        None, schema_extra={"example": "transcribe_findings"}
+    )
+    success: Optional[bool] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    enqueue_time: Optional[datetime] = None
+    start_time: Optional[datetime] = None
+    finish_time: Optional[datetime] = None
+
+
+class JobBatchRead(SQLModel):
+    ids: list[str] = Field(..., min_length=1)
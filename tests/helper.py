@@ -1,5 +1,9 @@
+import pytest
+from arq.connections import ArqRedis
 from fastapi.testclient import TestClient
 
+from src.app.core.utils.queue import job_deserializer, job_serializer
+
 
 def _get_token(username: str, password: str, client: TestClient):
     return client.post(
@@ -7,3 +11,18 @@ def _get_token(username: str, password: str, client: TestClient):
         data={"username": username, "password": password},
         headers={"content-type": "application/x-www-form-urlencoded"},
     )
+
+
+def fake_queue_pool():
+    """An arq pool with the app's serializers on an in-memory Redis; skips the test
+    without fakeredis and lupa.
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return ArqRedis(
+        connection_pool=fakeredis.FakeAsyncRedis(
+            server=fakeredis.FakeServer()
+        ).connection_pool,
+        job_serializer=job_serializer,
+        job_deserializer=job_deserializer,
+    )
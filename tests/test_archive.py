@@ -0,0 +1,57 @@
+import asyncio
+import gzip
+import os
+import time
+
+from src.app.core.config import settings
+from src.app.core.utils import archive
+from src.app.core.utils.audio_spool import AudioSpool
+
+FRAME = b"\x1a\x45\xdf\xa3" * 100
+
+
+def test_reset_stages_the_take_and_archives_it(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "MEDIA_AWS_DIR_PATH", str(tmp_path / "archive"))
+    monkeypatch.setattr(settings, "ARCHIVE_COMPRESS", True)
+    monkeypatch.setattr(
+        archive, "backend", archive.LocalArchive(str(tmp_path / "archive"))
+    )
+    path = tmp_path / "abc.webm"
+
+    async def record() -> str:
+        async with AudioSpool(
+            str(path), flush_bytes=1 << 20, flush_interval=10, max_rate=0
+        ) as spool:
+            await spool.write(FRAME)
+            stage = archive.staged_path(str(path))
+            assert await spool.truncate(stage)
+            # an empty take is not staged
+            assert not await spool.truncate(archive.staged_path(str(path)))
+            await spool.write(FRAME[:4])
+        return await archive.archive(stage)
+
+    location = asyncio.run(record())
+
+    assert path.read_bytes() == FRAME[:4]
+    assert os.path.dirname(location) == str(tmp_path / "archive")
+    with gzip.open(location) as f:
+        assert f.read() == FRAME
+    assert sorted(os.listdir(tmp_path)) == ["abc.webm", "archive"]
+
+
+def test_retention_deletes_old_then_oldest_beyond_the_size_limit(tmp_path) -> None:
+    now = time.time()
+    for name, age in [
+        ("a.webm", 7200),
+        ("b.webm", 300),
+        ("c.webm", 200),
+        ("d.webm", 100),
+    ]:
+        (tmp_path / name).write_bytes(FRAME)
+        os.utime(tmp_path / name, (now - age, now - age))
+
+    local = archive.LocalArchive(str(tmp_path))
+    deleted = asyncio.run(local.sweep(max_age=3600, max_bytes=2 * len(FRAME)))
+
+    assert deleted == 2
+    assert sorted(os.listdir(tmp_path)) == ["c.webm", "d.webm"]
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+from src.app.core.utils.audio_spool import AudioSpool
+
+FRAME = b"\x1a\x45\xdf\xa3" * 100  # a 400-byte websocket frame
+
+
+def test_frames_are_coalesced_into_few_writes(tmp_path) -> None:
+    path = tmp_path / "rec.webm"
+
+    async def record() -> AudioSpool:
+        async with AudioSpool(
+            str(path), flush_bytes=16 * 1024, flush_interval=10, max_rate=0
+        ) as spool:
+            for _ in range(200):
+                await spool.write(FRAME)
+        return spool
+
+    spool = asyncio.run(record())
+
+    assert path.read_bytes() == FRAME * 200
+    # 80 KB in 16 KB writes instead of one write per frame
+    assert spool.frames == 200
+    assert spool.writes == 5
+
+
+def test_buffered_audio_reaches_the_file_after_the_interval(tmp_path) -> None:
+    path = tmp_path / "rec.webm"
+
+    async def record() -> None:
+        async with AudioSpool(
+            str(path), flush_bytes=1 << 20, flush_interval=0.05, max_rate=0
+        ) as spool:
+            await spool.write(FRAME)
+            assert path.read_bytes() == b""
+            await asyncio.sleep(0.1)
+            assert path.read_bytes() == FRAME
+
+    asyncio.run(record())
+
+
+def test_reset_drops_buffered_and_written_audio(tmp_path) -> None:
+    path = tmp_path / "rec.webm"
+
+    async def record() -> None:
+        async with AudioSpool(
+            str(path), flush_bytes=1000, flush_interval=10, max_rate=0
+        ) as spool:
+            for _ in range(5):
+                await spool.write(FRAME)
+            await spool.truncate()
+            await spool.write(b"new take")
+
+    asyncio.run(record())
+
+    assert path.read_bytes() == b"new take"
+
+
+def test_clients_sending_too_fast_are_held_back(tmp_path) -> None:
+    async def record() -> float:
+        started = time.monotonic()
+        async with AudioSpool(
+            str(tmp_path / "rec.webm"), flush_interval=10, max_rate=4000
+        ) as spool:
+            # a second's worth is allowed as a burst, the next 2000 bytes take half a
+            # second more
+            for _ in range(15):
+                await spool.write(FRAME)
+        return time.monotonic() - started
+
+    assert asyncio.run(record()) >= 0.45
+
+
+def test_numbered_chunks_skip_retransmits_and_refuse_gaps(tmp_path) -> None:
+    path = tmp_path / "rec.webm"
+    acks = []
+
+    async def ack(offset: int) -> None:
+        acks.append(offset)
+
+    async def record() -> None:
+        async with AudioSpool(
+            str(path), flush_bytes=4, max_rate=0, on_flush=ack
+        ) as spool:
+            assert await spool.write_at(0, b"abcd") == b"abcd"
+            # the client missed the ack and sends part of it again
+            assert await spool.write_at(2, b"cdef") == b"ef"
+            assert await spool.write_at(0, b"ab") == b""
+            # bytes 6-7 were lost
+            assert await spool.write_at(8, b"ij") is None
+            assert spool.offset == 6
+
+    asyncio.run(record())
+
+    assert path.read_bytes() == b"abcdef"
+    assert acks[0] == 4
+    assert acks[-1] == 6
+
+
+def test_resumed_recording_continues_the_file(tmp_path) -> None:
+    path = tmp_path / "rec.webm"
+    path.write_bytes(b"first connection")
+
+    async def record() -> None:
+        async with AudioSpool(str(path), max_rate=0, append=True) as spool:
+            assert spool.written == spool.offset == 16
+            assert await spool.write_at(16, b", second") == b", second"
+
+    asyncio.run(record())
+
+    assert path.read_bytes() == b"first connection, second"
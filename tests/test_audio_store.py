@@ -0,0 +1,94 @@
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+
+from src.app.core.config import settings
+from src.app.core.exceptions.audio_exceptions import RecordingTooLargeError
+from src.app.core.utils.audio_store import RedisAudioStore
+from tests.helper import fake_queue_pool
+
+PATH = "/media/abc.webm"
+
+
+def test_stream_appends_versions_and_truncates(tmp_path) -> None:
+    async def run() -> None:
+        store = RedisAudioStore(fake_queue_pool())
+        assert not await store.exists(PATH)
+        with pytest.raises(FileNotFoundError):
+            await store.version(PATH)
+
+        sink = await store.open(PATH)
+        await sink.write(b"first")
+        version = await store.version(PATH)
+        assert version.startswith("5:")
+
+        # a resumed connection continues where the recording ended
+        sink = await store.open(PATH, append=True)
+        assert await sink.size() == 5
+        await sink.write(b"second")
+        assert await store.version(PATH) != version
+
+        # a new recording under the same name starts over
+        await (await store.open(PATH)).write(b"new")
+        await store.take(PATH, str(tmp_path / "take.webm"))
+        assert (tmp_path / "take.webm").read_bytes() == b"new"
+        assert not await store.exists(PATH)
+
+        sink = await store.open(PATH)
+        await sink.write(b"take")
+        assert await sink.truncate("/media/abc.1.webm")
+        assert await sink.size() == 0
+        assert await store.exists("/media/abc.1.webm") and not await store.exists(PATH)
+        # nothing recorded since: nothing to stage
+        assert not await sink.truncate("/media/abc.2.webm")
+
+    asyncio.run(run())
+
+
+def test_stream_is_capped(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "AUDIO_STREAM_MAX_MB", 1)
+
+    async def run() -> int:
+        store = RedisAudioStore(fake_queue_pool())
+        sink = await store.open(PATH)
+        await sink.write(b"\x00" * (1 << 20))
+        with pytest.raises(RecordingTooLargeError):
+            await sink.write(b"\x00")
+        return await sink.size()
+
+    assert asyncio.run(run()) == 1 << 20
+
+
+@pytest.mark.skipif(shutil.which(settings.FFMPEG_PATH) is None, reason="needs ffmpeg")
+def test_load_decodes_the_chunks_in_pages(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "AUDIO_STREAM_READ_COUNT", 2)
+    recording = tmp_path / "tone.webm"
+    subprocess.run(
+        [
+            settings.FFMPEG_PATH,
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=frequency=440:duration=1",
+            "-c:a",
+            "libopus",
+            str(recording),
+        ],
+        check=True,
+    )
+    data = recording.read_bytes()
+
+    async def run():
+        store = RedisAudioStore(fake_queue_pool())
+        sink = await store.open(PATH)
+        for i in range(0, len(data), 1024):
+            await sink.write(data[i : i + 1024])
+        return await store.load(PATH)
+
+    samples = asyncio.run(run())
+
+    assert abs(len(samples) - 16000) < 1600
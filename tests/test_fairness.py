@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from src.app.core.config import settings
+from src.app.core.utils import fairness, supersede
+from src.app.core.utils.fairness import tier_weight
+from src.app.core.utils.lanes import INTERACTIVE, LANES
+from tests.helper import fake_queue_pool
+
+
+def test_tier_weights(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "FAIR_TIER_WEIGHTS", "free:1,paid:3")
+
+    assert tier_weight("paid") == 3
+    assert tier_weight("free") == 1
+    # users not in the database yet, or on a tier without a weight, get the smallest
+    # share
+    assert tier_weight(None) == 1
+    assert tier_weight("trial") == 1
+
+
+async def _submit(pool, user_id: str, jobs: int) -> None:
+    for i in range(jobs):
+        await fairness.enqueue_job(
+            pool,
+            "transcribe_impressions",
+            user_id=user_id,
+            tier="free",
+            lane=INTERACTIVE,
+            _job_id=f"{user_id}{i}",
+        )
+
+
+async def _ready(pool) -> set[str]:
+    """Jobs released to the workers: their score moved from the parking deferral."""
+    ready = await pool.zrangebyscore(
+        LANES[INTERACTIVE], "-inf", int(time.time() * 1000)
+    )
+    return {job_id.decode() for job_id in ready}
+
+
+async def _finish(pool, job_id: str) -> None:
+    # what a worker does when the job ends: arq drops it from the queue, after_job_end
+    # frees its slot
+    await pool.zrem(LANES[INTERACTIVE], job_id)
+    await fairness.release(pool, job_id)
+
+
+def test_users_take_turns(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "FAIR_MAX_IN_FLIGHT", 10)
+
+    async def run() -> list[str]:
+        pool = fake_queue_pool()
+        # nothing is released while the lane is full
+        monkeypatch.setattr(settings, "FAIR_DISPATCH_WINDOW", 0)
+        await _submit(pool, "a", 3)
+        await _submit(pool, "b", 3)
+        assert await _ready(pool) == set()
+
+        # one job at a time runs: a user who submitted first does not get all of theirs
+        # through before the other
+        monkeypatch.setattr(settings, "FAIR_DISPATCH_WINDOW", 1)
+        order = []
+        while await fairness.dispatch(pool, INTERACTIVE):
+            (job_id,) = await _ready(pool)
+            order.append(job_id)
+            await _finish(pool, job_id)
+        return order
+
+    assert asyncio.run(run()) == ["a0", "b0", "a1", "b1", "a2", "b2"]
+
+
+def test_in_flight_jobs_are_capped_per_user(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "FAIR_MAX_IN_FLIGHT", 2)
+    monkeypatch.setattr(settings, "FAIR_DISPATCH_WINDOW", 10)
+
+    async def run() -> None:
+        pool = fake_queue_pool()
+        await _submit(pool, "a", 5)
+        await _submit(pool, "b", 1)
+        # a backlog of one user does not keep another user's job waiting
+        assert await _ready(pool) == {"a0", "a1", "b0"}
+
+        await _finish(pool, "a0")
+        await fairness.dispatch(pool, INTERACTIVE)
+        assert await _ready(pool) == {"a1", "a2", "b0"}
+
+        # a finished job has no slot left to free
+        assert not await fairness.release(pool, "a0")
+
+    asyncio.run(run())
+
+
+def test_superseded_parked_job_takes_no_slot(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "FAIR_MAX_IN_FLIGHT", 1)
+
+    async def run() -> set[str]:
+        pool = fake_queue_pool()
+        monkeypatch.setattr(settings, "FAIR_DISPATCH_WINDOW", 0)
+        await _submit(pool, "a", 1)
+        # the radiologist dictates again while the first edit is still parked
+        await supersede.supersede(pool, "findings:s1", "a0", LANES[INTERACTIVE])
+        await supersede.supersede(pool, "findings:s1", "a1", LANES[INTERACTIVE])
+        await fairness.enqueue_job(
+            pool,
+            "transcribe_findings",
+            user_id="a",
+            tier="free",
+            lane=INTERACTIVE,
+            _job_id="a1",
+        )
+
+        monkeypatch.setattr(settings, "FAIR_DISPATCH_WINDOW", 10)
+        await fairness.dispatch(pool, INTERACTIVE)
+        assert not await fairness.release(pool, "a0")
+        return {
+            job_id.decode() for job_id in await pool.zrange("fair:in_flight:a", 0, -1)
+        }
+
+    assert asyncio.run(run()) == {"a1"}
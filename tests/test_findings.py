@@ -0,0 +1,38 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from src.app.core.exceptions.worker_exceptions import ReportEditError
+from src.app.core.utils import drafts
+from src.app.core.worker import functions
+from tests.helper import fake_queue_pool
+
+
+def test_failed_report_edit_keeps_the_previous_draft(monkeypatch) -> None:
+    async def transcribe_recording(ctx, audio_file, pinned=None) -> dict:
+        return {"text": "The liver is enlarged.", "whisper_model": "base.en"}
+
+    async def edit_report(**kwargs) -> None:
+        # what ollama_llm returns when Ollama is down
+        return None
+
+    monkeypatch.setattr(functions, "_transcribe_recording", transcribe_recording)
+    monkeypatch.setattr(functions, "edit_report", edit_report)
+
+    async def run() -> dict[int, str]:
+        pool = fake_queue_pool()
+        ctx = {
+            "redis": pool,
+            "job_id": "j1",
+            "enqueue_time": datetime.now(timezone.utc),
+        }
+        version = await drafts.save(pool, "s1", "Liver: normal.")
+
+        with pytest.raises(ReportEditError):
+            await functions.transcribe_findings(
+                ctx, {"audio_uuid": "abc"}, "media/abc.webm", "s1", version
+            )
+        return await drafts.history(pool, "s1")
+
+    assert asyncio.run(run()) == {1: "Liver: normal."}
@@ -0,0 +1,106 @@
+import asyncio
+import os
+
+from arq.constants import result_key_prefix
+from arq.jobs import serialize_result
+from starlette.requests import Request
+
+from src.app.api.v1 import tasks
+from src.app.core.utils import drafts, queue
+from src.app.core.utils.idempotency import IDEMPOTENCY_HEADER, request_key
+from tests.helper import fake_queue_pool
+
+
+def _key(*args: str | dict) -> str:
+    return asyncio.run(request_key(*args))
+
+
+def test_repeated_payload_maps_to_the_same_request(tmp_path) -> None:
+    audio_file = tmp_path / "abc.webm"
+    audio_file.write_bytes(b"\x1a" * 100)
+    body = {"audio_uuid": "abc", "curr_text": "No acute findings."}
+
+    key = _key("user_1", "transcribe_findings", body, str(audio_file))
+
+    assert key == _key(
+        "user_1", "transcribe_findings", dict(reversed(body.items())), str(audio_file)
+    )
+    assert key != _key("user_2", "transcribe_findings", body, str(audio_file))
+    assert key != _key(
+        "user_1", "transcribe_findings", {**body, "curr_text": ""}, str(audio_file)
+    )
+
+    # more audio was dictated on the same report text
+    with open(audio_file, "ab") as f:
+        f.write(b"\x1a" * 100)
+    os.utime(audio_file, ns=(0, 10**9))
+    assert key != _key("user_1", "transcribe_findings", body, str(audio_file))
+
+
+def test_client_key_wins_over_the_payload(tmp_path) -> None:
+    audio_file = str(tmp_path / "missing.webm")
+
+    first = _key(
+        "user_1", "transcribe_impressions", {"stream": False}, audio_file, "retry-1"
+    )
+    second = _key(
+        "user_1", "transcribe_impressions", {"stream": True}, audio_file, "retry-1"
+    )
+
+    assert first == second
+
+
+def test_retry_of_a_failed_job_runs_again(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+    request = Request(
+        {"type": "http", "headers": [(IDEMPOTENCY_HEADER.lower().encode(), b"retry-1")]}
+    )
+    audio_file = str(tmp_path / "abc.webm")
+
+    async def submit(text: str) -> str:
+        return await tasks._enqueue_once(
+            request,
+            ("user_1", "free"),
+            "transcribe_findings",
+            "findings:s1",
+            {},
+            audio_file,
+            {},
+            audio_file,
+            draft=("s1", text),
+        )
+
+    async def fail(job_id: str) -> None:
+        result = serialize_result(
+            "transcribe_findings",
+            (),
+            {},
+            1,
+            0,
+            False,
+            RuntimeError("LLM down"),
+            0,
+            0,
+            job_id,
+            "arq:queue",
+            job_id,
+            serializer=queue.job_serializer,
+        )
+        await queue.pool.set(result_key_prefix + job_id, result)
+
+    async def run() -> None:
+        first = await submit("No acute findings.")
+        # a duplicate gets the running job and does not add a draft version
+        assert await submit("No acute findings!") == first
+        assert await drafts.history(queue.pool, "s1") == {1: "No acute findings."}
+
+        await fail(first)
+        second = await submit("No acute findings!")
+        assert second != first
+        assert await submit("No acute findings?") == second
+        assert await drafts.history(queue.pool, "s1") == {
+            1: "No acute findings.",
+            2: "No acute findings!",
+        }
+
+    asyncio.run(run())
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.app.core.config import settings
+from src.app.core.utils import fairness
+from src.app.core.utils.lanes import BULK, INTERACTIVE, LANES, lane_stats, waiting_jobs
+from src.app.core.worker.lanes import balance, lane_limits
+from tests.helper import fake_queue_pool
+
+RESERVED = {"interactive": 6, "bulk": 2}
+
+
+def test_lanes_keep_their_reserved_capacity_when_both_are_busy() -> None:
+    limits = lane_limits(
+        RESERVED, {"interactive": 6, "bulk": 2}, {"interactive": 3, "bulk": 40}
+    )
+
+    assert limits == RESERVED
+
+
+def test_idle_lane_capacity_is_borrowed() -> None:
+    # live dictation is quiet: the backlog may use the free interactive slots
+    limits = lane_limits(
+        RESERVED, {"interactive": 1, "bulk": 2}, {"interactive": 0, "bulk": 40}
+    )
+    assert limits == {"interactive": 6, "bulk": 7}
+
+    # dictation picks up again: the bulk lane shrinks back to its own share
+    limits = lane_limits(
+        RESERVED, {"interactive": 1, "bulk": 7}, {"interactive": 2, "bulk": 40}
+    )
+    assert limits["bulk"] == 2
+
+
+def test_balancing_survives_a_redis_error(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "LANE_BALANCE_INTERVAL", 0.01)
+    workers = {lane: SimpleNamespace(job_counter=0, max_jobs=0) for lane in RESERVED}
+
+    async def run() -> None:
+        pool = fake_queue_pool()
+        dispatch = fairness.dispatch
+        calls = []
+
+        async def flaky_dispatch(redis, lane: str) -> int:
+            calls.append(lane)
+            if len(calls) == 1:
+                raise ConnectionError("Redis restarted")
+            return await dispatch(redis, lane)
+
+        monkeypatch.setattr(fairness, "dispatch", flaky_dispatch)
+        task = asyncio.create_task(balance(pool, workers, RESERVED))
+        await asyncio.sleep(0.2)
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(run())
+
+    # both lanes idle, each may borrow the other's slots
+    idle = {lane: 0 for lane in RESERVED}
+    assert {lane: worker.max_jobs for lane, worker in workers.items()} == lane_limits(
+        RESERVED, idle, idle
+    )
+
+
+def test_waiting_jobs_leave_out_running_and_parked_jobs() -> None:
+    async def run() -> int:
+        pool = fake_queue_pool()
+        await pool.enqueue_job("transcribe_findings", _job_id="running")
+        await pool.set("arq:in-progress:running", b"1")
+        await pool.enqueue_job("transcribe_findings", _job_id="parked", _defer_by=3600)
+        await pool.enqueue_job(
+            "transcribe_impressions", _job_id="queued", _queue_name=LANES[BULK]
+        )
+        return await waiting_jobs(pool)
+
+    assert asyncio.run(run()) == 1
+
+
+def test_running_jobs_leave_their_lane_idle(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "LANE_BALANCE_INTERVAL", 0.01)
+    workers = {
+        INTERACTIVE: SimpleNamespace(job_counter=1, max_jobs=RESERVED[INTERACTIVE]),
+        BULK: SimpleNamespace(job_counter=2, max_jobs=RESERVED[BULK]),
+    }
+
+    async def run() -> dict[str, dict[str, float]]:
+        pool = fake_queue_pool()
+        # arq keeps a running job in its queue until it finishes
+        await pool.enqueue_job("transcribe_findings", _job_id="running")
+        await pool.set("arq:in-progress:running", b"1")
+        for i in range(40):
+            await pool.enqueue_job(
+                "transcribe_impressions", _job_id=f"backlog{i}", _queue_name=LANES[BULK]
+            )
+
+        task = asyncio.create_task(balance(pool, workers, RESERVED))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        return await lane_stats(pool)
+
+    stats = asyncio.run(run())
+
+    # the interactive lane has nothing waiting, the backlog borrows its free slots
+    assert {lane: worker.max_jobs for lane, worker in workers.items()} == {
+        INTERACTIVE: 6,
+        BULK: 7,
+    }
+    assert stats[INTERACTIVE]["depth"] == 0
+    assert stats[INTERACTIVE]["oldest_wait"] == 0.0
+    assert stats[BULK]["depth"] == 40
@@ -0,0 +1,30 @@
+from collections import Counter
+
+from src.app.core.utils.lexicon import Lexicon, correct_text
+
+
+def test_lookup_finds_words_within_two_edits() -> None:
+    lexicon = Lexicon(Counter(["hydronephrosis", "hepatomegaly", "liver"]))
+
+    assert lexicon.lookup("hydronephrosys") == (["hydronephrosis"], 1)
+    assert lexicon.lookup("hepatomegli") == (["hepatomegaly"], 2)
+    assert lexicon.lookup("kidney") == ([], 3)
+
+
+def test_correct_text_fixes_single_edit_misrecognitions() -> None:
+    text, confidence = correct_text("Bilateral plural efusion. Fatty livr.")
+
+    assert text == "Bilateral pleural effusion. Fatty liver."
+    assert confidence >= 0.9
+
+
+def test_correct_text_keeps_known_text_untouched() -> None:
+    text = "Right sided hydronephrosis due to a 5 mm ureteric calculus."
+
+    assert correct_text(text) == (text, 1.0)
+
+
+def test_correct_text_has_low_confidence_on_unknown_words() -> None:
+    text, confidence = correct_text("The quick brown fox")
+
+    assert confidence < 0.9
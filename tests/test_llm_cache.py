@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.app.core.config import settings
+from src.app.core.utils import cache, llm_cache
+from tests.helper import fake_queue_pool
+
+
+def test_hits_and_misses_are_counted(monkeypatch) -> None:
+    monkeypatch.setattr(cache, "client", fake_queue_pool())
+    key = llm_cache.cache_key("model", "v1", "No acute findings.")
+
+    async def run() -> tuple[str | None, str | None, dict[str, int]]:
+        missed = await llm_cache.get(key)
+        await llm_cache.set(key, "Normal chest radiograph.")
+        hit = await llm_cache.get(key)
+        return missed, hit, await llm_cache.stats()
+
+    assert asyncio.run(run()) == (
+        None,
+        "Normal chest radiograph.",
+        {"hits": 1, "misses": 1, "evictions": 0, "entries": 1},
+    )
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch) -> None:
+    monkeypatch.setattr(cache, "client", fake_queue_pool())
+    monkeypatch.setattr(settings, "LLM_CACHE_MAX_ENTRIES", 2)
+    # a clock of its own, so every access is strictly later than the one before
+    clock = iter(range(1000, 1010))
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=lambda: next(clock)))
+    first, second, third = (
+        llm_cache.cache_key("model", "v1", text) for text in ("a", "b", "c")
+    )
+
+    async def run() -> tuple[list[str | None], dict[str, int]]:
+        await llm_cache.set(first, "A")
+        await llm_cache.set(second, "B")
+        # reading the first entry makes the second one the least recently used
+        await llm_cache.get(first)
+        await llm_cache.set(third, "C")
+        return [
+            await llm_cache.get(key) for key in (first, second, third)
+        ], await llm_cache.stats()
+
+    values, stats = asyncio.run(run())
+
+    assert values == ["A", None, "C"]
+    assert stats["evictions"] == 1 and stats["entries"] == 2
+
+
+def test_redis_errors_are_a_miss(monkeypatch) -> None:
+    class Broken:
+        async def get(self, key: str) -> None:
+            raise ConnectionError("Redis is down")
+
+    monkeypatch.setattr(cache, "client", Broken())
+
+    assert asyncio.run(llm_cache.get(llm_cache.cache_key("model", "v1", "a"))) is None
@@ -0,0 +1,76 @@
+import time
+from types import SimpleNamespace
+
+from src.app.core.utils import llm_sessions
+from src.app.core.utils.llm_sessions import SessionStore
+
+SYSTEM = {"role": "system", "content": "Edit the report."}
+
+
+def _opening(report: str, dictation: str) -> dict[str, str]:
+    return {
+        "role": "user",
+        "content": f"prev_diagnosis: {report} \n\n new_diagnosis: {dictation}",
+    }
+
+
+def _follow_up(dictation: str) -> dict[str, str]:
+    return {
+        "role": "user",
+        "content": "Your previous answer is the prev_diagnosis. "
+        f"new_diagnosis: {dictation}",
+    }
+
+
+def test_history_continues_only_from_the_last_reply() -> None:
+    store = SessionStore(idle_timeout=60, max_sessions=10, max_chars=10_000)
+    opening = _opening("No acute findings.", "add a small effusion")
+    store.update("s1", [SYSTEM, opening], "Small left effusion.", opening)
+
+    assert store.history("s1", " Small left effusion.\n") == [
+        SYSTEM,
+        opening,
+        {"role": "assistant", "content": "Small left effusion."},
+    ]
+    # the radiologist edited the report by hand, or it is another session
+    assert store.history("s1", "Small right effusion.") is None
+    assert store.history("s2", "Small left effusion.") is None
+
+
+def test_idle_and_least_recently_used_sessions_are_dropped(monkeypatch) -> None:
+    store = SessionStore(idle_timeout=50, max_sessions=1, max_chars=10_000)
+    opening = _opening("", "normal study")
+    store.update("s1", [SYSTEM, opening], "Normal study.", opening)
+    store.update("s2", [SYSTEM, opening], "Normal study.", opening)
+    now = time.monotonic()
+    clock = iter([now, now + 100])
+    monkeypatch.setattr(
+        llm_sessions, "time", SimpleNamespace(monotonic=lambda: next(clock))
+    )
+
+    assert len(store) == 1 and store.history("s1", "Normal study.") is None
+    # unused for longer than the idle timeout
+    assert store.history("s2", "Normal study.") is None
+    assert len(store) == 0
+
+
+def test_trimmed_history_keeps_the_report_it_edits() -> None:
+    store = SessionStore(idle_timeout=60, max_sessions=10, max_chars=150)
+    first = _opening("No acute findings.", "add a small effusion")
+    store.update("s1", [SYSTEM, first], "Small left effusion.", first)
+
+    second = _opening("Small left effusion.", "it is moderate")
+    store.update(
+        "s1",
+        [*store.history("s1", "Small left effusion."), _follow_up("it is moderate")],
+        "Moderate effusion.",
+        second,
+    )
+
+    # the follow-up turn referred to an answer no longer in the history, it is asked
+    # with its report instead
+    assert store.history("s1", "Moderate effusion.") == [
+        SYSTEM,
+        second,
+        {"role": "assistant", "content": "Moderate effusion."},
+    ]
@@ -0,0 +1,50 @@
+import numpy as np
+
+from src.app.core.utils.model_registry import ModelRegistry, model_variant
+from src.app.core.utils.whisper_pool import ModelPool, ModelSelector
+
+
+class _FakeModel:
+    def transcribe(self, media: np.ndarray) -> list:
+        return []
+
+
+def test_model_variant_parses_quantization(tmp_path) -> None:
+    (tmp_path / "ggml-base.en-q5_1.bin").write_bytes(b"\0" * 1000)
+
+    quantized = model_variant("base.en-q5_1", str(tmp_path))
+    full = model_variant("large-v3-turbo", str(tmp_path))
+
+    assert (quantized.family, quantized.quantization, quantized.size_bytes) == (
+        "base",
+        "q5_1",
+        1000,
+    )
+    assert quantized.downloaded
+    assert (full.family, full.quantization, full.downloaded) == (
+        "large-v3-turbo",
+        "",
+        False,
+    )
+    assert full.size_bytes == 1500 * 1024 * 1024
+
+
+def test_registry_loads_within_budget(tmp_path) -> None:
+    for name in ["tiny.en-q8_0", "small.en-q5_1"]:
+        (tmp_path / f"ggml-{name}.bin").write_bytes(b"\0" * 1000)
+    selector = ModelSelector(
+        ["tiny.en-q8_0", "small.en-q5_1"], latency_budget=8, max_jobs=2, concurrency=2
+    )
+    registry = ModelRegistry(
+        selector,
+        lambda name, size: ModelPool(_FakeModel, size=size, timeout=1),
+        pool_size=2,
+        budget_bytes=2500,
+        models_dir=str(tmp_path),
+    )
+
+    assert registry.load("tiny.en-q8_0")
+    registry.resident_bytes["tiny.en-q8_0"] = 1000
+    assert not registry.load("small.en-q5_1")
+    assert selector.names == ["tiny.en-q8_0"]
+    assert registry.next_to_load() is None
@@ -0,0 +1,32 @@
+import asyncio
+import pickle
+
+from src.app.core.exceptions.worker_exceptions import JobSupersededError
+from src.app.core.utils.queue import JobError, job_deserializer, job_serializer
+
+
+def test_job_payloads_round_trip_smaller_than_pickle() -> None:
+    job = {
+        "t": 1,
+        "f": "transcribe_findings",
+        "a": [{"audio_uuid": "abc"}, "media/abc.webm", "s1", 3],
+        "k": {},
+    }
+    job["a"].append(b"\x00\x01" * 8)
+
+    data = job_serializer(job)
+
+    assert job_deserializer(data) == job
+    assert len(data) < len(pickle.dumps(job))
+
+
+def test_job_errors_keep_their_type_and_message() -> None:
+    error = job_deserializer(job_serializer({"r": JobSupersededError("replaced")}))["r"]
+    assert isinstance(error, JobError)
+    assert (error.type, str(error)) == ("JobSupersededError", "replaced")
+
+    # arq recognises aborted jobs by their CancelledError result
+    assert isinstance(
+        job_deserializer(job_serializer({"r": asyncio.CancelledError()}))["r"],
+        asyncio.CancelledError,
+    )
@@ -0,0 +1,46 @@
+import json
+
+from src.app.core.config import settings
+from src.app.core.utils.sections import join_sections, plan_patch, split_sections
+
+
+def _template(modality: str, organ: str) -> str:
+    with open(settings.COMMON_TEMPLATE_PATH) as f:
+        return json.load(f)[modality][organ]
+
+
+def test_split_sections_round_trips_every_template() -> None:
+    with open(settings.COMMON_TEMPLATE_PATH) as f:
+        templates = json.load(f)
+
+    for organs in templates.values():
+        for template in organs.values():
+            assert join_sections(split_sections(template)) == template
+
+
+def test_split_sections_merges_hard_wrapped_paragraphs() -> None:
+    sections = split_sections(_template("ctscan", "whole abdomen (male)"))
+
+    assert sections[0].text.startswith("Liver is normal")
+    assert sections[0].text.endswith("No focal lesions noted.")
+    assert sections[1].text.startswith("Portal vein")
+
+
+def test_plan_patch_routes_sentences_to_organ_sections() -> None:
+    sections = split_sections(_template("ctscan", "whole abdomen (male)"))
+
+    plan = plan_patch(
+        sections,
+        "There is a 2 cm cyst in the liver. It is well defined. "
+        "Gallbladder shows calculi.",
+    )
+
+    assert plan is not None
+    assert [sections[i].text.split()[0] for i in plan] == ["Liver", "Gall"]
+    assert plan[0] == "There is a 2 cm cyst in the liver. It is well defined."
+
+
+def test_plan_patch_falls_back_when_dictation_names_no_organ() -> None:
+    sections = split_sections(_template("xray", "chest"))
+
+    assert plan_patch(sections, "Clinical correlation is advised.") is None
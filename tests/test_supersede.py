@@ -0,0 +1,21 @@
+import asyncio
+
+from src.app.core.utils import supersede
+from src.app.core.utils.lanes import INTERACTIVE, LANES
+from tests.helper import fake_queue_pool
+
+
+def test_new_job_aborts_the_one_it_supersedes() -> None:
+    async def run() -> list[bytes]:
+        pool = fake_queue_pool()
+        await pool.enqueue_job(
+            "transcribe_findings", {}, _job_id="first", _queue_name=LANES[INTERACTIVE]
+        )
+        await supersede.supersede(pool, "findings:s1", "first", LANES[INTERACTIVE])
+        await supersede.supersede(pool, "findings:s1", "second", LANES[INTERACTIVE])
+
+        assert await supersede.is_superseded(pool, "findings:s1", "first")
+        assert not await supersede.is_superseded(pool, "findings:s1", "second")
+        return await pool.zrange("arq:abort", 0, -1)
+
+    assert asyncio.run(run()) == [b"first"]
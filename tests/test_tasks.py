@@ -0,0 +1,235 @@
+import asyncio
+import json
+import time
+
+import pytest
+from arq.constants import result_key_prefix
+from arq.jobs import serialize_result
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from src.app.api.v1 import tasks
+from src.app.core.config import settings
+from src.app.core.utils import drafts, queue, supersede
+from src.app.core.utils.lanes import INTERACTIVE, LANES
+from src.app.models.job import JobBatchRead
+from tests.helper import fake_queue_pool
+
+
+async def _stream(task_id: str, limit: int = 10) -> list[str]:
+    messages = []
+    async for message in tasks._job_events(task_id):
+        messages.append(message)
+        if len(messages) == limit:
+            break
+    return messages
+
+
+def _event(message: str) -> dict:
+    return json.loads(message.split("data: ", 1)[1])
+
+
+async def _finish(job_id: str, success: bool, result) -> None:
+    # what arq does when a job ends: in one transaction it leaves its lane and stores
+    # its result, if it keeps one
+    now = int(time.time() * 1000)
+    async with queue.pool.pipeline(transaction=True) as tr:
+        tr.zrem(LANES[INTERACTIVE], job_id)
+        if result is not None:
+            tr.set(
+                result_key_prefix + job_id,
+                serialize_result(
+                    "transcribe_impressions",
+                    (),
+                    {},
+                    1,
+                    now,
+                    success,
+                    result,
+                    now,
+                    now,
+                    job_id,
+                    LANES[INTERACTIVE],
+                    job_id,
+                    serializer=queue.pool.job_serializer,
+                ),
+            )
+        await tr.execute()
+
+
+async def _wait_for(
+    job_id: str, result, success: bool = True
+) -> tuple[tasks.JobRead, float]:
+    await queue.pool.enqueue_job(
+        "transcribe_impressions", _job_id=job_id, _queue_name=LANES[INTERACTIVE]
+    )
+    start = time.monotonic()
+    waiting = asyncio.create_task(tasks.get_task(job_id, wait=5))
+    await asyncio.sleep(0.05)
+    assert not waiting.done()
+    await _finish(job_id, success, result)
+    return await waiting, time.monotonic() - start
+
+
+def test_waiting_for_a_task_returns_when_it_finishes(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+    monkeypatch.setattr(settings, "TASK_WAIT_POLL_DELAY", 0.01)
+
+    job, waited = asyncio.run(_wait_for("j1", {"text": "No acute findings."}))
+
+    assert waited < 1
+    assert (
+        job.status == "complete"
+        and job.success
+        and job.result == {"text": "No acute findings."}
+    )
+
+
+def test_waiting_for_a_failed_or_aborted_task_reports_it(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+    monkeypatch.setattr(settings, "TASK_WAIT_POLL_DELAY", 0.01)
+
+    async def run() -> tuple[tasks.JobRead, tasks.JobRead]:
+        failed, _ = await _wait_for(
+            "j1", ValueError("Recording not found"), success=False
+        )
+        aborted, _ = await _wait_for(
+            "j2",
+            asyncio.CancelledError("Aborted, a newer job replaced it."),
+            success=False,
+        )
+        return failed, aborted
+
+    failed, aborted = asyncio.run(run())
+
+    assert (failed.status, failed.success, failed.error) == (
+        "complete",
+        False,
+        "Recording not found",
+    )
+    assert (aborted.status, aborted.success, aborted.error) == (
+        "complete",
+        False,
+        "Aborted, a newer job replaced it.",
+    )
+
+
+def test_waiting_for_a_task_without_a_result(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+    monkeypatch.setattr(settings, "TASK_WAIT_POLL_DELAY", 0.01)
+
+    # the job ended without keeping a result, or its result already expired
+    job, waited = asyncio.run(_wait_for("j1", None))
+
+    assert waited < 1 and job.status == "not_found"
+
+
+def test_batch_answers_in_the_requested_order(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+
+    async def run() -> list[tasks.JobRead]:
+        for job_id in ("a", "b"):
+            await queue.pool.enqueue_job(
+                "transcribe_impressions", _job_id=job_id, _queue_name=LANES[INTERACTIVE]
+            )
+        await _finish("a", True, {"text": "Normal study."})
+        return await tasks.get_tasks(JobBatchRead(ids=["b", "missing", "a"]))
+
+    jobs = asyncio.run(run())
+
+    assert [(job.id, job.status) for job in jobs] == [
+        ("b", "queued"),
+        ("missing", "not_found"),
+        ("a", "complete"),
+    ]
+    assert jobs[2].result == {"text": "Normal study."}
+
+
+def test_batch_is_capped(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+    monkeypatch.setattr(settings, "TASK_BATCH_MAX_IDS", 2)
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(tasks.get_tasks(JobBatchRead(ids=["a", "b", "c"])))
+
+    assert e.value.status_code == 422
+
+
+def test_events_of_an_unknown_task_end_at_once(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+
+    (message,) = asyncio.run(_stream("missing"))
+
+    assert _event(message)["status"] == "not_found"
+
+
+def test_events_of_a_job_superseded_while_queued_end(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+    monkeypatch.setattr(settings, "SSE_KEEPALIVE_INTERVAL", 0.05)
+
+    async def run() -> list[str]:
+        await queue.pool.enqueue_job(
+            "transcribe_findings", {}, _job_id="first", _queue_name=LANES[INTERACTIVE]
+        )
+        await supersede.supersede(
+            queue.pool, "findings:s1", "first", LANES[INTERACTIVE]
+        )
+        stream = asyncio.create_task(_stream("first"))
+        await asyncio.sleep(0.12)
+        # no worker ever runs it, the new job's submit ends the stream
+        await supersede.supersede(
+            queue.pool, "findings:s1", "second", LANES[INTERACTIVE]
+        )
+        return await asyncio.wait_for(stream, 1)
+
+    *keepalives, done = asyncio.run(run())
+
+    assert keepalives and set(keepalives) == {": keepalive\n\n"}
+    assert _event(done) == {
+        "event_type": "job_done",
+        "job_id": "first",
+        "status": "superseded",
+        "error": "Aborted, a newer job replaced it.",
+    }
+
+
+def test_draft_history_is_the_callers_own(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+
+    async def run() -> dict[int, str]:
+        await drafts.save(
+            queue.pool, drafts.user_draft_id("user_1", "s1"), "No acute findings."
+        )
+        await drafts.save(
+            queue.pool,
+            drafts.user_draft_id("user_2", "s1"),
+            "Fracture of the left radius.",
+        )
+        return await tasks.get_draft_history("s1", owner=("user_2", "free"))
+
+    assert asyncio.run(run()) == {1: "Fracture of the left radius."}
+
+
+def test_users_sharing_a_session_id_dont_abort_each_other(
+    tmp_path, monkeypatch
+) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+    audio_file = str(tmp_path / "abc.webm")
+
+    async def submit(user_id: str) -> str:
+        return await tasks._enqueue_once(
+            Request({"type": "http", "headers": []}),
+            (user_id, "free"),
+            "transcribe_impressions",
+            "impressions:s1",
+            {"audio_uuid": "abc", "session_id": "s1"},
+            audio_file,
+            audio_file,
+        )
+
+    async def run() -> list[bytes]:
+        await submit("user_1")
+        await submit("user_2")
+        return await queue.pool.zrange("arq:abort", 0, -1)
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,44 @@
+import asyncio
+
+from src.app.core.config import settings
+from src.app.core.utils import audio_store, transcripts
+from tests.helper import fake_queue_pool
+
+
+def test_concurrent_jobs_transcribe_a_recording_once(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(audio_store, "store", audio_store.FileAudioStore())
+    monkeypatch.setattr(settings, "TRANSCRIPT_POLL_INTERVAL", 0.01)
+    audio_file = tmp_path / "abc.webm"
+    audio_file.write_bytes(b"take one")
+    calls = []
+
+    async def transcribe() -> dict:
+        calls.append(audio_file.read_bytes())
+        await asyncio.sleep(0.05)
+        return {"text": f"transcript {len(calls)}"}
+
+    async def run() -> tuple[list[dict], dict, dict]:
+        redis = fake_queue_pool()
+        # the findings and impressions jobs of the same recording
+        shared = await asyncio.gather(
+            *(
+                transcripts.get_or_transcribe(redis, str(audio_file), transcribe)
+                for _ in range(3)
+            )
+        )
+        # a pinned model is transcribed on its own
+        pinned = await transcripts.get_or_transcribe(
+            redis, str(audio_file), transcribe, variant="large"
+        )
+        # and so is a new take of the recording
+        audio_file.write_bytes(b"take two, longer")
+        retaken = await transcripts.get_or_transcribe(
+            redis, str(audio_file), transcribe
+        )
+        return shared, pinned, retaken
+
+    shared, pinned, retaken = asyncio.run(run())
+
+    assert shared == [{"text": "transcript 1"}] * 3
+    assert pinned == {"text": "transcript 2"} and retaken == {"text": "transcript 3"}
+    assert calls == [b"take one", b"take one", b"take two, longer"]
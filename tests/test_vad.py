@@ -0,0 +1,65 @@
+import numpy as np
+
+from src.app.core.utils.audio import SAMPLE_RATE
+from src.app.core.utils.vad import UtteranceSegmenter, speech_regions, trim_silence
+
+rng = np.random.default_rng(0)
+
+
+def _silence(seconds: float) -> np.ndarray:
+    return rng.normal(0, 20, int(seconds * SAMPLE_RATE)).astype(np.int16)
+
+
+def _speech(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    syllables = np.sin(2 * np.pi * 3 * t) > -0.3
+    return (3000 * np.sin(2 * np.pi * 220 * t) * syllables).astype(np.int16)
+
+
+def _segment(pcm: np.ndarray, segmenter: UtteranceSegmenter) -> list:
+    utterances = []
+    for i in range(0, len(pcm), 1000):
+        utterances.extend(segmenter.push(pcm[i : i + 1000]))
+    return utterances + segmenter.flush()
+
+
+def test_segmenter_cuts_utterances_at_pauses() -> None:
+    pcm = np.concatenate([_silence(1), _speech(2), _silence(1), _speech(1.5)])
+
+    utterances = _segment(pcm, UtteranceSegmenter())
+
+    assert len(utterances) == 2
+    first, second = utterances
+    assert 0.7 < first.start / SAMPLE_RATE < 1.0
+    assert 3.0 < first.end / SAMPLE_RATE < 3.4
+    assert 3.7 < second.start / SAMPLE_RATE < 4.0
+    assert all(len(u.pcm) == u.end - u.start for u in utterances)
+
+
+def test_segmenter_splits_long_utterances() -> None:
+    utterances = _segment(_speech(8), UtteranceSegmenter(max_utterance_s=3))
+
+    assert len(utterances) == 3
+    assert utterances[1].start == utterances[0].end
+
+
+def test_segmenter_ignores_silence() -> None:
+    assert _segment(_silence(3), UtteranceSegmenter()) == []
+
+
+def test_trim_silence_cuts_leading_trailing_and_long_pauses() -> None:
+    samples = (
+        np.concatenate([_silence(2), _speech(1), _silence(3), _speech(1), _silence(2)])
+        / 32768.0
+    )
+
+    regions = speech_regions(samples)
+    trimmed = trim_silence(samples)
+
+    assert len(regions) == 2
+    assert 1.7 < regions[0][0] / SAMPLE_RATE < 2.0
+    assert 1.8 < len(trimmed) / SAMPLE_RATE < 3.0
+
+
+def test_trim_silence_returns_nothing_without_speech() -> None:
+    assert len(trim_silence(_silence(3) / 32768.0)) == 0
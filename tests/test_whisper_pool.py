@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from src.app.core.exceptions.worker_exceptions import ModelPoolTimeoutError
+from src.app.core.utils.whisper_pool import ModelPool, ModelSelector, pool_layout
+
+
+def test_pool_layout_splits_cores_between_instances(monkeypatch) -> None:
+    monkeypatch.setattr("os.cpu_count", lambda: 16)
+
+    assert pool_layout(max_jobs=10) == (8, 2)
+    assert pool_layout(max_jobs=2) == (2, 8)
+    assert pool_layout(max_jobs=10, pool_size=4) == (4, 4)
+
+
+def test_pool_hands_out_each_instance_once() -> None:
+    async def run() -> None:
+        pool = ModelPool(object, size=2, timeout=0.05)
+        async with pool.checkout() as first, pool.checkout() as second:
+            assert first is not second
+            assert pool.available == 0
+            with pytest.raises(ModelPoolTimeoutError):
+                async with pool.checkout():
+                    pass
+        assert pool.available == 2
+
+    asyncio.run(run())
+
+
+def test_selector_falls_back_to_faster_models_under_load() -> None:
+    async def run() -> None:
+        selector = ModelSelector(
+            ["tiny.en", "base.en", "small.en"],
+            latency_budget=8,
+            max_jobs=4,
+            concurrency=1,
+        )
+        for name, rtf in [("small.en", 0.5), ("tiny.en", 0.05), ("base.en", 0.2)]:
+            selector.add(name, ModelPool(object, size=1, timeout=1), rtf)
+
+        assert selector.choose(10, queue_depth=0, queue_wait=0) == "small.en"
+        assert selector.choose(10, queue_depth=4, queue_wait=1) == "base.en"
+        assert selector.choose(10, queue_depth=40, queue_wait=7) == "tiny.en"
+        assert (
+            selector.choose(10, queue_depth=40, queue_wait=7, pinned="small.en")
+            == "small.en"
+        )
+
+    asyncio.run(run())
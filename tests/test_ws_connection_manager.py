@@ -0,0 +1,76 @@
+import asyncio
+
+from src.app.core.utils import queue
+from src.app.core.utils.events import subscription
+from src.app.core.ws_connection_manager import (
+    ConnectionManager,
+    recording_owner_key,
+    send_to_recording,
+    send_to_subscribers,
+)
+from tests.helper import fake_queue_pool
+
+
+def test_worker_pushes_reach_the_node_holding_the_client(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+    manager = ConnectionManager()
+
+    async def run() -> list[dict]:
+        pool = queue.pool
+        # client "a" is connected to this node, "b" to another one, "gone" nowhere
+        await pool.set("ws:presence:a", manager.node_id)
+        await pool.set("ws:presence:b", "other-node")
+        await pool.set(recording_owner_key("rec1"), "a")
+        for client_id in ("a", "b", "gone"):
+            await manager.subscribe(client_id, "job1")
+
+        async with subscription(pool, f"ws:node:{manager.node_id}") as events:
+            assert (
+                await send_to_recording(
+                    pool, "rec1", {"event_type": "partial_transcript", "text": "No"}
+                )
+                == 1
+            )
+            assert (
+                await send_to_subscribers(
+                    pool, "job1", {"event_type": "job_done"}, last=True
+                )
+                == 2
+            )
+            # the final event ended the subscriptions
+            assert (
+                await send_to_subscribers(pool, "job1", {"event_type": "job_done"}) == 0
+            )
+            assert (
+                await send_to_recording(pool, "rec2", {"event_type": "job_done"}) == 0
+            )
+            return [await anext(events), await anext(events)]
+
+    assert asyncio.run(run()) == [
+        {
+            "client_id": "a",
+            "message": {"event_type": "partial_transcript", "text": "No"},
+        },
+        {"client_id": "a", "message": {"event_type": "job_done"}},
+    ]
+
+
+def test_final_event_ends_the_subscription(monkeypatch) -> None:
+    monkeypatch.setattr(queue, "pool", fake_queue_pool())
+    manager = ConnectionManager()
+
+    async def run() -> None:
+        await manager.subscribe("a", "job1")
+        await send_to_subscribers(
+            queue.pool, "job1", {"event_type": "job_done"}, last=True
+        )
+        # the client got the final event routed, the late-subscriber check must not send
+        # it again
+        assert not await manager.unsubscribe("a", "job1")
+
+        # subscribed after the job ended: nothing is routed anymore, the caller sends
+        # the result itself
+        await manager.subscribe("a", "job1")
+        assert await manager.unsubscribe("a", "job1")
+
+    asyncio.run(run())